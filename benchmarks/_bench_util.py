@@ -0,0 +1,48 @@
+"""Shared helpers for the my_pickle benchmark scripts.
+
+The scripts in this directory are run directly, e.g.::
+
+    python benchmarks/bench_save_fast_path.py
+
+They always exercise the pure-Python implementation (my_pickle._Pickler and
+my_pickle._Unpickler), never the C accelerator.
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "white_box_tests"))
+sys.path.insert(0, os.path.join(ROOT, "black_box_test"))
+
+import my_pickle  # noqa: E402
+
+
+def load_corpus():
+    """Return the (name, object) pairs of the black-box stability corpus."""
+    import pickle_test_stable
+    pickle_test_stable.setup_dynamic_cases()
+    return list(pickle_test_stable.test_cases)
+
+
+def best_time(func, repeat=5, number=1):
+    """Return the best wall-clock time of *number* calls to func()."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def print_table(header, rows):
+    """Print rows as a left-aligned plain-text table."""
+    rows = [tuple(str(cell) for cell in row) for row in rows]
+    widths = [max(len(str(h)), *(len(r[i]) for r in rows))
+              for i, h in enumerate(header)]
+    fmt = "  ".join("{:<%d}" % w for w in widths)
+    print(fmt.format(*header))
+    print(fmt.format(*("-" * w for w in widths)))
+    for row in rows:
+        print(fmt.format(*row))
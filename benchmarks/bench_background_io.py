@@ -0,0 +1,68 @@
+"""Dump time to a slow sink and to a file, with and without background_io.
+
+The workload is a list of 20000 small records (a dict with an int, a str,
+a float and a short list each) and a 4 MB bytes object.  It is dumped with
+protocols 4 and 5 to a sink that sleeps 1 ms per 64 KB written, as a disk
+or a socket at about 64 MB/s would, and to a temporary file.  The sleep
+releases the GIL like a real write does, so with background_io the writes
+overlap the pickling of the next frames.  Both modes must write the same
+bytes.
+"""
+import io
+import os
+import tempfile
+import time
+
+from _bench_util import best_time, my_pickle, print_table
+
+SECONDS_PER_BYTE = 1e-3 / (64 * 1024)
+
+
+def make_object():
+    return [{"id": i, "name": "user%d" % i, "score": i / 7,
+             "tags": ["a", "b", i % 5]}
+            for i in range(20000)] + [os.urandom(4 << 20)]
+
+
+class SlowSink(io.BytesIO):
+    def write(self, data):
+        time.sleep(len(data) * SECONDS_PER_BYTE)
+        return super().write(data)
+
+
+def dump(file, obj, protocol, background):
+    my_pickle._Pickler(file, protocol, background_io=background).dump(obj)
+
+
+def main():
+    obj = make_object()
+    rows = []
+    with tempfile.TemporaryFile() as tmp:
+        for protocol in (4, 5):
+            outputs = []
+            for background in (False, True):
+                sink = SlowSink()
+                dump(sink, obj, protocol, background)
+                outputs.append(sink.getvalue())
+            if outputs[0] != outputs[1]:
+                raise AssertionError("protocol %d: background_io changes the "
+                                     "output" % protocol)
+            row = [protocol, len(outputs[0])]
+            for make_file in (SlowSink, None):
+                times = []
+                for background in (False, True):
+                    def run():
+                        f = tmp if make_file is None else make_file()
+                        f.seek(0)
+                        dump(f, obj, protocol, background)
+                    times.append(best_time(run, repeat=3))
+                row += ["%.0f" % (times[0] * 1e3), "%.0f" % (times[1] * 1e3),
+                        "%.2fx" % (times[0] / times[1])]
+            rows.append(row)
+    print("20000 records and 4 MB of bytes (milliseconds):")
+    print_table(("protocol", "bytes", "slow sink", "slow sink (bg)",
+                 "speedup", "file", "file (bg)", "speedup"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Throughput of pickling array.array with and without the buffer reducers.
+
+For arrays of doubles from 1 MiB up to MAX_MIB MiB (default 1024), with
+protocol 5, three ways:
+
+* generic:  the reducers are unregistered, so array.__reduce_ex__() copies
+  the items to a bytes object;
+* in-band:  the buffer reducer writes the items straight from the array;
+* out-of-band:  the items are handed to buffer_callback and the pickle only
+  holds the metadata.
+
+Dumps go to a file object that discards the data, loads read from an
+in-memory stream.  Results are in MiB/s.
+"""
+import io
+import sys
+from array import array
+
+from _bench_util import best_time, my_pickle, print_table
+
+MAX_MIB = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+
+
+class NullFile:
+    def write(self, data):
+        return len(data)
+
+
+def main():
+    rows = []
+    mib = 1
+    while mib <= MAX_MIB:
+        obj = array("d", bytes(mib << 20))
+        obj[-1] = 1.5
+        repeat = 5 if mib <= 64 else 2
+        row = ["%d MiB" % mib]
+        for mode in ("generic", "in-band", "out-of-band"):
+            buffers = []
+            callback = buffers.append if mode == "out-of-band" else None
+            saved = my_pickle._buffer_reducers.pop(array, None)
+            try:
+                if mode != "generic":
+                    my_pickle._buffer_reducers[array] = saved
+                data = my_pickle._dumps(obj, 5, buffer_callback=callback)
+                dump_time = best_time(
+                    lambda: my_pickle._dump(obj, NullFile(), 5,
+                                            buffer_callback=callback),
+                    repeat=repeat)
+            finally:
+                my_pickle._buffer_reducers[array] = saved
+            loaded = my_pickle._loads(data, buffers=buffers)
+            if loaded[-1] != obj[-1] or len(loaded) != len(obj):
+                raise AssertionError("%s array does not round-trip" % mode)
+            del loaded
+            load_time = best_time(
+                lambda: my_pickle._load(io.BytesIO(data), buffers=buffers),
+                repeat=repeat)
+            row.append("%.0f / %.0f" % (mib / dump_time, mib / load_time))
+            del data
+        rows.append(row)
+        mib *= 4
+    print("array('d') throughput with protocol 5, dump / load (MiB/s):")
+    print_table(("size", "generic", "in-band", "out-of-band"), rows)
+
+
+if __name__ == "__main__":
+    main()
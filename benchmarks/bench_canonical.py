@@ -0,0 +1,43 @@
+"""Cost of the canonical pickling mode for large sets.
+
+Sets of 10**5 and 10**6 ints, strings and 2-tuples are dumped with
+protocol 4, once normally and once with canonical=True.  Canonical output
+is checked to load back into an equal set.
+"""
+import io
+
+from _bench_util import best_time, my_pickle, print_table
+
+
+def dumps(obj, **kwargs):
+    f = io.BytesIO()
+    my_pickle._Pickler(f, 4, **kwargs).dump(obj)
+    return f.getvalue()
+
+
+def make_sets(n):
+    return [("int", set(range(n))),
+            ("str", {"item-%d" % i for i in range(n)}),
+            ("tuple", {(i % 1000, "k%d" % i) for i in range(n)})]
+
+
+def main():
+    rows = []
+    for n in (10 ** 5, 10 ** 6):
+        for name, obj in make_sets(n):
+            if my_pickle._loads(dumps(obj, canonical=True)) != obj:
+                raise AssertionError("canonical %s set does not round-trip"
+                                     % name)
+            repeat = 3 if n < 10 ** 6 else 1
+            plain = best_time(lambda: dumps(obj), repeat=repeat)
+            canonical = best_time(lambda: dumps(obj, canonical=True),
+                                  repeat=repeat)
+            rows.append(("%s x %d" % (name, n), "%.1f" % (plain * 1e3),
+                         "%.1f" % (canonical * 1e3),
+                         "%.2fx" % (canonical / plain)))
+    print("Set dumps, protocol 4 (milliseconds per dump):")
+    print_table(("case", "plain", "canonical", "slowdown"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Cost of checksum=True, and time to reject a corrupted pickle.
+
+The workload is a snapshot of about 20 MB: 10**5 small records and 16
+bytes payloads of 1 MiB.  It is dumped to a file with protocols 2 and 5,
+with and without checksums, and loaded back.  Then one byte near the end of
+the checksummed file is flipped: verify() rejects it after reading the
+file, and load() once it reaches the damaged frame (protocol 5) or not at
+all (protocol 2, whose trailer is only checked by verify()).
+"""
+import os
+import tempfile
+import time
+
+from _bench_util import best_time, my_pickle, print_table
+
+
+def make_snapshot():
+    return {"records": [{"id": i, "name": "user%d" % i, "score": i / 7}
+                        for i in range(10 ** 5)],
+            "blobs": [bytes([i]) * (1 << 20) for i in range(16)]}
+
+
+def dump(obj, path, protocol, checksum):
+    with open(path, "wb") as f:
+        my_pickle._Pickler(f, protocol, checksum=checksum).dump(obj)
+
+
+def load(path):
+    with open(path, "rb") as f:
+        return my_pickle._Unpickler(f).load()
+
+
+def verify(path):
+    with open(path, "rb") as f:
+        my_pickle.verify(f)
+
+
+def time_failure(func, path):
+    start = time.perf_counter()
+    try:
+        func(path)
+    except my_pickle.UnpicklingError:
+        return "%.0f (rejected)" % ((time.perf_counter() - start) * 1e3)
+    return "%.0f (not detected)" % ((time.perf_counter() - start) * 1e3)
+
+
+def main():
+    obj = make_snapshot()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot.pkl")
+        for protocol in (2, 5):
+            for checksum in (False, True):
+                dump(obj, path, protocol, checksum)
+                if load(path) != obj:
+                    raise AssertionError("protocol %d does not round-trip"
+                                         % protocol)
+                size = os.path.getsize(path)
+                dump_time = best_time(lambda: dump(obj, path, protocol,
+                                                   checksum), repeat=3)
+                load_time = best_time(lambda: load(path), repeat=3)
+                if checksum:
+                    verify_time = "%.0f" % (best_time(lambda: verify(path))
+                                            * 1e3)
+                    with open(path, "r+b") as f:
+                        f.seek(size - 100)
+                        byte = f.read(1)[0]
+                        f.seek(size - 100)
+                        f.write(bytes([byte ^ 1]))
+                    bad_verify = time_failure(verify, path)
+                    bad_load = time_failure(load, path)
+                else:
+                    verify_time = bad_verify = bad_load = "-"
+                rows.append((protocol, "on" if checksum else "off", size,
+                             "%.0f" % (dump_time * 1e3),
+                             "%.0f" % (load_time * 1e3), verify_time,
+                             bad_verify, bad_load))
+    print("Snapshot of %d records and %d MiB of bytes (milliseconds):"
+          % (len(obj["records"]), len(obj["blobs"])))
+    print_table(("protocol", "checksum", "bytes", "dump", "load", "verify",
+                 "verify (corrupted)", "load (corrupted)"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Size, save() calls and time of lists of records with compact_records.
+
+The workloads are lists of 10**5 dicts with the same five keys (an int id,
+a str name, a float score, a bool flag and a short list of tags) and of
+10**5 instances with the same attributes.  Each is dumped with protocol 4
+with and without compact_records; save() calls are counted through the
+specialized save loop, which is what dump() uses for these lists.
+"""
+import io
+
+from _bench_util import best_time, my_pickle, print_table
+
+N = 10 ** 5
+
+
+class Row:
+    def __init__(self, i):
+        self.id = i
+        self.name = "user%d" % i
+        self.score = i / 7
+        self.active = i % 3 == 0
+        self.tags = ["a", "b"]
+
+
+def make_dicts():
+    return [{"id": i, "name": "user%d" % i, "score": i / 7,
+             "active": i % 3 == 0, "tags": ["a", "b"]} for i in range(N)]
+
+
+def dumps(obj, compact):
+    f = io.BytesIO()
+    my_pickle._Pickler(f, 4, compact_records=compact).dump(obj)
+    return f.getvalue()
+
+
+def count_saves(obj, compact):
+    fast = my_pickle._Pickler._save_fast
+    calls = [0]
+
+    def counting(self, obj, save_persistent_id=True):
+        calls[0] += 1
+        fast(self, obj, save_persistent_id)
+    my_pickle._Pickler._save_fast = counting
+    try:
+        dumps(obj, compact)
+    finally:
+        my_pickle._Pickler._save_fast = fast
+    return calls[0]
+
+
+def state(items):
+    return [x if type(x) is dict else vars(x) for x in items]
+
+
+def main():
+    rows = []
+    for name, obj in [("10**5 dicts", make_dicts()),
+                      ("10**5 instances", [Row(i) for i in range(N)])]:
+        for compact in (False, True):
+            data = dumps(obj, compact)
+            if state(my_pickle._loads(data)) != state(obj):
+                raise AssertionError("%s do not round-trip" % name)
+            dump_time = best_time(lambda: dumps(obj, compact), repeat=3)
+            load_time = best_time(lambda: my_pickle._loads(data), repeat=3)
+            rows.append((name, "on" if compact else "off", len(data),
+                         count_saves(obj, compact),
+                         "%.0f" % (dump_time * 1e3),
+                         "%.0f" % (load_time * 1e3)))
+    print("Protocol 4:")
+    print_table(("workload", "compact", "bytes", "save() calls",
+                 "dump (ms)", "load (ms)"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Size and speed of the frame compression codecs.
+
+A compressible snapshot (a list of small records plus a repetitive bytes
+blob) is dumped with protocol 5 without compression and with each codec,
+with one compression thread and with the default pool size.  Every
+compressed pickle is checked to load back into an equal object.
+"""
+import io
+
+from _bench_util import best_time, my_pickle, print_table
+
+
+def make_snapshot():
+    return {"rows": [{"id": i, "name": "row%d" % (i % 100),
+                      "value": i * 0.5, "tags": ["a", "b"]}
+                     for i in range(50000)],
+            "blob": bytes(range(256)) * (32 * 1024)}
+
+
+def dumps(obj, **kwargs):
+    f = io.BytesIO()
+    my_pickle._Pickler(f, 5, **kwargs).dump(obj)
+    return f.getvalue()
+
+
+def main():
+    obj = make_snapshot()
+    rows = []
+    for codec in (None, "zlib", "bz2", "lzma"):
+        for workers in ((None,) if codec is None else (1, None)):
+            kwargs = {"compression": codec, "compression_workers": workers}
+            data = dumps(obj, **kwargs)
+            if my_pickle._loads(data) != obj:
+                raise AssertionError("%s pickle does not round-trip" % codec)
+            dump_time = best_time(lambda: dumps(obj, **kwargs), repeat=3)
+            load_time = best_time(lambda: my_pickle._loads(data), repeat=3)
+            rows.append((codec or "none",
+                         "default" if workers is None else str(workers),
+                         "%.2f" % (len(data) / 2 ** 20),
+                         "%.0f" % (dump_time * 1e3),
+                         "%.0f" % (load_time * 1e3)))
+    print("Protocol 5 snapshot:")
+    print_table(("codec", "threads", "MiB", "dump ms", "load ms"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Pickle size and dump time of log-shaped records with dedupe_values.
+
+The workload is 50000 log records decoded from JSON lines, so that equal
+strings, floats and lists are distinct objects: a level, a service name, a
+request path out of 50, a latency out of 3 values, a status code and a
+pair of tags.  The records are dumped with each protocol with and without
+dedupe_values.
+"""
+import io
+import json
+
+from _bench_util import best_time, my_pickle, print_table
+
+
+def make_records():
+    lines = [json.dumps({"level": "WARN" if i % 7 == 0 else "INFO",
+                         "service": "api-gateway",
+                         "path": "/api/v1/items/%d" % (i % 50),
+                         "latency": [0.25, 0.5, 1.5][i % 3],
+                         "status": 200, "message": "request served",
+                         "tags": ["prod", "eu-west-1"]})
+             for i in range(50000)]
+    return [json.loads(line) for line in lines]
+
+
+def dumps(obj, protocol, dedupe):
+    f = io.BytesIO()
+    my_pickle._Pickler(f, protocol, dedupe_values=dedupe).dump(obj)
+    return f.getvalue()
+
+
+def main():
+    obj = make_records()
+    rows = []
+    for protocol in range(6):
+        plain = dumps(obj, protocol, False)
+        deduped = dumps(obj, protocol, True)
+        if my_pickle._loads(deduped) != obj:
+            raise AssertionError("protocol %d does not round-trip" % protocol)
+        plain_time = best_time(lambda: dumps(obj, protocol, False), repeat=3)
+        dedupe_time = best_time(lambda: dumps(obj, protocol, True), repeat=3)
+        rows.append((protocol, len(plain), len(deduped),
+                     "%.2fx" % (len(plain) / len(deduped)),
+                     "%.0f" % (plain_time * 1e3),
+                     "%.0f" % (dedupe_time * 1e3)))
+    print("%d log records:" % len(obj))
+    print_table(("protocol", "bytes", "bytes (dedupe)", "ratio",
+                 "dump (ms)", "dump (ms, dedupe)"), rows)
+
+
+if __name__ == "__main__":
+    main()
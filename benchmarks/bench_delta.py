@@ -0,0 +1,93 @@
+"""Checkpoint size and time of a mostly unchanged graph with DeltaPickler.
+
+The workload is a dict of 10**5 instances with an int, a str, a float and a
+list of tags, and an index dict of them by name.  Between two checkpoints
+100 of them get a new score, 10 are removed and 10 added.  Each checkpoint
+is written in full by _Pickler with protocol 5, and as a delta by a
+DeltaPickler that wrote the previous ones; "unchanged dump" is the time of
+a delta without changes, that is of the walk of the graph alone.  The
+loads are of the full pickle by _Unpickler and of the delta by the
+DeltaUnpickler that loaded the previous ones.  The last state it loads
+must equal the graph.
+"""
+import io
+import random
+
+from _bench_util import best_time, my_pickle, print_table
+
+N = 10 ** 5
+ROUNDS = 5
+
+
+class Item:
+    def __init__(self, i):
+        self.id = i
+        self.name = "item%d" % i
+        self.score = i / 7
+        self.tags = ["prod", "eu"] if i % 2 else ["dev"]
+
+
+def make_graph():
+    items = [Item(i) for i in range(N)]
+    return {"items": items, "index": {x.name: x for x in items}}
+
+
+def mutate(graph, rnd, step):
+    items = graph["items"]
+    for x in rnd.sample(items, 100):
+        x.score = rnd.random()
+    for i in range(10):
+        del graph["index"][items.pop(rnd.randrange(len(items))).name]
+        x = Item(N * (step + 1) + i)
+        items.append(x)
+        graph["index"][x.name] = x
+
+
+def dumps(obj):
+    f = io.BytesIO()
+    my_pickle._Pickler(f, 5).dump(obj)
+    return f.getvalue()
+
+
+def state(graph):
+    return [vars(x) for x in graph["items"]], sorted(graph["index"])
+
+
+def main():
+    rnd = random.Random(0)
+    graph = make_graph()
+    f = io.BytesIO()
+    pickler = my_pickle.DeltaPickler(f, 5)
+    pickler.dump(graph)
+    rows = []
+    for step in range(ROUNDS):
+        mutate(graph, rnd, step)
+        full = dumps(graph)
+        full_dump = best_time(lambda: dumps(graph), repeat=3)
+        full_load = best_time(lambda: my_pickle._loads(full), repeat=3)
+        # A delta can only be written once; the next ones are empty, and
+        # time the walk of the graph alone.
+        start = f.tell()
+        delta_dump = best_time(lambda: pickler.dump(graph), repeat=1)
+        size = f.tell() - start
+        scan = best_time(lambda: pickler.dump(graph), repeat=3)
+        rows.append([step + 1, len(full), size,
+                     "%.0f" % (full_dump * 1e3), "%.0f" % (delta_dump * 1e3),
+                     "%.0f" % (scan * 1e3), "%.0f" % (full_load * 1e3)])
+    unpickler = my_pickle.DeltaUnpickler(io.BytesIO(f.getvalue()))
+    loaded = unpickler.load()
+    for row in rows:
+        load_time = best_time(unpickler.load, repeat=1)
+        for _ in range(3):
+            unpickler.load()
+        row.append("%.1f" % (load_time * 1e3))
+    if state(loaded) != state(graph):
+        raise AssertionError("the deltas do not round-trip")
+    print("%d instances, %d checkpoints, protocol 5:" % (N, ROUNDS))
+    print_table(("checkpoint", "full bytes", "delta bytes", "full dump (ms)",
+                 "delta dump (ms)", "unchanged dump (ms)", "full load (ms)",
+                 "delta load (ms)"), rows)
+
+
+if __name__ == "__main__":
+    main()
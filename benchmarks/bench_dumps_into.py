@@ -0,0 +1,88 @@
+"""Time and peak allocation of pickling into shared memory and to a file.
+
+The workloads are 20000 small records (a dict with an int, a str, a float
+and a short list each) and a list of 16 bytes objects of 1 MB.  Each is
+pickled with protocol 5 into a multiprocessing.shared_memory block, by
+_dumps() followed by a copy of the result into the block and by
+dumps_into() on the block itself, and to a temporary file, by _dump() on
+the file opened for writing and by dump_to_path().  "peak" is the largest
+amount of memory allocated by Python during one call, as measured by
+tracemalloc.  Both ways must give the same bytes.
+"""
+import os
+import tempfile
+import tracemalloc
+from multiprocessing import shared_memory
+
+from _bench_util import best_time, my_pickle, print_table
+
+
+def make_records():
+    return [{"id": i, "name": "user%d" % i, "score": i / 7,
+             "tags": ["a", "b", i % 5]}
+            for i in range(20000)]
+
+
+def make_blobs():
+    return [os.urandom(1 << 20) for _ in range(16)]
+
+
+def peak(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "obj.pickle")
+        for name, obj in [("records", make_records()),
+                          ("blobs", make_blobs())]:
+            data = my_pickle._dumps(obj, 5)
+            shm = shared_memory.SharedMemory(create=True, size=len(data))
+            try:
+                buf = shm.buf
+
+                def copy_into():
+                    data = my_pickle._dumps(obj, 5)
+                    buf[:len(data)] = data
+
+                def dump_into():
+                    my_pickle.dumps_into(obj, buf, 0, 5)
+
+                def dump_file():
+                    with open(path, "wb") as f:
+                        my_pickle._dump(obj, f, 5)
+
+                def dump_path():
+                    my_pickle.dump_to_path(obj, path, 5)
+
+                dump_into()
+                if buf[:len(data)] != data:
+                    raise AssertionError("dumps_into() changes the output")
+                dump_path()
+                with open(path, "rb") as f:
+                    if f.read() != data:
+                        raise AssertionError("dump_to_path() changes the "
+                                             "output")
+                row = [name, len(data)]
+                for pair in ((copy_into, dump_into), (dump_file, dump_path)):
+                    for func in pair:
+                        row += ["%.1f" % (best_time(func, repeat=5) * 1e3),
+                                "%.1f" % (peak(func) / 2 ** 20)]
+                rows.append(row)
+                del buf
+            finally:
+                shm.close()
+                shm.unlink()
+    print("protocol 5 (milliseconds, peak in MiB):")
+    print_table(("workload", "bytes", "_dumps+copy", "peak", "dumps_into",
+                 "peak", "_dump", "peak", "dump_to_path", "peak"), rows)
+
+
+if __name__ == "__main__":
+    main()
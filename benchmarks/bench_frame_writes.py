@@ -0,0 +1,127 @@
+"""Count write system calls and measure dump throughput per frame size.
+
+The same payload is dumped with protocol 4 to an unbuffered file, to a
+buffered file and to a connected socket, once with scatter-gather writes
+(os.writev / socket.sendmsg) and once with plain write() calls.  Write
+system calls are read from /proc/self/io on Linux; elsewhere only the
+number of calls made by the pickler is reported.  Socket sends are not
+accounted for in /proc/self/io, so for sockets only the calls are shown.
+"""
+import socket
+import tempfile
+import threading
+import time
+
+from _bench_util import my_pickle, print_table
+
+FRAME_SIZES = [4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024]
+
+
+def make_payload():
+    records = [{"id": i, "name": "user%d" % i, "score": i * 0.5,
+                "tags": ["a", "b", "c"]} for i in range(20000)]
+    blobs = [bytes([i]) * (300 * 1024) for i in range(8)]
+    return {"records": records, "blobs": blobs}
+
+
+def write_syscalls():
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("syscw:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class CountingWrites:
+    """Wrap the framer's outputs to count the calls the pickler makes."""
+
+    def __init__(self, framer):
+        self.calls = 0
+        write, writev = framer.file_write, framer.file_writev
+
+        def counted_write(data):
+            self.calls += 1
+            return write(data)
+        framer.file_write = counted_write
+        if writev is not None:
+            def counted_writev(buffers):
+                self.calls += 1
+                return writev(buffers)
+            framer.file_writev = counted_writev
+
+
+def dump_to(file, payload, frame_size, gather, count_syscalls=True):
+    pickler = my_pickle._Pickler(file, 4)
+    pickler.framer._FRAME_SIZE_TARGET = frame_size
+    if not gather:
+        pickler.framer.file_writev = None
+    counter = CountingWrites(pickler.framer)
+    before = write_syscalls() if count_syscalls else None
+    start = time.perf_counter()
+    pickler.dump(payload)
+    if hasattr(file, "flush"):
+        file.flush()
+    elapsed = time.perf_counter() - start
+    after = write_syscalls()
+    syscalls = after - before if before is not None else "n/a"
+    return counter.calls, syscalls, elapsed
+
+
+def run_file(payload, frame_size, gather, buffering):
+    with tempfile.TemporaryFile(buffering=buffering) as f:
+        calls, syscalls, elapsed = dump_to(f, payload, frame_size, gather)
+        size = f.tell()
+    return calls, syscalls, size / elapsed
+
+
+def run_socket(payload, frame_size, gather):
+    a, b = socket.socketpair()
+    received = []
+
+    def drain():
+        total = 0
+        while True:
+            chunk = b.recv(1 << 20)
+            if not chunk:
+                break
+            total += len(chunk)
+        received.append(total)
+
+    reader = threading.Thread(target=drain)
+    reader.start()
+    with a.makefile("wb", buffering=0) as f:
+        calls, syscalls, elapsed = dump_to(f, payload, frame_size, gather,
+                                           count_syscalls=False)
+    a.close()
+    reader.join()
+    b.close()
+    return calls, syscalls, received[0] / elapsed
+
+
+def main():
+    payload = make_payload()
+    rows = []
+    for frame_size in FRAME_SIZES:
+        for sink in ("raw file", "buffered file", "socket"):
+            for gather in (False, True):
+                if sink == "raw file":
+                    result = run_file(payload, frame_size, gather, 0)
+                elif sink == "buffered file":
+                    if gather:
+                        continue  # buffered files always use write()
+                    result = run_file(payload, frame_size, gather, -1)
+                else:
+                    result = run_socket(payload, frame_size, gather)
+                calls, syscalls, throughput = result
+                rows.append(("%d KiB" % (frame_size // 1024), sink,
+                             "writev" if gather else "write", calls,
+                             syscalls, "%.1f" % (throughput / 2 ** 20)))
+    print_table(("frame", "sink", "mode", "calls", "syscalls", "MiB/s"),
+                rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Effect of the save_global() name resolution cache.
+
+Two workloads with instances of a few classes are dumped with and without
+the cache: one pickle of a list of 10**6 instances, and 10**5 separate
+pickles of a single instance each.  Classes are memoized within one
+pickle, so the cache mostly pays off when many small pickles are made.
+"""
+import io
+
+from _bench_util import best_time, my_pickle, print_table
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Color:
+    def __init__(self, name):
+        self.name = name
+
+
+class Tag:
+    __slots__ = ("label",)
+
+    def __init__(self, label):
+        self.label = label
+
+    def __getstate__(self):
+        return self.label
+
+    def __setstate__(self, state):
+        self.label = state
+
+
+class NoCache(dict):
+    """Stand-in for my_pickle._global_cache that never stores entries."""
+
+    def __setitem__(self, key, value):
+        pass
+
+
+def make_instances(n):
+    kinds = (lambda i: Point(i, -i), lambda i: Color("c%d" % (i % 7)),
+             lambda i: Tag(i))
+    return [kinds[i % 3](i) for i in range(n)]
+
+
+def dumps(obj, protocol):
+    f = io.BytesIO()
+    my_pickle._Pickler(f, protocol).dump(obj)
+    return f.getvalue()
+
+
+def one_large(objs, protocol):
+    dumps(objs, protocol)
+
+
+def many_small(objs, protocol):
+    for obj in objs:
+        dumps(obj, protocol)
+
+
+def main():
+    large = make_instances(10 ** 6)
+    small = make_instances(10 ** 5)
+    cache = my_pickle._global_cache
+    rows = []
+    for protocol in (2, 4):
+        for name, func, objs in [("1 x list of 10**6", one_large, large),
+                                 ("10**5 x 1 instance", many_small, small)]:
+            timings = []
+            for use_cache in (False, True):
+                my_pickle._global_cache = cache if use_cache else NoCache()
+                try:
+                    timings.append(best_time(lambda: func(objs, protocol),
+                                             repeat=3))
+                finally:
+                    my_pickle._global_cache = cache
+            rows.append(("%s, protocol %d" % (name, protocol),
+                         "%.1f" % (timings[0] * 1e3),
+                         "%.1f" % (timings[1] * 1e3),
+                         "%.2fx" % (timings[0] / timings[1])))
+    print("Milliseconds per workload:")
+    print_table(("workload", "no cache", "cache", "speedup"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Dump time of lists of instances with and without the class layout cache.
+
+The workloads are lists of 10**5 records with an int, a str, a float, a
+bool and a None: a dataclass, a class with __slots__, and a class with both
+__slots__ and a __dict__.  Each is dumped with protocol 4, once with the
+layout of its class cached and once through object.__reduce_ex__() and
+save_reduce() for every instance.  Both must give the same bytes.
+"""
+import dataclasses
+import io
+
+from _bench_util import best_time, my_pickle, print_table
+
+N = 10 ** 5
+
+
+@dataclasses.dataclass
+class Row:
+    id: int
+    name: str
+    score: float
+    active: bool
+    parent: object
+
+
+class SlottedRow:
+    __slots__ = ("id", "name", "score", "active", "parent")
+
+    def __init__(self, i):
+        self.id = i
+        self.name = "user%d" % i
+        self.score = i / 7
+        self.active = i % 3 == 0
+        self.parent = None
+
+
+class MixedRow(SlottedRow):
+    def __init__(self, i):
+        super().__init__(i)
+        self.note = None
+
+
+def dumps(obj):
+    f = io.BytesIO()
+    my_pickle._Pickler(f, 4).dump(obj)
+    return f.getvalue()
+
+
+def main():
+    rows = []
+    instance_layout = my_pickle._instance_layout
+    for name, obj in [
+            ("dataclass", [Row(i, "user%d" % i, i / 7, i % 3 == 0, None)
+                           for i in range(N)]),
+            ("__slots__", [SlottedRow(i) for i in range(N)]),
+            ("__slots__ + __dict__", [MixedRow(i) for i in range(N)])]:
+        cached = dumps(obj)
+        cached_time = best_time(lambda: dumps(obj), repeat=5)
+        my_pickle._instance_layout = lambda t, rv: None
+        try:
+            generic = dumps(obj)
+            generic_time = best_time(lambda: dumps(obj), repeat=5)
+        finally:
+            my_pickle._instance_layout = instance_layout
+        if cached != generic:
+            raise AssertionError("%s: the layout cache changes the output"
+                                 % name)
+        rows.append((name, "%.0f" % (generic_time * 1e3),
+                     "%.0f" % (cached_time * 1e3),
+                     "%.2fx" % (generic_time / cached_time)))
+    print("Dumps of %d instances, protocol 4 (milliseconds):" % N)
+    print_table(("class", "generic", "cached layout", "speedup"), rows)
+
+
+if __name__ == "__main__":
+    main()
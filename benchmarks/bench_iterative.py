@@ -0,0 +1,61 @@
+"""Compare the iterative save engine with the recursive one.
+
+Wide graphs (the black-box corpus and a list of many small records) and
+deep graphs (nested lists and a linked list of objects) are dumped with
+protocol 4, recursively and with iterative=True.  The outputs are checked
+to be byte-identical.  The recursion limit is raised so that the recursive
+engine can handle the deep cases; the iterative engine does not need it.
+"""
+import io
+import sys
+
+from _bench_util import best_time, load_corpus, my_pickle, print_table
+
+
+class Node:
+    def __init__(self, next=None):
+        self.next = next
+
+
+def nested_lists(depth):
+    obj = []
+    for _ in range(depth):
+        obj = [obj]
+    return obj
+
+
+def linked_nodes(depth):
+    obj = None
+    for _ in range(depth):
+        obj = Node(obj)
+    return obj
+
+
+def dumps(obj, **kwargs):
+    f = io.BytesIO()
+    my_pickle._Pickler(f, 4, **kwargs).dump(obj)
+    return f.getvalue()
+
+
+def main():
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+    cases = [("corpus", [obj for _, obj in load_corpus()]),
+             ("10**5 records", [{"id": i, "name": "n%d" % i, "tags": ["a"]}
+                                for i in range(10 ** 5)]),
+             ("nested lists x 10**4", nested_lists(10 ** 4)),
+             ("linked nodes x 10**4", linked_nodes(10 ** 4))]
+    rows = []
+    for name, obj in cases:
+        if dumps(obj) != dumps(obj, iterative=True):
+            raise AssertionError("output differs for %s" % name)
+        recursive = best_time(lambda: dumps(obj))
+        iterative = best_time(lambda: dumps(obj, iterative=True))
+        rows.append((name, "%.1f" % (recursive * 1e3),
+                     "%.1f" % (iterative * 1e3),
+                     "%.2fx" % (iterative / recursive)))
+    print("Protocol 4 dumps (milliseconds):")
+    print_table(("case", "recursive", "iterative", "ratio"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Dump and load time of each protocol with and without the legacy fast paths.
+
+The workload is 20000 records with an int, an int that needs LONG in
+protocols 0 and 1, a float, a str, a str with a newline and a list of two
+shared tags, so the text opcodes of protocol 0, the decimal ints of
+protocol 1 and the memo opcodes of all protocols are exercised.  Each
+protocol is timed with the current handlers and with those of the stdlib
+pure-Python pickle: save_long(), save_float(), save_str(), put(), get() and
+the loaders of INT, LONG, FLOAT, UNICODE, GET and PUT (save_str() is copied
+below, as the stdlib one of Python 3.11 memoizes the escaped str).  Both
+must give the same bytes.  load() reads the opcodes the same way in both,
+so its share of the speedup is not in the table.
+"""
+import io
+import pickle
+from struct import pack
+
+from _bench_util import best_time, my_pickle, print_table
+
+N = 20000
+
+TAGS = ["prod", "eu"]
+
+
+def make_records():
+    return [{"id": i, "ts": 10 ** 12 + i, "score": i / 7, "name": "user%d" % i,
+             "note": "line\nbreak", "tags": TAGS} for i in range(N)]
+
+
+def dumps(obj, protocol):
+    f = io.BytesIO()
+    my_pickle._Pickler(f, protocol).dump(obj)
+    return f.getvalue()
+
+
+def stdlib_save_str(self, obj):
+    # pickle._Pickler.save_str() of the protocols 0-3 text and binary forms,
+    # except that before Python 3.12 it memoizes the escaped copy of obj.
+    if self.bin:
+        encoded = obj.encode('utf-8', 'surrogatepass')
+        self.write(pickle.BINUNICODE + pack("<I", len(encoded)) + encoded)
+    else:
+        tmp = obj.replace("\\", "\\u005c")
+        tmp = tmp.replace("\0", "\\u0000")
+        tmp = tmp.replace("\n", "\\u000a")
+        tmp = tmp.replace("\r", "\\u000d")
+        tmp = tmp.replace("\x1a", "\\u001a")
+        self.write(pickle.UNICODE + tmp.encode('raw-unicode-escape') + b'\n')
+    self.memoize(obj)
+
+
+def swap_handlers(protocol):
+    """Put the stdlib handlers in place; return a function undoing it."""
+    P, U = my_pickle._Pickler, my_pickle._Unpickler
+    saved = [(None, name, P.__dict__[name]) for name in ("put", "get")]
+    P.put, P.get = pickle._Pickler.put, pickle._Pickler.get
+
+    def patch(table, key, value):
+        saved.append((table, key, table[key]))
+        table[key] = value
+    for t in (int, float):
+        patch(P.dispatch, t, pickle._Pickler.dispatch[t])
+        patch(my_pickle._ATOMIC_DISPATCH, t, pickle._Pickler.dispatch[t])
+    if protocol < 4:
+        patch(P.dispatch, str, stdlib_save_str)
+    for op in (pickle.INT, pickle.LONG, pickle.FLOAT, pickle.UNICODE,
+               pickle.GET, pickle.PUT):
+        patch(U.dispatch, op[0], pickle._Unpickler.dispatch[op[0]])
+
+    def restore():
+        for table, key, value in saved:
+            if table is None:
+                setattr(P, key, value)
+            else:
+                table[key] = value
+    return restore
+
+
+def main():
+    obj = make_records()
+    rows = []
+    for protocol in range(6):
+        data = dumps(obj, protocol)
+        if my_pickle._loads(data) != obj:
+            raise AssertionError("protocol %d does not round-trip" % protocol)
+        restore = swap_handlers(protocol)
+        try:
+            if dumps(obj, protocol) != data:
+                raise AssertionError("protocol %d: the fast paths change the "
+                                     "output" % protocol)
+        finally:
+            restore()
+        # Alternate the two so that they see the same machine load.
+        times = [float("inf")] * 4
+        for _ in range(9):
+            times[2] = min(times[2], best_time(lambda: dumps(obj, protocol), 1))
+            times[3] = min(times[3], best_time(lambda: my_pickle._loads(data),
+                                               1))
+            restore = swap_handlers(protocol)
+            try:
+                times[0] = min(times[0],
+                               best_time(lambda: dumps(obj, protocol), 1))
+                times[1] = min(times[1],
+                               best_time(lambda: my_pickle._loads(data), 1))
+            finally:
+                restore()
+        old_dump, old_load, dump_time, load_time = times
+        rows.append((protocol, len(data), "%.0f" % (old_dump * 1e3),
+                     "%.0f" % (dump_time * 1e3),
+                     "%.2fx" % (old_dump / dump_time),
+                     "%.0f" % (old_load * 1e3), "%.0f" % (load_time * 1e3),
+                     "%.2fx" % (old_load / load_time)))
+    print("%d records (milliseconds):" % N)
+    print_table(("protocol", "bytes", "dump (stdlib)", "dump", "speedup",
+                 "load (stdlib)", "load", "speedup"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Pickle size, memo size, dump and load time with minimal_memo.
+
+The workloads are 50000 log records decoded from JSON lines (dicts of
+strs, floats and lists, a few keys shared), 10**5 instances with a str
+attribute each, and a tree of 10**5 small lists and tuples.  Each is dumped
+with protocols 2 and 4, with and without minimal_memo, and loaded with
+my_pickle._Unpickler; "memo" is the number of entries of its memo after
+the load.  Both pickles must load as equal objects.
+"""
+import io
+import json
+
+from _bench_util import best_time, my_pickle, print_table
+
+
+class Row:
+    def __init__(self, i):
+        self.id = i
+        self.name = "user%d" % i
+
+
+def make_logs():
+    lines = [json.dumps({"level": "INFO", "path": "/api/items/%d" % i,
+                         "latency": i / 1000, "tags": ["prod", "eu"]})
+             for i in range(50000)]
+    return [json.loads(line) for line in lines]
+
+
+def make_tree():
+    return [[(i, [i, i + 1]), "leaf%d" % i] for i in range(10 ** 5)]
+
+
+def dumps(obj, protocol, minimal):
+    f = io.BytesIO()
+    my_pickle._Pickler(f, protocol, minimal_memo=minimal).dump(obj)
+    return f.getvalue()
+
+
+def load(data):
+    unpickler = my_pickle._Unpickler(io.BytesIO(data))
+    return unpickler.load(), len(unpickler.memo)
+
+
+def state(obj):
+    return [vars(x) if isinstance(x, Row) else x for x in obj]
+
+
+def main():
+    rows = []
+    for name, obj in [("log records", make_logs()),
+                      ("instances", [Row(i) for i in range(10 ** 5)]),
+                      ("tree", make_tree())]:
+        for protocol in (2, 4):
+            for minimal in (False, True):
+                data = dumps(obj, protocol, minimal)
+                loaded, memo = load(data)
+                if state(loaded) != state(obj):
+                    raise AssertionError("%s does not round-trip" % name)
+                del loaded
+                dump_time = best_time(lambda: dumps(obj, protocol, minimal),
+                                      repeat=3)
+                load_time = best_time(lambda: load(data), repeat=3)
+                rows.append((name, protocol, "on" if minimal else "off",
+                             len(data), memo, "%.0f" % (dump_time * 1e3),
+                             "%.0f" % (load_time * 1e3)))
+    print_table(("workload", "protocol", "minimal_memo", "bytes", "memo",
+                 "dump (ms)", "load (ms)"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Compare the specialized save loop with the generic _Pickler.save.
+
+Every object of the black-box stability corpus is dumped with protocols
+0-5, once through the fast path and once through the generic save().  The
+outputs are checked to be byte-identical.
+"""
+import io
+import sys
+
+from _bench_util import best_time, load_corpus, my_pickle, print_table
+
+
+class GenericPickler(my_pickle._Pickler):
+    """Pickler that always goes through the generic save()."""
+
+    def _hooks_allow_fast_save(self):
+        return False
+
+
+def dumps_with(pickler_class, obj, protocol):
+    f = io.BytesIO()
+    pickler_class(f, protocol).dump(obj)
+    return f.getvalue()
+
+
+def main():
+    # The "Deeply Nested" case needs ~3 Python frames per level.
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    corpus = load_corpus()
+    rows = []
+    total_generic = total_fast = 0.0
+    for protocol in range(my_pickle.HIGHEST_PROTOCOL + 1):
+        for name, obj in corpus:
+            expected = dumps_with(GenericPickler, obj, protocol)
+            if dumps_with(my_pickle._Pickler, obj, protocol) != expected:
+                raise AssertionError("output differs for %r (protocol %d)"
+                                     % (name, protocol))
+            number = 1 if len(expected) > 10 ** 6 else 200
+            generic = best_time(
+                lambda: dumps_with(GenericPickler, obj, protocol),
+                number=number)
+            fast = best_time(
+                lambda: dumps_with(my_pickle._Pickler, obj, protocol),
+                number=number)
+            total_generic += generic
+            total_fast += fast
+            if protocol == my_pickle.DEFAULT_PROTOCOL:
+                rows.append((name, "%.2f" % (generic * 1e6),
+                             "%.2f" % (fast * 1e6),
+                             "%.2fx" % (generic / fast)))
+    print("Per-case timings, protocol %d (microseconds per dump):"
+          % my_pickle.DEFAULT_PROTOCOL)
+    print_table(("case", "generic", "fast", "speedup"), rows)
+    print()
+    print("All protocols: generic %.3f ms, fast %.3f ms, speedup %.2fx"
+          % (total_generic * 1e3, total_fast * 1e3,
+             total_generic / total_fast))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Load time of a snapshot with and without a memory-mapped sidecar.
+
+The snapshot holds SIZE_MIB MiB of bytes payloads (in 4 MiB chunks) plus
+some small metadata.  It is written once in-band with protocol 5 and once
+with dump_with_sidecar(), then loaded back both ways.  Loading from the
+sidecar maps the payloads instead of reading them, so its time does not
+grow with the payload size.
+"""
+import os
+import sys
+import tempfile
+
+from _bench_util import best_time, my_pickle, print_table
+
+SIZE_MIB = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+
+
+def make_snapshot():
+    chunk = os.urandom(4 << 20)
+    return {"meta": {"version": 3, "names": ["n%d" % i for i in range(1000)]},
+            "chunks": [chunk[:-1] + bytes([i % 256])
+                       for i in range(SIZE_MIB // 4)]}
+
+
+def main():
+    obj = make_snapshot()
+    with tempfile.TemporaryDirectory() as tmp:
+        inband = os.path.join(tmp, "inband.pkl")
+        sidecar = os.path.join(tmp, "sidecar.pkl")
+
+        def dump_inband():
+            with open(inband, "wb") as f:
+                my_pickle._dump(obj, f, 5)
+
+        def load_inband():
+            with open(inband, "rb") as f:
+                return my_pickle._load(f)
+
+        rows = []
+        for name, dump, load in [
+                ("in-band", dump_inband, load_inband),
+                ("sidecar", lambda: my_pickle.dump_with_sidecar(obj, sidecar),
+                 lambda: my_pickle.load_with_sidecar(sidecar))]:
+            dump_time = best_time(dump, repeat=3)
+            if load()["chunks"][-1] != obj["chunks"][-1]:
+                raise AssertionError("%s snapshot does not round-trip" % name)
+            load_time = best_time(load, repeat=3)
+            rows.append((name, "%.1f" % (dump_time * 1e3),
+                         "%.2f" % (load_time * 1e3)))
+    print("Snapshot with %d MiB of payloads (milliseconds):" % SIZE_MIB)
+    print_table(("mode", "dump", "load"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Dump time of common stdlib value types with and without their fast paths.
+
+For each type, a list of 20000 distinct values is dumped with protocol 4,
+once through the fast path of the type and once through the generic
+reduce path (dispatch_table lookup, __reduce_ex__() and save_reduce()).
+Both must give the same bytes.
+"""
+import datetime
+import decimal
+import enum
+import io
+import pathlib
+import uuid
+
+from _bench_util import best_time, my_pickle, print_table
+
+N = 20000
+
+
+class Color(enum.Enum):
+    RED = 1
+    GREEN = 2
+    BLUE = 3
+
+
+def make_workloads():
+    start = datetime.datetime(2024, 1, 1)
+    utc = datetime.timezone.utc
+    return [
+        ("datetime", [start + datetime.timedelta(seconds=i)
+                      for i in range(N)]),
+        ("datetime (UTC)", [datetime.datetime(2024, 1, 1, tzinfo=utc)
+                            + datetime.timedelta(seconds=i)
+                            for i in range(N)]),
+        ("date", [datetime.date(2000, 1, 1) + datetime.timedelta(i)
+                  for i in range(N)]),
+        ("timedelta", [datetime.timedelta(seconds=i) for i in range(N)]),
+        ("Decimal", [decimal.Decimal(i) / 100 for i in range(N)]),
+        ("UUID", [uuid.UUID(int=i * 7919) for i in range(N)]),
+        ("Enum", [list(Color)[i % 3] for i in range(N)]),
+        ("PurePosixPath", [pathlib.PurePosixPath("/srv/data", str(i))
+                           for i in range(N)]),
+    ]
+
+
+def dumps(obj):
+    f = io.BytesIO()
+    my_pickle._Pickler(f, 4).dump(obj)
+    return f.getvalue()
+
+
+def main():
+    rows = []
+    fast_reducer = my_pickle._fast_reducer
+    for name, obj in make_workloads():
+        fast = dumps(obj)
+        fast_time = best_time(lambda: dumps(obj))
+        my_pickle._fast_reducer = lambda t: None
+        try:
+            generic = dumps(obj)
+            generic_time = best_time(lambda: dumps(obj))
+        finally:
+            my_pickle._fast_reducer = fast_reducer
+        if fast != generic:
+            raise AssertionError("%s: the fast path changes the output"
+                                 % name)
+        rows.append((name, "%.1f" % (generic_time * 1e3),
+                     "%.1f" % (fast_time * 1e3),
+                     "%.2fx" % (generic_time / fast_time)))
+    print("Dumps of %d values, protocol 4 (milliseconds):" % N)
+    print_table(("type", "generic", "fast path", "speedup"), rows)
+
+
+if __name__ == "__main__":
+    main()
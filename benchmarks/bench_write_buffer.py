@@ -0,0 +1,70 @@
+"""Write calls and dump time to a raw pipe, with and without write combining.
+
+The workload is a list of 20000 small records (a dict with an int, a str,
+a float and a short list each).  It is dumped with protocols 0 to 5 to the
+unbuffered write end of an os.pipe, drained by a reader thread, once with
+write_buffer_size=0 (one write() per opcode for protocols 0 to 3) and once
+with the default write buffer.  Protocols 4 and 5 are framed either way
+and serve as the reference.  The write() calls are counted through a thin
+wrapper around the pipe, the times are measured on the pipe itself.
+"""
+import os
+import threading
+
+from _bench_util import best_time, my_pickle, print_table
+
+
+def make_records():
+    return [{"id": i, "name": "user%d" % i, "score": i / 7,
+             "tags": ["a", "b", i % 5]}
+            for i in range(20000)]
+
+
+class CountingFile:
+    def __init__(self, file):
+        self.file = file
+        self.calls = 0
+
+    def write(self, data):
+        self.calls += 1
+        return self.file.write(data)
+
+
+def drain(fd):
+    while os.read(fd, 1 << 20):
+        pass
+
+
+def main():
+    obj = make_records()
+    r, w = os.pipe()
+    reader = threading.Thread(target=drain, args=(r,))
+    reader.start()
+    rows = []
+    try:
+        with open(w, "wb", buffering=0) as pipe:
+            for protocol in range(6):
+                row = [str(protocol)]
+                times = []
+                for size in (0, None):
+                    counting = CountingFile(pipe)
+                    my_pickle._Pickler(counting, protocol,
+                                       write_buffer_size=size).dump(obj)
+                    t = best_time(
+                        lambda: my_pickle._Pickler(
+                            pipe, protocol, write_buffer_size=size).dump(obj),
+                        repeat=3)
+                    times.append(t)
+                    row += [str(counting.calls), "%.1f" % (t * 1e3)]
+                row.append("%.2fx" % (times[0] / times[1]))
+                rows.append(row)
+    finally:
+        reader.join()
+        os.close(r)
+    print("Dumps of %d records to a raw pipe:" % len(obj))
+    print_table(("protocol", "writes (off)", "ms (off)", "writes (on)",
+                 "ms (on)", "speedup"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,15 @@ import multiprocessing
 import sys
 import os
 
+# my_pickle 位于本仓库的 white_box_tests 目录；在仓库之外运行时
+# 退回到标准库 pickle 加 hashlib，两者得到相同的哈希
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "white_box_tests"))
+try:
+    import my_pickle
+except ImportError:
+    my_pickle = None
+
 # 测试用例,通过等价类划分获得
 test_cases = [
     # 基本数据类型（稳定类）
@@ -101,8 +110,10 @@ def setup_dynamic_cases():
     test_cases[41] = ("Deeply Nested", current)
 
 def hash_pickle(data):
-    pickled_data = pickle.dumps(data)
-    return hashlib.sha256(pickled_data).hexdigest()
+    if my_pickle is None:
+        return hashlib.sha256(pickle.dumps(data)).hexdigest()
+    # 边序列化边计算哈希，不保留完整的 pickle 字节
+    return my_pickle.digest(data, pickle.DEFAULT_PROTOCOL, "sha256").hexdigest()
 
 def worker(name, data, run_id, results, unstable_flag):
     try:
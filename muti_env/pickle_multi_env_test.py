@@ -1,11 +1,23 @@
+import hashlib
+import os
 import pickle
 import platform
 import subprocess
 import sys
-import hashlib
 import tempfile
 from typing import Any, Dict, List, Tuple
 
+# my_pickle lives in the white_box_tests directory of this checkout.  When
+# the script runs from elsewhere (e.g. copied next to another interpreter
+# by run_remote_test), it falls back to the stdlib pickle and hashlib,
+# which give the same hashes.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "white_box_tests"))
+try:
+    import my_pickle
+except ImportError:
+    my_pickle = None
+
 class PickleTester:
     """Testing tool for serialization consistency of Python pickle module across different environments"""
     
@@ -52,8 +64,10 @@ class PickleTester:
     def pickle_and_hash(self, obj: Any, protocol: int) -> str:
         """Pickle an object and compute its SHA-256 hash"""
         try:
-            pickled_data = pickle.dumps(obj, protocol=protocol)
-            return hashlib.sha256(pickled_data).hexdigest()
+            if my_pickle is None:
+                pickled_data = pickle.dumps(obj, protocol=protocol)
+                return hashlib.sha256(pickled_data).hexdigest()
+            return my_pickle.digest(obj, protocol, "sha256").hexdigest()
         except Exception as e:
             return f"ERROR: {str(e)}"
     
@@ -12,6 +12,11 @@ Functions:
 
     dump(object, file)
     dumps(object) -> string
+    dump_iter(iterable, file)
+    digest(object) -> hash object
+    pickled_size(object) -> int
+    dump_with_sidecar(object, path)
+    load_with_sidecar(path) -> object
     load(file) -> object
     loads(bytes) -> object
 
@@ -26,18 +31,28 @@ Misc variables:
 from types import FunctionType
 from copyreg import dispatch_table
 from copyreg import _extension_registry, _inverted_registry, _extension_cache
-from itertools import islice
+from copyreg import __newobj__ as _copyreg_newobj, _slotnames
+from itertools import islice, chain, compress, repeat
+from operator import is_ as _is, itemgetter
 from functools import partial
+from array import array, _array_reconstructor
+from enum import Enum as _Enum, EnumMeta as _EnumType
+import os
 import sys
 from sys import maxsize
 from struct import pack, unpack
+from binascii import crc32
 import re
 import io
+import gc
 import codecs
 import _compat_pickle
 
 __all__ = ["PickleError", "PicklingError", "UnpicklingError", "Pickler",
-           "Unpickler", "dump", "dumps", "load", "loads"]
+           "Unpickler", "dump", "dumps", "load", "loads", "dump_iter",
+           "digest", "pickled_size", "verify", "dump_with_sidecar",
+           "load_with_sidecar", "register_buffer_reducer", "DeltaPickler",
+           "DeltaUnpickler", "dumps_into", "dump_to_path"]
 
 try:
     from _pickle import PickleBuffer
@@ -188,6 +203,12 @@ BYTEARRAY8       = b'\x96'  # push bytearray
 NEXT_BUFFER      = b'\x97'  # push next out-of-band buffer
 READONLY_BUFFER  = b'\x98'  # make top of stack readonly
 
+# my_pickle extension, understood by _Unpickler only
+
+_COMPRESSED      = b'\xfa'  # compressed block container; see _FrameCompressor
+_CHECKED_FRAME   = b'\xfb'  # like FRAME, with a CRC32; see _Framer._write_frame
+_CHECKSUM        = b'\xfc'  # CRC32 trailer of an unframed pickle; see verify
+
 __all__.extend([x for x in dir() if re.match("[A-Z][A-Z0-9_]+$", x)])
 
 
@@ -196,41 +217,119 @@ class _Framer:
     _FRAME_SIZE_MIN = 4
     _FRAME_SIZE_TARGET = 64 * 1024
 
-    def __init__(self, file_write):
+    def __init__(self, file_write, file_writev=None, checksum=False):
         self.file_write = file_write
+        # Optional callable writing a list of buffers with a single
+        # scatter-gather call (see _gather_writer()).
+        self.file_writev = file_writev
         self.current_frame = None
+        # Frame buffer kept for reuse by the next dump.
+        self._spare_frame = None
+        # False when the frame buffer is only used for write combining.
+        self.framed = True
+        # True to write each frame as _CHECKED_FRAME with a CRC32 of its
+        # contents (the checksum mode of _Pickler).
+        self.checksum = checksum
+        # Frame buffers that were still exported when their frame was
+        # written, kept for reuse once they are not (see _new_frame()).
+        self._frame_pool = []
+        self.frame_pool_size = 0
 
     def start_framing(self):
-        self.current_frame = io.BytesIO()
+        self.framed = True
+        if self._spare_frame is not None:
+            self.current_frame = self._spare_frame
+            self._spare_frame = None
+        else:
+            self.current_frame = io.BytesIO()
+
+    def start_buffering(self, size):
+        # Write combining for protocols 0 to 3, which have no frames: the
+        # output is collected in the frame buffer and written out without
+        # FRAME headers once it reaches *size* bytes.  Larger bytes and str
+        # payloads still bypass the buffer.
+        self.start_framing()
+        self.framed = False
+        self._FRAME_SIZE_TARGET = size
 
     def end_framing(self):
         if self.current_frame and self.current_frame.tell() > 0:
-            self.commit_frame(force=True)
+            self._write_frame(last=True)
+            self._spare_frame = self.current_frame
             self.current_frame = None
 
     def commit_frame(self, force=False):
         if self.current_frame:
             f = self.current_frame
             if f.tell() >= self._FRAME_SIZE_TARGET or force:
-                data = f.getbuffer()
-                write = self.file_write
-                if len(data) >= self._FRAME_SIZE_MIN:
-                    # Issue a single call to the write method of the underlying
-                    # file object for the frame opcode with the size of the
-                    # frame. The concatenation is expected to be less expensive
-                    # than issuing an additional call to write.
-                    write(FRAME + pack("<Q", len(data)))
-
-                # Issue a separate call to write to append the frame
-                # contents without concatenation to the above to avoid a
-                # memory copy.
-                write(data)
-
-                # Start the new frame with a new io.BytesIO instance so that
-                # the file object can have delayed access to the previous frame
-                # contents via an unreleased memoryview of the previous
-                # io.BytesIO instance.
-                self.current_frame = io.BytesIO()
+                self._write_frame()
+
+    def _write_frame(self, *trailer, last=False):
+        # Write out the current frame, followed by the *trailer* buffers,
+        # then start a new frame.  *last* is true for the frame ending the
+        # pickle.
+        f = self.current_frame
+        # The frame buffer is reused, so only the part written since the
+        # last commit is valid.
+        data = f.getbuffer()[:f.tell()]
+        chunks = []
+        if self.framed and self.checksum:
+            # Every frame is checked, and the trailer is part of it:
+            #     _CHECKED_FRAME, last (1 byte), size (8 bytes) and CRC32
+            #     (4 bytes) of the contents, little-endian, then the contents
+            # verify() stops after the last frame.
+            crc = crc32(data)
+            size = len(data)
+            for chunk in trailer:
+                crc = crc32(chunk, crc)
+                size += len(chunk)
+            chunks.append(_CHECKED_FRAME + pack("<BQI", last, size, crc))
+        elif self.framed and len(data) >= self._FRAME_SIZE_MIN:
+            # The frame opcode and the size of the frame are sent together
+            # with the frame contents, which are not concatenated to them to
+            # avoid a memory copy.
+            chunks.append(FRAME + pack("<Q", len(data)))
+        chunks.append(data)
+        chunks.extend(trailer)
+        self._write_chunks(chunks)
+        del data, chunks
+
+        # Rewind the frame buffer so that the next frame reuses its
+        # allocation.  If the file object kept a view of the previous frame
+        # contents for delayed access, the buffer is still exported: leave
+        # it untouched and start the new frame with a new io.BytesIO
+        # instance instead.
+        f.seek(0)
+        try:
+            f.write(b'')
+        except BufferError:
+            self.current_frame = self._new_frame(f)
+
+    def _new_frame(self, exported):
+        # Return a frame buffer to use instead of *exported*: a pooled one
+        # that is no longer exported, or a new one.  With background_io
+        # the views of the queued frames are only released once they are
+        # written, so that the pool takes turns with them.
+        pool = self._frame_pool
+        for i, f in enumerate(pool):
+            try:
+                f.write(b'')
+            except BufferError:
+                continue
+            pool[i] = exported
+            return f
+        if len(pool) < self.frame_pool_size:
+            pool.append(exported)
+        return io.BytesIO()
+
+    def _write_chunks(self, chunks):
+        writev = self.file_writev
+        if writev is not None:
+            writev(chunks)
+        else:
+            write = self.file_write
+            for chunk in chunks:
+                write(chunk)
 
     def write(self, data):
         if self.current_frame:
@@ -239,26 +338,235 @@ class _Framer:
             return self.file_write(data)
 
     def write_large_bytes(self, header, payload):
-        write = self.file_write
-        if self.current_frame:
-            # Terminate the current frame and flush it to the file.
-            self.commit_frame(force=True)
-
         # Perform direct write of the header and payload of the large binary
         # object. Be careful not to concatenate the header and the payload
         # prior to calling 'write' as we do not want to allocate a large
         # temporary bytes object.
         # We intentionally do not insert a protocol 4 frame opcode to make
         # it possible to optimize file.read calls in the loader.
-        write(header)
-        write(payload)
+        if self.current_frame:
+            # Terminate the current frame and flush it to the file together
+            # with the header and the payload.
+            self._write_frame(header, payload)
+        else:
+            self._write_chunks((header, payload))
+
+
+class _CountingFrame:
+    """Stand-in for a frame buffer that only counts the bytes written."""
+
+    __slots__ = ('size',)
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        n = len(data)
+        self.size += n
+        return n
+
+    def tell(self):
+        return self.size
+
+class _CountingFramer(_Framer):
+    """Framer that computes the size of the pickle without writing it.
+
+    Frames are committed at exactly the same points as by _Framer, so the
+    FRAME headers are accounted for, but no frame buffer is kept.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.file_writev = None
+        self.current_frame = None
+
+    def file_write(self, data):
+        self.size += len(data)
+
+    def start_framing(self):
+        self.framed = True
+        self.current_frame = _CountingFrame()
+
+    def end_framing(self):
+        if self.current_frame and self.current_frame.tell() > 0:
+            self.commit_frame(force=True)
+        self.current_frame = None
+
+    def _write_frame(self, *trailer, last=False):
+        f = self.current_frame
+        if self.framed and f.size >= self._FRAME_SIZE_MIN:
+            self.size += len(FRAME) + 8
+        self.size += f.size
+        for chunk in trailer:
+            self.size += len(chunk)
+        f.size = 0
+
+
+def _gather_writer(file):
+    """Return a function writing a list of buffers to *file* at once.
+
+    Scatter-gather output is used for unbuffered files and sockets, where
+    every write() is a system call: os.writev() or socket.sendmsg() then
+    sends a frame header, the frame and a large payload with one call.
+    Returns None for any other file object, whose write() is used instead.
+    """
+    writev = None
+    if isinstance(file, io.FileIO) and hasattr(os, 'writev'):
+        try:
+            writev = partial(os.writev, file.fileno())
+        except ValueError:  # closed file
+            return None
+    else:
+        # Do not import socket just to find out that file is not one.
+        socket = sys.modules.get('socket')
+        if socket is not None and isinstance(file, socket.SocketIO):
+            writev = getattr(getattr(file, '_sock', None), 'sendmsg', None)
+    if writev is None:
+        return None
+
+    def write_all(buffers):
+        # Both calls may write only part of the data; resume after the
+        # last byte written.
+        buffers = list(buffers)
+        while True:
+            n = writev(buffers)
+            i = 0
+            while i < len(buffers) and n >= len(buffers[i]):
+                n -= len(buffers[i])
+                i += 1
+            if i == len(buffers):
+                return
+            buffers[:i + 1] = [memoryview(buffers[i])[n:]]
+    return write_all
+
+
+class _ChecksumWriter:
+    """Write target that keeps the CRC32 and size of what it writes.
+
+    Used by the checksum mode for protocols 0 to 3, which have no frames:
+    finish() writes them in a trailer after the pickle,
+
+        _CHECKSUM, size (8 bytes) and CRC32 (4 bytes), little-endian
+
+    which unpicklers do not read; verify() finds it at the end of the file.
+    """
+
+    def __init__(self, file_write):
+        self.file_write = file_write
+        self.crc = 0
+        self.size = 0
+
+    def start(self):
+        self.crc = 0
+        self.size = 0
+
+    def write(self, data):
+        self.crc = crc32(data, self.crc)
+        self.size += len(data)
+        return self.file_write(data)
+
+    def finish(self):
+        self.file_write(_CHECKSUM + pack("<QI", self.size, self.crc))
+
+
+# Number of writes that the background_io mode queues before dump() waits.
+_BACKGROUND_QUEUE_DEPTH = 4
+
+class _BackgroundWriter:
+    """Write target handing what it writes to a writer thread.
+
+    Between start() and finish(), write() and writev() put the data on a
+    queue of at most _BACKGROUND_QUEUE_DEPTH items, waiting while it is
+    full, and a thread writes them to the file in order, so that file and
+    socket writes, which release the GIL, overlap with the pickling.  The
+    data is not copied: the frames are views of the frame buffers, which
+    _Framer does not reuse while they are exported.  The exception raised
+    by a failed write is re-raised by the next call, or by finish(), and
+    the data queued after it is dropped.
+    """
+
+    def __init__(self, file_write, file_writev=None):
+        self.file_write = file_write
+        self.file_writev = file_writev
+        self.queue = None
+        self.thread = None
+        self.failed = False
+        self.error = None
+
+    def start(self):
+        import queue
+        import threading
+        self.queue = queue.Queue(_BACKGROUND_QUEUE_DEPTH)
+        self.failed = False
+        self.error = None
+        self.thread = threading.Thread(target=self._run,
+                                       name="pickle writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        get = self.queue.get
+        while True:
+            item = get()
+            if item is None:
+                return
+            if not self.failed:
+                try:
+                    if type(item) is list:
+                        self._write_chunks(item)
+                    else:
+                        self.file_write(item)
+                except BaseException as e:
+                    self.error = e
+                    self.failed = True
+            # Release the frame buffer before waiting for the next item.
+            item = None
+
+    def _write_chunks(self, chunks):
+        writev = self.file_writev
+        if writev is not None:
+            writev(chunks)
+        else:
+            write = self.file_write
+            for chunk in chunks:
+                write(chunk)
+
+    def _raise_error(self):
+        error = self.error
+        self.error = None
+        raise error
+
+    def write(self, data):
+        if self.thread is None:
+            self.file_write(data)
+            return
+        if self.error is not None:
+            self._raise_error()
+        self.queue.put(data)
+
+    def writev(self, chunks):
+        if self.thread is None:
+            self._write_chunks(chunks)
+            return
+        if self.error is not None:
+            self._raise_error()
+        self.queue.put(list(chunks))
+
+    def finish(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.queue = None
+        if self.error is not None:
+            self._raise_error()
 
 
 class _Unframer:
 
-    def __init__(self, file_read, file_readline, file_tell=None):
+    def __init__(self, file_read, file_readline, file_tell=None,
+                 file_readinto=None):
         self.file_read = file_read
         self.file_readline = file_readline
+        self.file_readinto = file_readinto
         self.current_frame = None
 
     def readinto(self, buf):
@@ -273,6 +581,17 @@ class _Unframer:
                 raise UnpicklingError(
                     "pickle exhausted before end of frame")
             return n
+        elif self.file_readinto is not None:
+            # Read straight into buf, without an intermediate bytes object.
+            n = len(buf)
+            with memoryview(buf) as m:
+                pos = 0
+                while pos < n:
+                    k = self.file_readinto(m[pos:])
+                    if not k:
+                        raise UnpicklingError("pickle data was truncated")
+                    pos += k
+            return n
         else:
             n = len(buf)
             buf[:] = self.file_read(n)
@@ -304,11 +623,212 @@ class _Unframer:
         else:
             return self.file_readline()
 
-    def load_frame(self, frame_size):
+    def load_frame(self, frame_size, checksum=None):
         if self.current_frame and self.current_frame.read() != b'':
             raise UnpicklingError(
                 "beginning of a new frame before end of current frame")
-        self.current_frame = io.BytesIO(self.file_read(frame_size))
+        data = self.file_read(frame_size)
+        if checksum is not None:
+            # Check the whole frame before any of its opcodes is run.
+            if len(data) < frame_size:
+                raise UnpicklingError("pickle data was truncated")
+            if crc32(data) != checksum:
+                raise UnpicklingError("frame checksum mismatch")
+        self.current_frame = io.BytesIO(data)
+
+
+# Frame compression codecs, by name and by id in the container header.
+_CODECS = {'zlib': 1, 'bz2': 2, 'lzma': 3}
+_CODEC_NAMES = {v: k for k, v in _CODECS.items()}
+
+_COMPRESSED_BLOCK_SIZE = 256 * 1024
+_BLOCK_HEADER_SIZE = 9
+
+class _FrameCompressor:
+    """Write target that compresses the pickle stream in blocks.
+
+    The frames written between start() and finish() are collected into
+    blocks of about _COMPRESSED_BLOCK_SIZE bytes, which are compressed on a
+    thread pool (the zlib, bz2 and lzma compressors release the GIL) and
+    written to the file in order after a container header:
+
+        _COMPRESSED, codec id (1 byte)
+        for each block: flags (1 byte), compressed size and raw size
+                        (4-byte little-endian each), compressed data
+
+    Bit 0 of flags marks the last block, so that the reader never reads
+    past the container.  The newest block is therefore held back until
+    the next one is submitted or finish() is called.
+    """
+
+    def __init__(self, file_write, codec, max_workers=None):
+        self.file_write = file_write
+        self.codec_id = _CODECS[codec]
+        self.compress = __import__(codec).compress
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = None
+        self.pieces = []
+        self.size = 0
+        self.pending = []
+
+    def start(self):
+        self.pieces = []
+        self.size = 0
+        self.pending = []
+        self.file_write(_COMPRESSED + pack("<B", self.codec_id))
+
+    def write(self, data):
+        n = len(data)
+        if n < _COMPRESSED_BLOCK_SIZE:
+            # Kept past the call, so that views (of the frame buffer or of
+            # a buffer payload) are copied.
+            if type(data) is not bytes:
+                data = bytes(data)
+            self.pieces.append(data)
+            self.size += n
+            if self.size >= _COMPRESSED_BLOCK_SIZE:
+                self._submit_pieces()
+            return
+        # A large bytes payload: split it without copying.
+        self._submit_pieces()
+        m = memoryview(data).cast("B")
+        for i in range(0, n, _COMPRESSED_BLOCK_SIZE):
+            self._submit(m[i:i + _COMPRESSED_BLOCK_SIZE])
+
+    def _submit_pieces(self):
+        if self.pieces:
+            data = b"".join(self.pieces)
+            self.pieces = []
+            self.size = 0
+            self._submit(data)
+
+    def _submit(self, data):
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(self.max_workers)
+        pending = self.pending
+        pending.append((len(data), self.executor.submit(self.compress, data)))
+        while len(pending) > 1 and (len(pending) > 2 * self.max_workers
+                                    or pending[0][1].done()):
+            self._write_block(pending.pop(0), False)
+
+    def _write_block(self, block, last):
+        size, data = block
+        if not isinstance(data, bytes_types):
+            data = data.result()
+        self.file_write(pack("<BII", last, len(data), size))
+        self.file_write(data)
+
+    def finish(self):
+        if not self.pending:
+            # Small pickles fit in one block, compress it right here.
+            data = b"".join(self.pieces)
+            self._write_block((len(data), self.compress(data)), True)
+        else:
+            self._submit_pieces()
+            pending = self.pending
+            while pending:
+                self._write_block(pending.pop(0), len(pending) == 0)
+        self.close()
+
+    def close(self):
+        # Shut down the thread pool, also when pickling failed before
+        # finish().
+        for size, data in self.pending:
+            data.cancel()
+        self.pieces = []
+        self.size = 0
+        self.pending = []
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+class _FrameDecompressor:
+    """Read the blocks written by _FrameCompressor.
+
+    While a block is being read, up to max_workers following blocks are
+    read from the file and decompressed ahead on a thread pool.  The file
+    is not read past the last block of the container.
+    """
+
+    def __init__(self, file_read, codec_id, max_workers=None):
+        try:
+            codec = _CODEC_NAMES[codec_id]
+        except KeyError:
+            raise UnpicklingError(
+                "unknown compression codec: %d" % codec_id) from None
+        self.decompress = __import__(codec).decompress
+        self.file_read = file_read
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = None
+        self.pending = []
+        self.seen_last = False
+        self.current = io.BytesIO()
+
+    def _fetch(self):
+        header = self.file_read(_BLOCK_HEADER_SIZE)
+        if len(header) < _BLOCK_HEADER_SIZE:
+            raise UnpicklingError("pickle data was truncated")
+        flags, csize, size = unpack("<BII", header)
+        data = self.file_read(csize)
+        if len(data) < csize:
+            raise UnpicklingError("pickle data was truncated")
+        self.seen_last = flags & 1
+        if self.seen_last and not self.pending:
+            self.pending.append((size, self.decompress(data)))
+            return
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(self.max_workers)
+        self.pending.append((size, self.executor.submit(self.decompress,
+                                                         data)))
+
+    def _next_block(self):
+        if not self.pending:
+            if self.seen_last:
+                return False
+            self._fetch()
+        while not self.seen_last and len(self.pending) <= self.max_workers:
+            self._fetch()
+        size, data = self.pending.pop(0)
+        if not isinstance(data, bytes_types):
+            data = data.result()
+        if len(data) != size:
+            raise UnpicklingError("compressed block has the wrong size")
+        self.current = io.BytesIO(data)
+        return True
+
+    def read(self, n):
+        data = self.current.read(n)
+        if len(data) == n:
+            return data
+        chunks = [data]
+        n -= len(data)
+        while n and self._next_block():
+            data = self.current.read(n)
+            chunks.append(data)
+            n -= len(data)
+        return b"".join(chunks)
+
+    def readline(self):
+        line = self.current.readline()
+        chunks = [line]
+        while not line.endswith(b'\n') and self._next_block():
+            line = self.current.readline()
+            chunks.append(line)
+        return b"".join(chunks)
+
+    def close(self):
+        # Drop the blocks decompressed ahead; shutdown() has no
+        # cancel_futures argument before Python 3.9.
+        for size, data in self.pending:
+            if not isinstance(data, bytes_types):
+                data.cancel()
+        self.pending = []
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
 
 
 # Tools used for pickling.
@@ -346,6 +866,104 @@ def whichmodule(obj, name):
             pass
     return '__main__'
 
+# Cache of the name lookups done by save_global(), mapping (id(obj), name)
+# to (obj, module, attribute path, module_name, name, extension code or
+# None), where name is relative to the module and obj is found in module
+# by following the attribute path.  Entries keep obj alive so that its id
+# cannot be reused, and are only used while the path still leads to obj:
+# after a name on it has been rebound, the lookup is done again and fails.  The cache is dropped
+# whenever a module is imported or removed or an extension code is
+# registered, which is detected by the sizes of sys.modules and copyreg's
+# extension registry.
+_global_cache = {}
+_global_cache_stamp = None
+_GLOBAL_CACHE_SIZE = 1024
+
+def _resolve_global(obj, name):
+    """Return (module_name, name, extension code) for pickling obj by name.
+
+    Raises PicklingError if obj cannot be found as module_name.name.
+    """
+    global _global_cache_stamp
+    stamp = (len(sys.modules), len(_extension_registry))
+    if stamp != _global_cache_stamp:
+        _global_cache.clear()
+        _global_cache_stamp = stamp
+    key = (id(obj), name)
+    entry = _global_cache.get(key)
+    if entry is not None:
+        x = entry[1]
+        for attr in entry[2]:
+            x = getattr(x, attr, None)
+        if x is obj:
+            return entry[3:]
+
+    module_name = whichmodule(obj, name)
+    try:
+        __import__(module_name, level=0)
+        module = sys.modules[module_name]
+        obj2, parent = _getattribute(module, name)
+    except (ImportError, KeyError, AttributeError):
+        raise PicklingError(
+            "Can't pickle %r: it's not found as %s.%s" %
+            (obj, module_name, name)) from None
+    else:
+        if obj2 is not obj:
+            raise PicklingError(
+                "Can't pickle %r: it's not the same object as %s.%s" %
+                (obj, module_name, name))
+    code = _extension_registry.get((module_name, name))
+    path = tuple(name.split('.'))
+    if parent is module:
+        name = path[-1]
+
+    if len(_global_cache) >= _GLOBAL_CACHE_SIZE:
+        _global_cache.clear()
+    if stamp == (len(sys.modules), len(_extension_registry)):
+        _global_cache[key] = (obj, module, path, module_name, name, code)
+    return module_name, name, code
+
+# Fast paths of _Pickler for common stdlib value types, by type, used
+# after the dispatch tables and reducer_override().  Types are registered
+# once their module is imported, which is detected by the size of
+# sys.modules, so that this module does not import them itself.  Only the
+# exact types are registered, since subclasses may reduce differently.
+_FAST_REDUCER_TYPES = [
+    ('datetime', ('date', 'time', 'datetime'), '_fast_save_datetime'),
+    ('datetime', ('timedelta',), '_fast_save_timedelta'),
+    ('decimal', ('Decimal',), '_fast_save_decimal'),
+    ('_pydecimal', ('Decimal',), '_fast_save_decimal'),
+    ('uuid', ('UUID',), '_fast_save_uuid'),
+    ('pathlib', ('PurePosixPath', 'PureWindowsPath', 'PosixPath',
+                 'WindowsPath'), '_fast_save_path'),
+]
+_fast_reducers = {}
+_fast_reducers_stamp = None
+_enum_reduce_ex = _Enum.__reduce_ex__
+
+def _fast_reducer(t):
+    global _fast_reducers_stamp
+    f = _fast_reducers.get(t)
+    if f is not None:
+        return f
+    if len(sys.modules) != _fast_reducers_stamp:
+        _fast_reducers_stamp = len(sys.modules)
+        for module_name, names, method in _FAST_REDUCER_TYPES:
+            module = sys.modules.get(module_name)
+            if module is not None:
+                for name in names:
+                    cls = getattr(module, name, None)
+                    if cls is not None:
+                        _fast_reducers[cls] = getattr(_Pickler, method)
+        f = _fast_reducers.get(t)
+        if f is not None:
+            return f
+    # Enum members, unless their class reduces them differently
+    if (type(t) is _EnumType
+            and getattr(t, '__reduce_ex__', None) is _enum_reduce_ex):
+        return _Pickler._fast_save_enum
+    return None
+
 def encode_long(x):
     r"""Encode a long to a two's complement little-endian binary string.
     Note that 0 is a special case, returning an empty string, to save a
@@ -399,12 +1017,49 @@ def decode_long(data):
 
 _NoValue = object()
 
+# Opcodes and codecs for the argument forms of protocols 0-3, looked up
+# instead of being built for each object.
+_BINPUTS = [BINPUT + bytes([i]) for i in range(256)]
+_BINGETS = [BINGET + bytes([i]) for i in range(256)]
+_raw_unicode_escape_encode = codecs.raw_unicode_escape_encode
+_raw_unicode_escape_decode = codecs.raw_unicode_escape_decode
+_FALSE_ARG = FALSE[1:]
+_TRUE_ARG = TRUE[1:]
+
+
+class _StreamMemo(dict):
+    """Pickler memo that can forget its entries but not their indices.
+
+    Memo indices are assigned from len(memo) and must stay unique within
+    the stream, so forgotten entries still count towards the length.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.forgotten = 0
+
+    def __len__(self):
+        return dict.__len__(self) + self.forgotten
+
+    def forget(self):
+        self.forgotten = len(self)
+        dict.clear(self)
+
+    def clear(self):
+        self.forgotten = 0
+        dict.clear(self)
+
 # Pickling machinery
 
 class _Pickler:
 
     def __init__(self, file, protocol=None, *, fix_imports=True,
-                 buffer_callback=None):
+                 buffer_callback=None, packed_sequences=False,
+                 canonical=False, sort_dicts=False, compression=None,
+                 compression_workers=None, iterative=False,
+                 out_of_band_threshold=None, write_buffer_size=None,
+                 compact_records=False, dedupe_values=False,
+                 minimal_memo=False, checksum=False, background_io=False):
         """This takes a binary file for writing a pickle data stream.
 
         The optional *protocol* argument tells the pickler to use the
@@ -437,6 +1092,90 @@ class _Pickler:
 
         It is an error if *buffer_callback* is not None and *protocol*
         is None or smaller than 5.
+
+        If *packed_sequences* is true and *protocol* is 3 or higher, lists
+        and tuples of at least 16 ints (that fit in 64 bits) or at least 16
+        floats are written as a single packed array payload instead of one
+        opcode per element.  They still load as lists and tuples with any
+        unpickler.
+
+        If *canonical* is true, the elements of sets and frozensets are
+        written in a total order that only depends on their values, so that
+        equal objects give identical pickles regardless of insertion order
+        or hash randomization.  If *sort_dicts* is also true, dict items are
+        written in key order as well (dicts then load in that order).  It is
+        an error if *sort_dicts* is true and *canonical* is false.
+
+        If *compression* is 'zlib', 'bz2' or 'lzma', the frames are
+        compressed with that codec on a pool of *compression_workers*
+        threads and written inside a container that only this module's
+        Unpickler can read.  It is an error if *compression* is not None
+        and *protocol* is smaller than 4.
+
+        If *iterative* is true, dump() walks containers and reduce values
+        with an explicit stack instead of recursive save() calls, so that
+        arbitrarily deep structures can be pickled without hitting the
+        recursion limit.  The output is the same.
+
+        If *out_of_band_threshold* is not None, bytes and bytearray objects
+        of at least that many bytes are passed to *buffer_callback* as
+        PickleBuffer objects, like explicit PickleBuffer objects are.  Those
+        that the callback takes out-of-band load as memoryviews of the
+        buffers given to the Unpickler (read-only for bytes).  It is an
+        error if *out_of_band_threshold* is not None and *buffer_callback*
+        is None.
+
+        With protocols 0 to 3, which have no frames, dump() collects the
+        output in a buffer and writes it to *file* in chunks of about
+        *write_buffer_size* bytes (64 KiB if None), rather than with one
+        write() call per opcode.  The bytes written are the same.  A
+        *write_buffer_size* of 0 disables the buffer.
+
+        If *compact_records* is true, runs of at least 16 dicts with the
+        same keys in the same order, or of instances of a class pickled by
+        their __dict__ with the same attributes, inside a list are written
+        column-wise: the keys once, then one list of values per key (packed
+        like with *packed_sequences* if the values are all ints or all
+        floats and *protocol* is 3 or higher).  They load as equal dicts and
+        instances with any unpickler that can import this module.  Records
+        that are also referenced from elsewhere are written as usual, so
+        that they keep their identity.
+
+        If *dedupe_values* is true, str, bytes, float and large int objects
+        and tuples of those that are equal to a value already pickled are
+        written as a reference to it, even when they are distinct objects.
+        The values are remembered in a table of at most 65536 entries, the
+        least recently used first evicted, and only those of at most 256
+        characters, bytes or items are.
+
+        If *minimal_memo* is true, dump() traverses the object twice: a
+        first pass only counts the output, and records which memoized
+        objects are referenced again; the second pass writes the pickle
+        and only memoizes those, like pickletools.optimize() would, so that
+        the pickle is smaller and faster to load.  persistent_id() and the
+        reduce methods are called in both passes and must return the same
+        values.  A later dump() with the same memo can only refer to the
+        objects memoized this way.  dump_iter() memoizes as usual.  It is
+        an error if *minimal_memo* is true and *dedupe_values* is true or
+        *buffer_callback* is not None.
+
+        If *checksum* is true, every frame is written with a CRC32 of its
+        contents, large bytes and str payloads included, in an opcode that
+        only this module's Unpickler can read; it checks each frame before
+        running any of its opcodes, so that a corrupted pickle is rejected
+        before a partial object graph is built.  With protocols 0 to 3,
+        which have no frames, the CRC32 of the pickle is written in a
+        trailer after it instead, which unpicklers do not read.  verify()
+        checks either without unpickling.  It is an error if *checksum* is
+        true and *compression* is not None.
+
+        If *background_io* is true, dump() hands the frames to a writer
+        thread through a queue of at most 4 of them, and pickles the next
+        ones while they are written to *file*; file and socket writes
+        release the GIL, so that pickling and I/O overlap.  dump() returns
+        once everything is written, and raises the exception of a failed
+        write, at the latest when it returns.  It is an error if
+        *background_io* is true and *write_buffer_size* is 0.
         """
         if protocol is None:
             protocol = DEFAULT_PROTOCOL
@@ -446,12 +1185,53 @@ class _Pickler:
             raise ValueError("pickle protocol must be <= %d" % HIGHEST_PROTOCOL)
         if buffer_callback is not None and protocol < 5:
             raise ValueError("buffer_callback needs protocol >= 5")
+        if sort_dicts and not canonical:
+            raise ValueError("sort_dicts needs canonical=True")
+        if out_of_band_threshold is not None and buffer_callback is None:
+            raise ValueError("out_of_band_threshold needs buffer_callback")
+        if minimal_memo and dedupe_values:
+            raise ValueError("minimal_memo needs dedupe_values=False")
+        if minimal_memo and buffer_callback is not None:
+            raise ValueError("minimal_memo needs buffer_callback=None")
+        if checksum and compression is not None:
+            raise ValueError("checksum needs compression=None")
+        if compression is not None:
+            if compression not in _CODECS:
+                raise ValueError("unknown compression codec: %r"
+                                 % (compression,))
+            if protocol < 4:
+                raise ValueError("compression needs protocol >= 4")
+        if write_buffer_size is None:
+            write_buffer_size = _Framer._FRAME_SIZE_TARGET
+        elif write_buffer_size < 0:
+            raise ValueError("write_buffer_size must be >= 0")
+        elif background_io and write_buffer_size == 0:
+            raise ValueError("background_io needs write_buffer_size > 0")
         self._buffer_callback = buffer_callback
         try:
             self._file_write = file.write
         except AttributeError:
             raise TypeError("file must have a 'write' attribute")
-        self.framer = _Framer(self._file_write)
+        file_writev = _gather_writer(file)
+        self._background = None
+        if background_io:
+            self._background = _BackgroundWriter(self._file_write,
+                                                 file_writev)
+            self._file_write = self._background.write
+            file_writev = self._background.writev
+        self._compressor = None
+        self._checksummer = None
+        if checksum and protocol < 4:
+            self._checksummer = _ChecksumWriter(self._file_write)
+            self.framer = _Framer(self._checksummer.write)
+        elif compression is None:
+            self.framer = _Framer(self._file_write, file_writev, checksum)
+        else:
+            self._compressor = _FrameCompressor(self._file_write, compression,
+                                                compression_workers)
+            self.framer = _Framer(self._compressor.write)
+        if background_io:
+            self.framer.frame_pool_size = _BACKGROUND_QUEUE_DEPTH + 1
         self.write = self.framer.write
         self._write_large_bytes = self.framer.write_large_bytes
         self.memo = {}
@@ -459,6 +1239,45 @@ class _Pickler:
         self.bin = protocol >= 1
         self.fast = 0
         self.fix_imports = fix_imports and protocol < 3
+        self.packed_sequences = packed_sequences and protocol >= 3
+        self.canonical = canonical
+        self.sort_dicts = sort_dicts
+        # Ids of the containers being sorted by _canonical_sorted(), shared
+        # with the picklers of its sort keys.
+        self._canonical_active = set()
+        self.iterative = iterative
+        self._out_of_band_threshold = out_of_band_threshold
+        self.write_buffer_size = write_buffer_size
+        self.compact_records = compact_records
+        # For the compact_records mode: whether each type seen in a list can
+        # be compacted, and the shared key tuples.
+        self._record_classes = {}
+        self._record_keys = {}
+        # The layout of the instances of each class pickled by the default
+        # object.__reduce_ex__(), or None (see _instance_layout()).
+        self._layouts = {}
+        # The _layout_key() of each class in _layouts when its layout was
+        # found, checked by _check_layouts() at the start of each pickle.
+        self._layout_keys = {}
+        # The memo references to the keys of the last state dict of each
+        # layout (see _save_state_dict()).
+        self._state_keys = {}
+        # For the dedupe_values mode: the memo index of each value, keyed
+        # by _value_key(), in least recently used order.
+        self._value_table = {} if dedupe_values else None
+        self.minimal_memo = minimal_memo
+        self.checksum = checksum
+        self.background_io = background_io
+        # For the minimal_memo mode: the types of the objects that the first
+        # pass memoized, in order, and whether each was referenced again
+        # (see _plan_memo()), and the number of memoize() calls so far.
+        self._memo_plan = None
+        self._memo_calls = 0
+        # True while dump() runs the specialized save loop.
+        self._fast_saving = False
+        # The per-object hooks are looked up once, here, to decide whether
+        # dump() may use the specialized save loop (see _save_fast()).
+        self._fast_save_ok = self._hooks_allow_fast_save()
 
     def clear_memo(self):
         """Clears the pickler's "memo".
@@ -469,6 +1288,8 @@ class _Pickler:
         useful when re-using picklers.
         """
         self.memo.clear()
+        if self._value_table is not None:
+            self._value_table.clear()
 
     def dump(self, obj):
         """Write a pickled representation of obj to the open file."""
@@ -477,13 +1298,187 @@ class _Pickler:
         if not hasattr(self, "_file_write"):
             raise PicklingError("Pickler.__init__() was not called by "
                                 "%s.__init__()" % (self.__class__.__name__,))
-        if self.proto >= 2:
-            self.write(PROTO + pack("<B", self.proto))
-        if self.proto >= 4:
-            self.framer.start_framing()
+        if self.iterative:
+            func = _Pickler._save_iterative
+        else:
+            func = _Pickler._save_top
+        self._check_layouts()
+        if self.minimal_memo:
+            self._memo_plan = self._plan_memo(func, obj)
+            self._memo_calls = 0
+        try:
+            self._write_pickle(func, obj)
+        finally:
+            self._memo_plan = None
+
+    def _check_layouts(self):
+        # Forget the layouts of the classes whose pickling hooks were
+        # assigned or deleted since the layout was found, so that the next
+        # instance finds it again.  The classes are not checked during a
+        # pickle: a hook changed by a __reduce__() only applies from the
+        # next one.
+        stale = [t for t, key in self._layout_keys.items()
+                 if key != _layout_key(t)]
+        if stale:
+            for t in stale:
+                del self._layouts[t], self._layout_keys[t]
+            # They may hold the keys of a state dict of a dropped layout.
+            self._state_keys.clear()
+
+    def dump_iter(self, iterable, kind="list"):
+        """Write a pickled list, dict or set built from iterable.
+
+        The items are pulled from *iterable* in batches and pickled as they
+        arrive, so the container never has to exist on the pickling side;
+        the pickle loads as a normal container.  For kind="dict" the items
+        are (key, value) pairs.
+
+        To keep memory bounded the memo is emptied after each batch, so an
+        object shared by items of different batches is pickled once per
+        batch rather than by reference.
+        """
+        if kind not in ("list", "dict", "set"):
+            raise ValueError("kind must be 'list', 'dict' or 'set', not %r"
+                             % (kind,))
+        if not hasattr(self, "_file_write"):
+            raise PicklingError("Pickler.__init__() was not called by "
+                                "%s.__init__()" % (self.__class__.__name__,))
+        if not isinstance(self.memo, _StreamMemo):
+            self.memo = _StreamMemo(self.memo)
+        self._check_layouts()
+        self._write_pickle(_Pickler._save_iter, iterable, kind)
+
+    def _write_pickle(self, func, *args):
+        # Write the pickle of the objects saved by func(self, *args): the
+        # protocol header, the frames, the STOP opcode and the compression
+        # or checksum container around them.
+        background = self._background
+        if background is not None:
+            background.start()
+        try:
+            if self._compressor is not None:
+                self._compressor.start()
+            if self._checksummer is not None:
+                self._checksummer.start()
+            if self.proto < 4 and self.write_buffer_size:
+                self.framer.start_buffering(self.write_buffer_size)
+            if self.proto >= 2:
+                self.write(PROTO + pack("<B", self.proto))
+            if self.proto >= 4:
+                self.framer.start_framing()
+            self._run_saves(func, *args)
+            self.write(STOP)
+            self.framer.end_framing()
+            if self._compressor is not None:
+                self._compressor.finish()
+            if self._checksummer is not None:
+                self._checksummer.finish()
+        finally:
+            # Also when pickling failed, so that no thread is left waiting;
+            # the frames queued before are written out first, as they would
+            # have been without the writer thread.
+            if self._compressor is not None:
+                self._compressor.close()
+            if background is not None:
+                background.finish()
+
+    def _run_saves(self, func, *args):
+        # Call func(self, *args).  When no per-object hook is active, the
+        # recursive self.save() calls made by the dispatch handlers are
+        # routed through the specialized loop for the duration of the call.
+        if not self._fast_save_ok or vars(self).keys() & _PER_OBJECT_HOOKS:
+            func(self, *args)
+            return
+        self.save = self._save_fast
+        self._fast_saving = True
+        try:
+            func(self, *args)
+        finally:
+            del self.save
+            self._fast_saving = False
+
+    def _save_top(self, obj):
         self.save(obj)
-        self.write(STOP)
-        self.framer.end_framing()
+
+    def _plan_memo(self, func, obj):
+        # First pass of the minimal_memo mode: run func(self, obj) with the
+        # output only counted, and record which of the objects memoized by
+        # memoize() are read back from the memo.  All the GET opcodes are
+        # made by get(), and the memo keys made by this pass are the
+        # numbers of the memoize() calls, after those of the current memo.
+        framer = self.framer
+        memo = self.memo
+        base = len(memo)
+        reads = set()
+        get = self.get
+
+        def counting_get(i):
+            reads.add(i)
+            return get(i)
+        # The writers may be wrappers installed on the instance (by a
+        # profiler, say), which are put back as they were.
+        write = self.write
+        write_large_bytes = self._write_large_bytes
+        counter = _CountingFramer()
+        self.framer = counter
+        self.write = counter.write
+        self._write_large_bytes = counter.write_large_bytes
+        self.memo = dict(memo)
+        self.get = counting_get
+        try:
+            self._run_saves(func, obj)
+            types = [None] * (len(self.memo) - base)
+            for i, x in self.memo.values():
+                if i >= base:
+                    types[i - base] = type(x)
+        finally:
+            del self.get
+            self.memo = memo
+            self.framer = framer
+            self.write = write
+            self._write_large_bytes = write_large_bytes
+        return types, [i + base in reads for i in range(len(types))]
+
+    def _save_iter(self, iterable, kind):
+        # The opened container is never memoized: nothing else in the
+        # pickle can refer to it.
+        write = self.write
+        if kind == "dict":
+            if hasattr(iterable, "items"):
+                iterable = iterable.items()
+            write(EMPTY_DICT if self.bin else MARK + DICT)
+            save_batch = self._batch_setitems
+        elif kind == "set" and self.proto >= 4:
+            write(EMPTY_SET)
+            save_batch = self._batch_additems
+        else:
+            if kind == "set":
+                # set(list), as save_set() writes sets for protocols < 4.
+                self.save(set)
+                if self.proto < 2:
+                    write(MARK)
+            write(EMPTY_LIST if self.bin else MARK + LIST)
+            save_batch = self._batch_appends
+
+        it = iter(iterable)
+        while True:
+            batch = list(islice(it, self._BATCHSIZE))
+            save_batch(batch)
+            self.memo.forget()
+            if len(batch) < self._BATCHSIZE:
+                break
+
+        if kind == "set" and self.proto < 4:
+            write((TUPLE1 if self.proto >= 2 else TUPLE) + REDUCE)
+
+    def _hooks_allow_fast_save(self):
+        # The generic save() consults persistent_id() and reducer_override()
+        # for every object, so the specialized loop may only be used when
+        # neither hook is defined and save() itself is not overridden.
+        cls = type(self)
+        return (cls.save is _Pickler.save
+                and cls.persistent_id is _Pickler.persistent_id
+                and getattr(cls, "reducer_override", _NoValue) is _NoValue)
 
     def memoize(self, obj):
         """Store an object in the memo."""
@@ -502,10 +1497,67 @@ class _Pickler:
         # growable) array, indexed by memo key.
         if self.fast:
             return
+        plan = self._memo_plan
+        if plan is not None:
+            types, reads = plan
+            k = self._memo_calls
+            self._memo_calls = k + 1
+            if k >= len(types) or types[k] is not type(obj):
+                # This pass does not memoize the same objects as the first
+                # one (a reduce value changed): memoize all from here.
+                self._memo_plan = None
+            elif not reads[k]:
+                return
         assert id(obj) not in self.memo
         idx = len(self.memo)
         self.write(self.put(idx))
         self.memo[id(obj)] = idx, obj
+        if self._value_table is not None and type(obj) in _VALUE_TYPES:
+            self._remember_value(obj, idx)
+
+    # Limits of the dedupe_values table: number of values, and length of
+    # each str, bytes or tuple.
+    _DEDUPE_MAX_ENTRIES = 1 << 16
+    _DEDUPE_MAX_LEN = 256
+
+    def _save_equal_value(self, obj):
+        # Helper for the dedupe_values mode, called by the handlers of the
+        # value types before they write anything.  If a value equal to obj
+        # was pickled before, write a reference to it and return True.  Ints
+        # and floats, which are not memoized otherwise, are also written and
+        # memoized here; the other values are remembered by memoize().
+        key = _value_key(obj, self._DEDUPE_MAX_LEN)
+        if key is None:
+            return False
+        table = self._value_table
+        idx = table.pop(key, None)
+        if idx is None:
+            t = type(obj)
+            if t is not int and t is not float:
+                return False
+            x = self.memo.get(id(obj))
+            if x is None:
+                # Write obj with its handler, the table disabled.
+                self._value_table = None
+                try:
+                    self.dispatch[t](self, obj)
+                finally:
+                    self._value_table = table
+                self.memoize(obj)
+                return True
+            # Evicted from the table, but the same object.
+            idx = x[0]
+        table[key] = idx
+        self.write(self.get(idx))
+        return True
+
+    def _remember_value(self, obj, idx):
+        key = _value_key(obj, self._DEDUPE_MAX_LEN)
+        if key is not None:
+            table = self._value_table
+            table[key] = idx
+            if len(table) > self._DEDUPE_MAX_ENTRIES:
+                del table[next(iter(table))]
 
     # Return a PUT (BINPUT, LONG_BINPUT) opcode string, with argument i.
     def put(self, idx):
@@ -513,21 +1565,21 @@ class _Pickler:
             return MEMOIZE
         elif self.bin:
             if idx < 256:
-                return BINPUT + pack("<B", idx)
+                return _BINPUTS[idx]
             else:
                 return LONG_BINPUT + pack("<I", idx)
         else:
-            return PUT + repr(idx).encode("ascii") + b'\n'
+            return b'p%d\n' % idx  # PUT
 
     # Return a GET (BINGET, LONG_BINGET) opcode string, with argument i.
     def get(self, i):
         if self.bin:
             if i < 256:
-                return BINGET + pack("<B", i)
+                return _BINGETS[i]
             else:
                 return LONG_BINGET + pack("<I", i)
 
-        return GET + repr(i).encode("ascii") + b'\n'
+        return b'g%d\n' % i  # GET
 
     def save(self, obj, save_persistent_id=True):
         self.framer.commit_frame()
@@ -558,29 +1610,10 @@ class _Pickler:
                 f(self, obj)  # Call unbound method with explicit self
                 return
 
-            # Check private dispatch table if any, or else
-            # copyreg.dispatch_table
-            reduce = getattr(self, 'dispatch_table', dispatch_table).get(t, _NoValue)
-            if reduce is not _NoValue:
-                rv = reduce(obj)
-            else:
-                # Check for a class with a custom metaclass; treat as regular
-                # class
-                if issubclass(t, type):
-                    self.save_global(obj)
-                    return
-
-                # Check for a __reduce_ex__ method, fall back to __reduce__
-                reduce = getattr(obj, "__reduce_ex__", _NoValue)
-                if reduce is not _NoValue:
-                    rv = reduce(self.proto)
-                else:
-                    reduce = getattr(obj, "__reduce__", _NoValue)
-                    if reduce is not _NoValue:
-                        rv = reduce()
-                    else:
-                        raise PicklingError("Can't pickle %r object: %r" %
-                                            (t.__name__, obj))
+            x = self._reduce_value(obj, t)
+            if x is None:
+                return
+            rv, reduce = x
 
         # Check for string returned by reduce(), meaning "save as global"
         if isinstance(rv, str):
@@ -598,8 +1631,431 @@ class _Pickler:
                                 "two to six elements" % reduce)
 
         # Save the reduce() output and finally memoize the object
+        if (self.proto >= 5 and self._buffer_callback is None
+                and reduce is _buffer_reducer(type(obj))):
+            try:
+                self.save_reduce(obj=obj, *rv)
+            finally:
+                _release_buffers(rv[1])
+            return
         self.save_reduce(obj=obj, *rv)
 
+    def _save_fast(self, obj, save_persistent_id=True):
+        # Specialized save() used by dump() when no per-object hook is
+        # active.  Objects whose type is in the dispatch table go straight to
+        # their handler; everything else takes the generic path, so the
+        # output is byte-identical to that of save().
+        framer = self.framer
+        frame = framer.current_frame
+        # Only enter commit_frame() once the frame is actually full.
+        if frame is not None and frame.tell() >= framer._FRAME_SIZE_TARGET:
+            framer.commit_frame()
+
+        t = type(obj)
+        f = _ATOMIC_DISPATCH.get(t)
+        if f is not None and self.dispatch.get(t) is f:
+            # These handlers never memoize, so the memo check is skipped.
+            f(self, obj)
+            return
+
+        x = self.memo.get(id(obj))
+        if x is not None:
+            self.write(self.get(x[0]))
+            return
+
+        f = self.dispatch.get(t)
+        if f is not None:
+            f(self, obj)
+            return
+
+        # A dispatch_table or copyreg entry registered since the layout was
+        # cached takes precedence, as in _reduce_value().
+        layout = self._layouts.get(t)
+        if (layout is not None
+                and t not in getattr(self, 'dispatch_table', dispatch_table)):
+            self._save_instance(obj, t, *layout)
+            return
+
+        _Pickler.save(self, obj, save_persistent_id)
+
+    # Iterative save engine.  The _iter_save_*() methods mirror the
+    # corresponding save_*() methods, but return a generator that yields
+    # the objects that those pass to save() instead of saving them (or None
+    # if there are none); _save_iterative() saves the yielded objects, with
+    # a stack of the generators being run.  Containers and reduce values
+    # nest generators; every other object is saved by its usual handler,
+    # whose own save() calls only ever go a level or two deep.  To keep the
+    # stack small, the handlers that write nothing after their items do
+    # their work up to the items eagerly and return the generator of the
+    # items.
+
+    def _save_iterative(self, obj):
+        save = self.save
+        fast = save == self._save_fast
+        if not fast and getattr(save, '__func__', None) is not _Pickler.save:
+            # save() is overridden and must see every object.
+            save(obj)
+            return
+
+        framer = self.framer
+        target = framer._FRAME_SIZE_TARGET
+        memo = self.memo
+        write = self.write
+        get = self.get
+        dispatch = self.dispatch
+
+        def step(obj):
+            # Like save(obj), but return a generator instead of saving a
+            # container or reduce value.
+            frame = framer.current_frame
+            if frame is not None and frame.tell() >= target:
+                framer.commit_frame()
+            t = type(obj)
+            if fast:
+                f = _ATOMIC_DISPATCH.get(t)
+                if f is not None and dispatch.get(t) is f:
+                    f(self, obj)
+                    return None
+            else:
+                pid = self.persistent_id(obj)
+                if pid is not None:
+                    self.save_pers(pid)
+                    return None
+
+            x = memo.get(id(obj))
+            if x is not None:
+                write(get(x[0]))
+                return None
+
+            rv = NotImplemented
+            reduce = getattr(self, "reducer_override", _NoValue)
+            if reduce is not _NoValue:
+                rv = reduce(obj)
+
+            if rv is NotImplemented:
+                f = dispatch.get(t)
+                if f is not None:
+                    g = _ITERATIVE_DISPATCH.get(t)
+                    if g is not None and f is _Pickler.dispatch[t]:
+                        return g(self, obj)
+                    f(self, obj)
+                    return None
+                x = self._reduce_value(obj, t)
+                if x is None:
+                    return None
+                rv, reduce = x
+
+            if isinstance(rv, str):
+                self.save_global(obj, rv)
+                return None
+            if not isinstance(rv, tuple):
+                raise PicklingError("%s must return string or tuple" % reduce)
+            l = len(rv)
+            if not (2 <= l <= 6):
+                raise PicklingError("Tuple returned by %s must have "
+                                    "two to six elements" % reduce)
+            gen = self._iter_save_reduce(obj=obj, *rv)
+            if (self.proto >= 5 and self._buffer_callback is None
+                    and reduce is _buffer_reducer(t)):
+                gen = _iter_then_release(gen, rv[1])
+            return gen
+
+        # An object can legitimately be entered a second time while it is
+        # being saved, before it is memoized (see save_tuple()).  A third
+        # time means that the recursion never ends, which would raise
+        # RecursionError with save().
+        active = {}
+        stack = []
+        gen = step(obj)
+        key = id(obj)
+        active[key] = 1
+        while gen is not None:
+            for child in gen:
+                child_gen = step(child)
+                if child_gen is not None:
+                    stack.append((gen, key))
+                    gen = child_gen
+                    key = id(child)
+                    n = active.get(key, 0)
+                    if n >= 2:
+                        raise RecursionError(
+                            "maximum recursion depth exceeded while "
+                            "pickling an object")
+                    active[key] = n + 1
+                    break
+            else:
+                n = active.pop(key)
+                if n > 1:
+                    active[key] = n - 1
+                gen, key = stack.pop() if stack else (None, None)
+
+    def _reduce_value(self, obj, t):
+        # The part of save() run for objects without a dispatch entry and
+        # not handled by reducer_override(): return the reduce value and the
+        # function that returned it, or None if obj was saved as a global.
+
+        # Check private dispatch table if any, or else
+        # copyreg.dispatch_table
+        reduce = getattr(self, 'dispatch_table', dispatch_table).get(t, _NoValue)
+        if reduce is not _NoValue:
+            return reduce(obj), reduce
+
+        # Check for a fast path of a common stdlib value type
+        f = _fast_reducer(t)
+        if f is not None:
+            f(self, obj)
+            return None
+
+        # Check for an instance of a class with a cached layout
+        layout = self._layouts.get(t)
+        if layout is not None and not self.iterative:
+            self._save_instance(obj, t, *layout)
+            return None
+
+        # Check for a zero-copy reducer of a buffer-protocol type
+        if self.proto >= 5:
+            reduce = _buffer_reducer(t)
+            if reduce is not None:
+                return reduce(obj), reduce
+
+        # Check for a class with a custom metaclass; treat as regular class
+        if issubclass(t, type):
+            self.save_global(obj)
+            return None
+
+        # Check for a __reduce_ex__ method, fall back to __reduce__
+        reduce = getattr(obj, "__reduce_ex__", _NoValue)
+        if reduce is not _NoValue:
+            rv = reduce(self.proto)
+            if self.proto >= 2 and t not in self._layouts:
+                self._layouts[t] = _instance_layout(t, rv)
+                self._layout_keys[t] = _layout_key(t)
+            return rv, reduce
+        reduce = getattr(obj, "__reduce__", _NoValue)
+        if reduce is not _NoValue:
+            return reduce(), reduce
+        raise PicklingError("Can't pickle %r object: %r" % (t.__name__, obj))
+
+    def _iter_save_reduce(self, func, args, state=None, listitems=None,
+                          dictitems=None, state_setter=None, *, obj=None):
+        # Generator version of save_reduce().
+        if not isinstance(args, tuple):
+            raise PicklingError("args from save_reduce() must be a tuple")
+        if not callable(func):
+            raise PicklingError("func from save_reduce() must be callable")
+
+        write = self.write
+
+        func_name = getattr(func, "__name__", "")
+        if self.proto >= 2 and func_name == "__newobj_ex__":
+            cls, args, kwargs = args
+            if not hasattr(cls, "__new__"):
+                raise PicklingError("args[0] from {} args has no __new__"
+                                    .format(func_name))
+            if obj is not None and cls is not obj.__class__:
+                raise PicklingError("args[0] from {} args has the wrong class"
+                                    .format(func_name))
+            if self.proto >= 4:
+                yield cls
+                yield args
+                yield kwargs
+                write(NEWOBJ_EX)
+            else:
+                func = partial(cls.__new__, cls, *args, **kwargs)
+                yield func
+                yield ()
+                write(REDUCE)
+        elif self.proto >= 2 and func_name == "__newobj__":
+            cls = args[0]
+            if not hasattr(cls, "__new__"):
+                raise PicklingError(
+                    "args[0] from __newobj__ args has no __new__")
+            if obj is not None and cls is not obj.__class__:
+                raise PicklingError(
+                    "args[0] from __newobj__ args has the wrong class")
+            args = args[1:]
+            yield cls
+            yield args
+            write(NEWOBJ)
+        else:
+            yield func
+            yield args
+            write(REDUCE)
+
+        if obj is not None:
+            if id(obj) in self.memo:
+                write(POP + self.get(self.memo[id(obj)][0]))
+            else:
+                self.memoize(obj)
+
+        if listitems is not None:
+            yield from self._iter_batch_appends(listitems)
+
+        if dictitems is not None:
+            yield from self._iter_batch_setitems(dictitems)
+
+        if state is not None:
+            if state_setter is None:
+                yield state
+                write(BUILD)
+            else:
+                yield state_setter
+                yield obj
+                yield state
+                write(TUPLE2)
+                write(REDUCE)
+                write(POP)
+
+    def _iter_save_tuple(self, obj):
+        if self._value_table is not None and self._save_equal_value(obj):
+            return
+        if not obj:
+            self.save_tuple(obj)
+            return
+        n = len(obj)
+        if (self.packed_sequences and n >= self._PACKED_MIN_LEN
+                and self._save_packed(obj)):
+            return
+        memo = self.memo
+        write = self.write
+        if n <= 3 and self.proto >= 2:
+            yield from obj
+            # Subtle.  See save_tuple().
+            if id(obj) in memo:
+                write(POP * n + self.get(memo[id(obj)][0]))
+            else:
+                write(_tuplesize2code[n])
+                self.memoize(obj)
+            return
+
+        write(MARK)
+        yield from obj
+        if id(obj) in memo:
+            get = self.get(memo[id(obj)][0])
+            if self.bin:
+                write(POP_MARK + get)
+            else:   # proto 0 -- POP_MARK not available
+                write(POP * (n+1) + get)
+            return
+        write(TUPLE)
+        self.memoize(obj)
+
+    def _iter_save_list(self, obj):
+        if (self.packed_sequences and len(obj) >= self._PACKED_MIN_LEN
+                and self._save_packed(obj)):
+            return None
+        runs = None
+        if self.compact_records and len(obj) >= self._RECORDS_MIN_LEN:
+            runs = self._record_runs(obj)
+        if self.bin:
+            self.write(EMPTY_LIST)
+        else:   # proto 0 -- can't use EMPTY_LIST
+            self.write(MARK + LIST)
+        self.memoize(obj)
+        if runs:
+            return self._iter_compact_list(obj, runs)
+        return self._iter_batch_appends(obj)
+
+    def _iter_batch_appends(self, items):
+        write = self.write
+        if not self.bin:
+            for x in items:
+                yield x
+                write(APPEND)
+            return
+
+        it = iter(items)
+        while True:
+            tmp = list(islice(it, self._BATCHSIZE))
+            n = len(tmp)
+            if n > 1:
+                write(MARK)
+                yield from tmp
+                write(APPENDS)
+            elif n:
+                yield tmp[0]
+                write(APPEND)
+            if n < self._BATCHSIZE:
+                return
+
+    def _iter_save_dict(self, obj):
+        if self.bin:
+            self.write(EMPTY_DICT)
+        else:   # proto 0 -- can't use EMPTY_DICT
+            self.write(MARK + DICT)
+        self.memoize(obj)
+        if self.sort_dicts:
+            keys = _canonical_sorted(obj, self._canonical_active)
+            items = [(k, obj[k]) for k in keys]
+        else:
+            items = obj.items()
+        return self._iter_batch_setitems(items)
+
+    def _iter_batch_setitems(self, items):
+        write = self.write
+        if not self.bin:
+            for k, v in items:
+                yield k
+                yield v
+                write(SETITEM)
+            return
+
+        it = iter(items)
+        while True:
+            tmp = list(islice(it, self._BATCHSIZE))
+            n = len(tmp)
+            if n > 1:
+                write(MARK)
+                for k, v in tmp:
+                    yield k
+                    yield v
+                write(SETITEMS)
+            elif n:
+                k, v = tmp[0]
+                yield k
+                yield v
+                write(SETITEM)
+            if n < self._BATCHSIZE:
+                return
+
+    def _iter_save_set(self, obj):
+        items = (_canonical_sorted(obj, self._canonical_active)
+                 if self.canonical else obj)
+        if self.proto < 4:
+            return self._iter_save_reduce(set, (list(items),), obj=obj)
+        self.write(EMPTY_SET)
+        self.memoize(obj)
+        return self._iter_batch_additems(items)
+
+    def _iter_batch_additems(self, items):
+        write = self.write
+        it = iter(items)
+        while True:
+            batch = list(islice(it, self._BATCHSIZE))
+            n = len(batch)
+            if n > 0:
+                write(MARK)
+                yield from batch
+                write(ADDITEMS)
+            if n < self._BATCHSIZE:
+                return
+
+    def _iter_save_frozenset(self, obj):
+        items = (_canonical_sorted(obj, self._canonical_active)
+                 if self.canonical else obj)
+        if self.proto < 4:
+            yield from self._iter_save_reduce(frozenset, (list(items),),
+                                              obj=obj)
+            return
+        write = self.write
+        write(MARK)
+        yield from items
+        if id(obj) in self.memo:
+            write(POP_MARK + self.get(self.memo[id(obj)][0]))
+            return
+        write(FROZENSET)
+        self.memoize(obj)
+
     def persistent_id(self, obj):
         # This exists so a subclass can override it
         return None
@@ -731,6 +2187,267 @@ class _Pickler:
                 # the stack.
                 write(POP)
 
+    # Fast paths for common stdlib value types (see _fast_reducer()).  Each
+    # writes what save_reduce() writes for the reduce value of the type,
+    # without looking it up and checking it first.
+
+    @property
+    def _inline_ok(self):
+        # Whether a fast path may write the new objects of a reduce value
+        # in place rather than save them: nothing but the stock handlers
+        # may see them, and they must be memoized as usual.
+        return (self._fast_saving and not self.fast
+                and not self.minimal_memo and self._value_table is None
+                and self._out_of_band_threshold is None)
+
+    def _save_simple_reduce(self, obj, func, args):
+        # save_reduce(func, args, obj=obj) for a func that is neither
+        # __newobj__ nor __newobj_ex__
+        save = self.save
+        save(func)
+        save(args)
+        self.write(REDUCE)
+        x = self.memo.get(id(obj))
+        if x is not None:
+            self.write(POP + self.get(x[0]))
+        else:
+            self.memoize(obj)
+
+    def _fast_save_datetime(self, obj):
+        # date, time and datetime pickle their state as bytes, with the
+        # tzinfo if any.
+        func, args = obj.__reduce_ex__(self.proto)
+        state = args[0]
+        if (not self._inline_ok or self.proto < 3
+                or id(state) in self.memo):
+            self._save_simple_reduce(obj, func, args)
+            return
+        # The state bytes and the argument tuple are new objects, which
+        # save() would write as is and memoize: write them in place.  Frames
+        # are committed at the same points as by save().
+        self.save(func)
+        self.framer.commit_frame()
+        memo = self.memo
+        put = self.put
+        idx = len(memo)
+        memo[id(state)] = idx, state
+        data = SHORT_BINBYTES + pack("<B", len(state)) + state + put(idx)
+        if len(args) == 1:
+            memo[id(args)] = idx + 1, args
+            memo[id(obj)] = idx + 2, obj
+            self.write(data + TUPLE1 + put(idx + 1) + REDUCE + put(idx + 2))
+            return
+        self.write(data)
+        self.save(args[1])
+        self.write(TUPLE2)
+        self.memoize(args)
+        self.write(REDUCE)
+        x = memo.get(id(obj))
+        if x is not None:
+            self.write(POP + self.get(x[0]))
+        else:
+            self.memoize(obj)
+
+    def _fast_save_timedelta(self, obj):
+        self._save_simple_reduce(
+            obj, type(obj), (obj.days, obj.seconds, obj.microseconds))
+
+    def _fast_save_decimal(self, obj):
+        text = str(obj)
+        args = (text,)
+        # Short strings can be shared (e.g. str(Decimal(1))), and then are
+        # saved by reference.
+        if (not self._inline_ok or self.proto < 4 or len(text) > 0xff
+                or id(text) in self.memo):
+            self._save_simple_reduce(obj, type(obj), args)
+            return
+        # Write the (always ASCII) string and the new argument tuple in
+        # place, as in _fast_save_datetime().
+        self.save(type(obj))
+        self.framer.commit_frame()
+        memo = self.memo
+        idx = len(memo)
+        memo[id(text)] = idx, text
+        memo[id(args)] = idx + 1, args
+        memo[id(obj)] = idx + 2, obj
+        self.write(SHORT_BINUNICODE + pack("<B", len(text)) + text.encode()
+                   + MEMOIZE + TUPLE1 + MEMOIZE + REDUCE + MEMOIZE)
+
+    def _fast_save_enum(self, obj):
+        self._save_simple_reduce(obj, type(obj), (obj._value_,))
+
+    def _fast_save_path(self, obj):
+        func, args = obj.__reduce__()
+        self._save_simple_reduce(obj, func, args)
+
+    def _fast_save_uuid(self, obj):
+        if self.proto < 2:
+            self.save_reduce(obj=obj, *obj.__reduce_ex__(self.proto))
+            return
+        # copyreg.__newobj__(UUID) with the state of __getstate__()
+        save = self.save
+        write = self.write
+        save(type(obj))
+        if not self._inline_ok:
+            save(())
+            write(NEWOBJ)
+            self.memoize(obj)
+            save(obj.__getstate__())
+            write(BUILD)
+            return
+        # Write the empty tuple and the new state dict in place, committing
+        # frames at the same points as save().
+        commit_frame = self.framer.commit_frame
+        memo = self.memo
+        commit_frame()
+        idx = len(memo)
+        memo[id(obj)] = idx, obj
+        write(EMPTY_TUPLE + NEWOBJ + self.put(idx))
+        state = obj.__getstate__()
+        commit_frame()
+        idx = len(memo)
+        memo[id(state)] = idx, state
+        write(EMPTY_DICT + self.put(idx))
+        self._batch_setitems(state.items())
+        write(BUILD)
+
+    def _save_instance(self, obj, t, has_dict, slotnames):
+        # save_reduce() of the reduce value of obj returned by the default
+        # object.__reduce_ex__(), that is copyreg.__newobj__(t) with the
+        # state of object.__getstate__(), built from the cached layout of
+        # t (see _instance_layout()).
+        state = obj.__dict__ if has_dict else None
+        if not state:
+            state = None
+        if slotnames:
+            slots = {}
+            for name in slotnames:
+                value = getattr(obj, name, _NoValue)
+                if value is not _NoValue:
+                    slots[name] = value
+            if slots:
+                state = (state, slots)
+        save = self.save
+        write = self.write
+        if not self._inline_ok:
+            save(t)
+            save(())
+            write(NEWOBJ)
+            self.memoize(obj)
+            if state is not None:
+                save(state)
+                write(BUILD)
+            return
+        # Write the class, the empty tuple and the new state in place, as
+        # in _fast_save_uuid(), collecting the pieces that save() would
+        # write between two frame commit points in a list.
+        memo = self.memo
+        pieces = []
+        x = memo.get(id(t))
+        if x is not None:
+            pieces.append(self.get(x[0]))
+        else:
+            save(t)
+        idx = len(memo)
+        memo[id(obj)] = idx, obj
+        pieces.append(EMPTY_TUPLE + NEWOBJ + self.put(idx))
+        if state is None:
+            self._write_pieces(pieces)
+        elif type(state) is tuple:
+            if state[0] is None:
+                pieces.append(NONE)
+            else:
+                self._save_state_dict(state[0], pieces, t)
+                pieces = []
+            self._save_state_dict(state[1], pieces, (t, slotnames))
+            idx = len(memo)
+            memo[id(state)] = idx, state
+            write(TUPLE2 + self.put(idx) + BUILD)
+        else:
+            self._save_state_dict(state, pieces, t)
+            write(BUILD)
+
+    def _save_state_dict(self, obj, pieces, cache_key):
+        # save(obj) for the state dict of an instance, after the pieces of
+        # _save_instance().  The memo references to the keys are cached
+        # under cache_key, for the next dict with the same keys.
+        memo = self.memo
+        if (id(obj) in memo or self.sort_dicts or len(obj) > self._BATCHSIZE
+                or self.dispatch.get(dict) is not _Pickler.dispatch[dict]):
+            self._write_pieces(pieces)
+            self.save(obj)
+            return
+        idx = len(memo)
+        memo[id(obj)] = idx, obj
+        if len(obj) > 1:
+            pieces.append(EMPTY_DICT + self.put(idx) + MARK)
+        else:
+            pieces.append(EMPTY_DICT + self.put(idx))
+        self._write_pieces(pieces)
+
+        framer = self.framer
+        commit_frame = framer.commit_frame
+        # No commit point is crossed by writing the longest GET opcode
+        # below this limit.
+        limit = framer._FRAME_SIZE_TARGET - 5
+        dispatch = self.dispatch
+        save = self.save
+        write = self.write
+        # The keys are compared by identity.  While the memo entry of the
+        # first one is the cached one, the memo has not been cleared and
+        # keeps every key alive, so that their ids are not reused.
+        ids = tuple(map(id, obj))
+        x = self._state_keys.get(cache_key)
+        if x is not None and x[0] == ids and memo.get(ids[0]) is x[1]:
+            gets = x[2]
+        else:
+            gets = None
+        if gets is not None:
+            for key_get, v in zip(gets, obj.values()):
+                frame = framer.current_frame
+                if frame is None:
+                    write(key_get)
+                elif frame.tell() < limit:
+                    frame.write(key_get)
+                else:
+                    commit_frame()
+                    write(key_get)
+                    commit_frame()
+                t = type(v)
+                f = _ATOMIC_DISPATCH.get(t)
+                if f is not None and dispatch.get(t) is f:
+                    f(self, v)
+                else:
+                    save(v)
+        else:
+            for k, v in obj.items():
+                save(k)
+                save(v)
+            entries = [memo.get(i) for i in ids]
+            if entries and None not in entries:
+                self._state_keys[cache_key] = (
+                    ids, entries[0], [self.get(e[0]) for e in entries])
+        if len(obj) > 1:
+            write(SETITEMS)
+        elif obj:
+            write(SETITEM)
+
+    def _write_pieces(self, pieces):
+        # Write the pieces, committing the frame before each of them as
+        # save() would, at once if the frame does not fill up in between.
+        if not pieces:
+            return
+        framer = self.framer
+        frame = framer.current_frame
+        data = b''.join(pieces)
+        if (frame is None or frame.tell() + len(data) - len(pieces[-1])
+                < framer._FRAME_SIZE_TARGET):
+            self.write(data)
+        else:
+            for data in pieces:
+                framer.commit_frame()
+                self.write(data)
+
     # Methods below this point are dispatched through the dispatch table
 
     dispatch = {}
@@ -747,6 +2464,10 @@ class _Pickler:
     dispatch[bool] = save_bool
 
     def save_long(self, obj):
+        if (self._value_table is not None
+                and not -0x80000000 <= obj <= 0x7fffffff
+                and self._save_equal_value(obj)):
+            return
         if self.bin:
             # If the int is small enough to fit in a signed 4-byte 2's-comp
             # format, we can store it more efficiently than the general
@@ -772,21 +2493,23 @@ class _Pickler:
                 self.write(LONG4 + pack("<i", n) + encoded)
             return
         if -0x80000000 <= obj <= 0x7fffffff:
-            self.write(INT + repr(obj).encode("ascii") + b'\n')
+            self.write(b'I%d\n' % obj)  # INT
         else:
-            self.write(LONG + repr(obj).encode("ascii") + b'L\n')
+            self.write(b'L%dL\n' % obj)  # LONG
     dispatch[int] = save_long
 
     def save_float(self, obj):
+        if self._value_table is not None and self._save_equal_value(obj):
+            return
         if self.bin:
             self.write(BINFLOAT + pack('>d', obj))
         else:
-            self.write(FLOAT + repr(obj).encode("ascii") + b'\n')
+            self.write(b'F%a\n' % obj)  # FLOAT
     dispatch[float] = save_float
 
     def _save_bytes_no_memo(self, obj):
-        # helper for writing bytes objects for protocol >= 3
-        # without memoizing them
+        # helper for writing bytes objects (or flat byte views of
+        # read-only buffers) for protocol >= 3 without memoizing them
         assert self.proto >= 3
         n = len(obj)
         if n <= 0xff:
@@ -799,6 +2522,8 @@ class _Pickler:
             self.write(BINBYTES + pack("<I", n) + obj)
 
     def save_bytes(self, obj):
+        if self._value_table is not None and self._save_equal_value(obj):
+            return
         if self.proto < 3:
             if not obj: # bytes object is empty
                 self.save_reduce(bytes, (), obj=obj)
@@ -806,13 +2531,30 @@ class _Pickler:
                 self.save_reduce(codecs.encode,
                                  (str(obj, 'latin1'), 'latin1'), obj=obj)
             return
+        threshold = self._out_of_band_threshold
+        if (threshold is not None and len(obj) >= threshold
+                and self._save_out_of_band(obj)):
+            return
         self._save_bytes_no_memo(obj)
         self.memoize(obj)
     dispatch[bytes] = save_bytes
 
+    def _save_out_of_band(self, obj):
+        # Helper for the out_of_band_threshold option: offer a bytes or
+        # bytearray object to buffer_callback.  If the callback takes it
+        # out-of-band, write the reference to the buffer, memoize obj and
+        # return True; otherwise write nothing and return False.
+        if self._buffer_callback(PickleBuffer(obj)):
+            return False
+        self.write(NEXT_BUFFER)
+        if type(obj) is bytes:
+            self.write(READONLY_BUFFER)
+        self.memoize(obj)
+        return True
+
     def _save_bytearray_no_memo(self, obj):
-        # helper for writing bytearray objects for protocol >= 5
-        # without memoizing them
+        # helper for writing bytearray objects (or flat byte views of
+        # writable buffers) for protocol >= 5 without memoizing them
         assert self.proto >= 5
         n = len(obj)
         if n >= self.framer._FRAME_SIZE_TARGET:
@@ -827,6 +2569,10 @@ class _Pickler:
             else:
                 self.save_reduce(bytearray, (bytes(obj),), obj=obj)
             return
+        threshold = self._out_of_band_threshold
+        if (threshold is not None and len(obj) >= threshold
+                and self._save_out_of_band(obj)):
+            return
         self._save_bytearray_no_memo(obj)
         self.memoize(obj)
     dispatch[bytearray] = save_bytearray
@@ -836,37 +2582,36 @@ class _Pickler:
             if self.proto < 5:
                 raise PicklingError("PickleBuffer can only be pickled with "
                                     "protocol >= 5")
-            with obj.raw() as m:
-                if not m.contiguous:
-                    raise PicklingError("PickleBuffer can not be pickled when "
-                                        "pointing to a non-contiguous buffer")
-                in_band = True
-                if self._buffer_callback is not None:
-                    in_band = bool(self._buffer_callback(obj))
-                if in_band:
-                    # Write data in-band
-                    # XXX The C implementation avoids a copy here
-                    buf = m.tobytes()
-                    in_memo = id(buf) in self.memo
-                    if m.readonly:
-                        if in_memo:
-                            self._save_bytes_no_memo(buf)
-                        else:
-                            self.save_bytes(buf)
-                    else:
-                        if in_memo:
-                            self._save_bytearray_no_memo(buf)
-                        else:
-                            self.save_bytearray(buf)
+            # The view is not released here: a large payload is handed to
+            # the file as is, and the file may keep it for delayed access.
+            m = obj.raw()
+            if not m.contiguous:
+                raise PicklingError("PickleBuffer can not be pickled when "
+                                    "pointing to a non-contiguous buffer")
+            in_band = True
+            if self._buffer_callback is not None:
+                in_band = bool(self._buffer_callback(obj))
+            if in_band:
+                # Write data in-band straight from the buffer view, so
+                # large payloads reach the file without an intermediate
+                # bytes copy.  Like the C implementation, memoize the
+                # PickleBuffer itself: pickling it again emits a GET.
+                if m.readonly:
+                    self._save_bytes_no_memo(m)
                 else:
-                    # Write data out-of-band
-                    self.write(NEXT_BUFFER)
-                    if m.readonly:
-                        self.write(READONLY_BUFFER)
+                    self._save_bytearray_no_memo(m)
+                self.memoize(obj)
+            else:
+                # Write data out-of-band
+                self.write(NEXT_BUFFER)
+                if m.readonly:
+                    self.write(READONLY_BUFFER)
 
         dispatch[PickleBuffer] = save_picklebuffer
 
     def save_str(self, obj):
+        if self._value_table is not None and self._save_equal_value(obj):
+            return
         if self.bin:
             encoded = obj.encode('utf-8', 'surrogatepass')
             n = len(encoded)
@@ -878,6 +2623,9 @@ class _Pickler:
                 self._write_large_bytes(BINUNICODE + pack("<I", n), encoded)
             else:
                 self.write(BINUNICODE + pack("<I", n) + encoded)
+        elif obj.isprintable() and "\\" not in obj:
+            # Nothing to escape (all the characters below are unprintable).
+            self.write(UNICODE + _raw_unicode_escape_encode(obj)[0] + b'\n')
         else:
             # Escape what raw-unicode-escape doesn't, but memoize the original.
             tmp = obj.replace("\\", "\\u005c")
@@ -885,11 +2633,13 @@ class _Pickler:
             tmp = tmp.replace("\n", "\\u000a")
             tmp = tmp.replace("\r", "\\u000d")
             tmp = tmp.replace("\x1a", "\\u001a")  # EOF on DOS
-            self.write(UNICODE + tmp.encode('raw-unicode-escape') + b'\n')
+            self.write(UNICODE + _raw_unicode_escape_encode(tmp)[0] + b'\n')
         self.memoize(obj)
     dispatch[str] = save_str
 
     def save_tuple(self, obj):
+        if self._value_table is not None and self._save_equal_value(obj):
+            return
         if not obj: # tuple is empty
             if self.bin:
                 self.write(EMPTY_TUPLE)
@@ -898,6 +2648,9 @@ class _Pickler:
             return
 
         n = len(obj)
+        if (self.packed_sequences and n >= self._PACKED_MIN_LEN
+                and self._save_packed(obj)):
+            return
         save = self.save
         memo = self.memo
         if n <= 3 and self.proto >= 2:
@@ -941,16 +2694,180 @@ class _Pickler:
     dispatch[tuple] = save_tuple
 
     def save_list(self, obj):
+        if (self.packed_sequences and len(obj) >= self._PACKED_MIN_LEN
+                and self._save_packed(obj)):
+            return
+        runs = None
+        if self.compact_records and len(obj) >= self._RECORDS_MIN_LEN:
+            runs = self._record_runs(obj)
         if self.bin:
             self.write(EMPTY_LIST)
         else:   # proto 0 -- can't use EMPTY_LIST
             self.write(MARK + LIST)
 
         self.memoize(obj)
-        self._batch_appends(obj)
+        if runs:
+            save = self.save
+            for x in self._iter_compact_list(obj, runs):
+                save(x)
+        else:
+            self._batch_appends(obj)
 
     dispatch[list] = save_list
 
+    _PACKED_MIN_LEN = 16
+
+    def _save_packed(self, obj):
+        # Helper for the packed_sequences mode, proto >= 3 only.  A list or
+        # tuple whose items are all ints or all floats is written as
+        #
+        #     type(obj)(array._array_reconstructor(array.array, typecode,
+        #                                          mformat_code, payload))
+        #
+        # with a single little-endian bytes payload, which is the form
+        # array.array pickles itself with.  Returns False, having written
+        # nothing, if obj does not qualify.
+        item_types = set(map(type, obj))
+        if item_types == _FLOAT_ONLY:
+            typecode, mformat_code = _PACKED_FLOAT_FORMAT
+        elif item_types == _INT_ONLY:
+            lo = min(obj)
+            hi = max(obj)
+            for typecode, mformat_code, limit in _PACKED_INT_FORMATS:
+                if -limit <= lo and hi < limit:
+                    break
+            else:
+                return False
+        else:
+            return False
+        items = array(typecode, obj)
+        if sys.byteorder == 'big':
+            items.byteswap()
+        payload = items.tobytes()
+        del items
+
+        save = self.save
+        write = self.write
+        save(type(obj))
+        save(_array_reconstructor)
+        write(MARK)
+        save(array)
+        save(typecode)
+        save(mformat_code)
+        # The payload and the argument tuple are transient, so they are not
+        # memoized.
+        self._save_bytes_no_memo(payload)
+        write(TUPLE + REDUCE + TUPLE1 + REDUCE)
+        self.memoize(obj)
+        return True
+
+    _RECORDS_MIN_LEN = 16
+
+    def _record_runs(self, items):
+        # Helper for the compact_records mode.  Return the runs of at least
+        # _RECORDS_MIN_LEN consecutive records of the same shape in the list
+        # items, as (start, stop, cls, keys) tuples.  A record is a dict, or
+        # an instance whose class is pickled by its __dict__ (see
+        # _is_record_class()), with at least one key; its shape is its class
+        # and the tuple of its keys.  The records of a run are not memoized, so those that are
+        # referenced from anywhere else than items are left out.
+        save = getattr(self.save, '__func__', None)
+        if (not _HAVE_GETREFCOUNT or not self._fast_save_ok
+                or (save is not _Pickler.save and save is not _Pickler._save_fast)
+                or vars(self).keys() & _RECORD_HOOKS):
+            return None
+        getrefcount = sys.getrefcount
+        limit = _UNSHARED_REFCOUNT
+        classes = self._record_classes
+        min_len = self._RECORDS_MIN_LEN
+        runs = []
+        shape = None
+        start = 0
+        i = -1
+        for x in items:
+            i += 1
+            t = type(x)
+            ok = classes.get(t)
+            if ok is None:
+                ok = classes[t] = self._is_record_class(t)
+            new_shape = None
+            if ok and getrefcount(x) <= limit:
+                if t is dict:
+                    keys = tuple(x)
+                else:
+                    d = x.__dict__
+                    keys = None
+                    if type(d) is dict and getrefcount(d) <= limit:
+                        keys = tuple(d)
+                    del d
+                if keys:
+                    new_shape = (t, keys)
+            if new_shape != shape:
+                if shape is not None and i - start >= min_len:
+                    runs.append((start, i) + shape)
+                shape = new_shape
+                start = i
+        if shape is not None and i + 1 - start >= min_len:
+            runs.append((start, i + 1) + shape)
+        return runs
+
+    def _is_record_class(self, t):
+        # Whether the records of the compact_records mode may be instances
+        # of t: the default save() must pickle them as t.__new__(t) with
+        # their __dict__ as state, and no hook may intervene.
+        if t is dict:
+            return (self.dispatch.get(dict) is _Pickler.dispatch[dict]
+                    and not self.sort_dicts)
+        if (self.proto < 2 or not t.__dictoffset__ or t in self.dispatch
+                or t in getattr(self, 'dispatch_table', dispatch_table)
+                or issubclass(t, type)):
+            return False
+        for cls in t.__mro__[:-1]:
+            if '__slots__' in vars(cls):
+                return False
+        return (t.__reduce_ex__ is object.__reduce_ex__
+                and t.__reduce__ is object.__reduce__
+                and getattr(t, '__getstate__', None)
+                    is getattr(object, '__getstate__', None)
+                and not hasattr(t, '__setstate__')
+                and not hasattr(t, '__getnewargs_ex__')
+                and not hasattr(t, '__getnewargs__'))
+
+    def _iter_compact_list(self, obj, runs):
+        # Generator of the objects to save to fill the list obj, already on
+        # the stack and memoized, in the compact_records mode.  Each run of
+        # records is written as
+        #
+        #     _extend_records(obj, cls, keys, column1, column2, ...)
+        #
+        # whose result is popped; the other items are appended as usual.
+        write = self.write
+        shared_keys = self._record_keys
+        packed = self.proto >= 3
+        pos = 0
+        for start, stop, cls, keys in runs:
+            if pos < start:
+                yield from self._iter_batch_appends(obj[pos:start])
+            keys = shared_keys.setdefault(keys, keys)
+            yield _extend_records
+            write(MARK)
+            yield obj
+            yield cls
+            yield keys
+            if cls is dict:
+                rows = map(dict.values, obj[start:stop])
+            else:
+                rows = [x.__dict__.values() for x in obj[start:stop]]
+            for column in zip(*rows):
+                column = list(column)
+                if not (packed and self._save_packed(column)):
+                    yield column
+            del rows, column
+            write(TUPLE + REDUCE + POP)
+            pos = stop
+        if pos < len(obj):
+            yield from self._iter_batch_appends(obj[pos:])
+
     _BATCHSIZE = 1000
 
     def _batch_appends(self, items):
@@ -987,7 +2904,11 @@ class _Pickler:
             self.write(MARK + DICT)
 
         self.memoize(obj)
-        self._batch_setitems(obj.items())
+        if self.sort_dicts:
+            keys = _canonical_sorted(obj, self._canonical_active)
+            self._batch_setitems([(k, obj[k]) for k in keys])
+        else:
+            self._batch_setitems(obj.items())
 
     dispatch[dict] = save_dict
 
@@ -1023,17 +2944,24 @@ class _Pickler:
                 return
 
     def save_set(self, obj):
-        save = self.save
         write = self.write
 
+        items = (_canonical_sorted(obj, self._canonical_active)
+                 if self.canonical else obj)
         if self.proto < 4:
-            self.save_reduce(set, (list(obj),), obj=obj)
+            self.save_reduce(set, (list(items),), obj=obj)
             return
 
         write(EMPTY_SET)
         self.memoize(obj)
+        self._batch_additems(items)
+
+    def _batch_additems(self, items):
+        # Helper to batch up ADDITEMS sequences; proto >= 4 only
+        save = self.save
+        write = self.write
 
-        it = iter(obj)
+        it = iter(items)
         while True:
             batch = list(islice(it, self._BATCHSIZE))
             n = len(batch)
@@ -1050,12 +2978,14 @@ class _Pickler:
         save = self.save
         write = self.write
 
+        items = (_canonical_sorted(obj, self._canonical_active)
+                 if self.canonical else obj)
         if self.proto < 4:
-            self.save_reduce(frozenset, (list(obj),), obj=obj)
+            self.save_reduce(frozenset, (list(items),), obj=obj)
             return
 
         write(MARK)
-        for item in obj:
+        for item in items:
             save(item)
 
         if id(obj) in self.memo:
@@ -1078,40 +3008,21 @@ class _Pickler:
         if name is None:
             name = obj.__name__
 
-        module_name = whichmodule(obj, name)
-        try:
-            __import__(module_name, level=0)
-            module = sys.modules[module_name]
-            obj2, parent = _getattribute(module, name)
-        except (ImportError, KeyError, AttributeError):
-            raise PicklingError(
-                "Can't pickle %r: it's not found as %s.%s" %
-                (obj, module_name, name)) from None
-        else:
-            if obj2 is not obj:
-                raise PicklingError(
-                    "Can't pickle %r: it's not the same object as %s.%s" %
-                    (obj, module_name, name))
-
-        if self.proto >= 2:
-            code = _extension_registry.get((module_name, name), _NoValue)
-            if code is not _NoValue:
-                if code <= 0xff:
-                    data = pack("<B", code)
-                    if data == b'\0':
-                        # Should never happen in normal circumstances,
-                        # since the type and the value of the code are
-                        # checked in copyreg.add_extension().
-                        raise RuntimeError("extension code 0 is out of range")
-                    write(EXT1 + data)
-                elif code <= 0xffff:
-                    write(EXT2 + pack("<H", code))
-                else:
-                    write(EXT4 + pack("<i", code))
-                return
-        lastname = name.rpartition('.')[2]
-        if parent is module:
-            name = lastname
+        module_name, name, code = _resolve_global(obj, name)
+        if self.proto >= 2 and code is not None:
+            if code <= 0xff:
+                data = pack("<B", code)
+                if data == b'\0':
+                    # Should never happen in normal circumstances,
+                    # since the type and the value of the code are
+                    # checked in copyreg.add_extension().
+                    raise RuntimeError("extension code 0 is out of range")
+                write(EXT1 + data)
+            elif code <= 0xffff:
+                write(EXT2 + pack("<H", code))
+            else:
+                write(EXT4 + pack("<i", code))
+            return
         # Non-ASCII identifiers are supported only with protocols >= 3.
         if self.proto >= 4:
             self.save(module_name)
@@ -1174,6 +3085,428 @@ class _Pickler:
     dispatch[FunctionType] = save_global
     dispatch[type] = save_type
 
+# Type tags of the canonical sort keys; see _canonical_sorted().
+_CANONICAL_TAGS = {type(None): 0, bool: 1, int: 2, float: 3, str: 4,
+                   bytes: 5, tuple: 6, frozenset: 7}
+_CANONICAL_OTHER = len(_CANONICAL_TAGS)
+_CANONICAL_PLAIN = frozenset([int, str, bytes])
+_CANONICAL_SIMPLE = _CANONICAL_PLAIN | {type(None), bool}
+
+def _canonical_sorted(items, active):
+    """Return a list of items sorted in a total order of their values.
+
+    Used by the canonical pickling mode.  Each item gets one sort key,
+    tagged with its type so that values of different types never have to
+    be compared.  Keys of tuples and frozensets nested in an item are built
+    from the keys of their elements and memoized by id for the duration of
+    the sort.  Items of other types are ordered by type name and canonical
+    pickle, except while items is already being sorted further up (it
+    contains itself through such an item), where they are only ordered by
+    type name.  *active* holds the ids of the containers being sorted; it
+    belongs to the pickler and is passed on to those of the sort keys.
+    """
+    types = set(map(type, items))
+    if len(types) == 1 and types <= _CANONICAL_PLAIN:
+        # Homogeneous ints, strings or bytes already compare totally.
+        return sorted(items)
+    tags = _CANONICAL_TAGS
+    plain = _CANONICAL_SIMPLE
+    nested = {}
+
+    def key(obj, memoize=False):
+        t = type(obj)
+        tag = tags.get(t, _CANONICAL_OTHER)
+        if tag <= 5:
+            if t is float:
+                # NaN sorts after every other float
+                return (tag, True, 0.0) if obj != obj else (tag, False, obj)
+            return (tag, obj)
+        if tag < _CANONICAL_OTHER:
+            if memoize:
+                k = nested.get(id(obj))
+                if k is not None:
+                    return k
+            k = tuple([(tags[type(x)], x) if type(x) in plain
+                       else key(x, True) for x in obj])
+            k = (tag, k if t is tuple else tuple(sorted(k)))
+            if memoize:
+                nested[id(obj)] = k
+            return k
+        if shallow:
+            return (tag, t.__module__, t.__qualname__)
+        f = io.BytesIO()
+        pickler = _Pickler(f, 4, canonical=True, sort_dicts=True)
+        pickler._canonical_active = active
+        pickler.dump(obj)
+        return (tag, t.__module__, t.__qualname__, f.getvalue())
+
+    shallow = id(items) in active
+    if shallow:
+        return sorted(items, key=key)
+    active.add(id(items))
+    try:
+        return sorted(items, key=key)
+    finally:
+        active.discard(id(items))
+
+# Packed formats for the packed_sequences mode: (typecode, machine format
+# code of array._array_reconstructor) for little-endian data, and for ints
+# the exclusive bound of the absolute value.
+_FLOAT_ONLY = frozenset([float])
+_INT_ONLY = frozenset([int])
+_PACKED_FLOAT_FORMAT = ('d', 16)        # IEEE_754_DOUBLE_LE
+_PACKED_INT_FORMATS = [(typecode, mformat_code, 1 << (8 * size - 1))
+                       for typecode, mformat_code, size in [
+                           ('b', 1, 1),     # SIGNED_INT8
+                           ('h', 4, 2),     # SIGNED_INT16_LE
+                           ('i', 8, 4),     # SIGNED_INT32_LE
+                           ('q', 12, 8),    # SIGNED_INT64_LE
+                       ]
+                       if array(typecode).itemsize == size]
+
+# Zero-copy reducers for buffer-protocol objects, used with protocol 5 in
+# place of __reduce_ex__().  Their reduce values pass the memory of the
+# object as a PickleBuffer, which save_picklebuffer() writes in-band
+# straight from the object, or hands to buffer_callback.  In-band data is
+# loaded with readinto() by load_bytearray8(); the rebuild functions then
+# take the bytearray, bytes or out-of-band buffer as is.
+_buffer_reducers = {}
+
+def register_buffer_reducer(cls, reducer):
+    """Register reducer(obj) to pickle instances of cls with protocol 5.
+
+    reducer returns a reduce value, like __reduce__(), and should pass the
+    memory of obj as a PickleBuffer in its arguments to avoid copying it.
+    It replaces __reduce_ex__() for cls (not for its subclasses), but not
+    the entries of copyreg.dispatch_table or of a pickler's dispatch_table.
+
+    Unless the pickler has a buffer_callback, the PickleBuffer objects
+    among the arguments of the reduce value are released once it has been
+    saved.
+
+    The reducers of array.array and memoryview are registered by default;
+    their protocol 5 pickles refer to functions of this module, so that
+    they can only be loaded where my_pickle can be imported.  Bytearray
+    subclasses are pickled by a reducer too, which refers to the subclass
+    only.
+    """
+    if not callable(reducer):
+        raise TypeError("reducers must be callable")
+    _buffer_reducers[cls] = reducer
+
+def _release_buffers(args):
+    # Release the PickleBuffer objects made by a buffer reducer once its
+    # reduce value is saved in-band.  The memo keeps them (and the argument
+    # tuple) until clear_memo(), and the pickled object could not be
+    # resized until then.  The view written by save_picklebuffer() holds a
+    # buffer of its own.  Those passed to a buffer_callback are left alone.
+    for arg in args:
+        if type(arg) is PickleBuffer:
+            arg.release()
+
+def _iter_then_release(gen, args):
+    # Generator version of save() followed by _release_buffers(args).
+    try:
+        yield from gen
+    finally:
+        _release_buffers(args)
+
+def _buffer_reducer(t):
+    reduce = _buffer_reducers.get(t)
+    if (reduce is None and _HAVE_PICKLE_BUFFER and issubclass(t, bytearray)
+            and t.__reduce_ex__ is bytearray.__reduce_ex__
+            and t.__reduce__ is bytearray.__reduce__):
+        reduce = _reduce_bytearray_subclass
+    return reduce
+
+# Machine format codes of array._array_reconstructor for the native layout
+# of each typecode.
+_ARRAY_MFORMATS = {typecode: array(typecode).__reduce_ex__(3)[1][2]
+                   for typecode in 'bBuhHiIlLqQfd'}
+
+def _rebuild_array(typecode, mformat_code, data):
+    if _ARRAY_MFORMATS.get(typecode) == mformat_code:
+        a = array(typecode)
+        with memoryview(data) as m, m.cast('B') as b:
+            a.frombytes(b)
+        return a
+    # Pickled on a machine with another byte order or item size.
+    return _array_reconstructor(array, typecode, mformat_code, bytes(data))
+
+# Formats accepted by memoryview.cast().
+_MEMORYVIEW_FORMATS = frozenset([f for c in 'bBhHiIlLqQnNfd?cP'
+                                 for f in (c, '@' + c)])
+
+def _rebuild_memoryview(data, format, shape):
+    return memoryview(data).cast('B').cast(format, shape)
+
+if _HAVE_PICKLE_BUFFER:
+    def _reduce_array(obj):
+        typecode = obj.typecode
+        return (_rebuild_array,
+                (typecode, _ARRAY_MFORMATS[typecode], PickleBuffer(obj)))
+
+    def _reduce_memoryview(obj):
+        if obj.format not in _MEMORYVIEW_FORMATS:
+            raise PicklingError("can't pickle memoryview with format %r"
+                                % obj.format)
+        if obj.c_contiguous:
+            data = PickleBuffer(obj)
+        else:
+            # Copy to C order, keeping the view writable if it was.
+            data = obj.tobytes()
+            if not obj.readonly:
+                data = bytearray(data)
+            data = PickleBuffer(data)
+        return _rebuild_memoryview, (data, obj.format, obj.shape)
+
+    def _reduce_bytearray_subclass(obj):
+        # Like bytearray.__reduce_ex__(), without the bytes copy.
+        return (type(obj), (PickleBuffer(obj),),
+                getattr(obj, '__dict__', None) or None)
+
+    _buffer_reducers[array] = _reduce_array
+    _buffer_reducers[memoryview] = _reduce_memoryview
+
+# Types of the values deduplicated by the dedupe_values mode.
+_VALUE_TYPES = frozenset([str, bytes, int, float, tuple])
+_SCALAR_VALUE_TYPES = frozenset([str, bytes, int, float])
+
+def _value_key(obj, max_len):
+    # Key of obj in the table of the dedupe_values mode: values with equal
+    # keys pickle to the same bytes.  Returns None for the values that are
+    # not deduplicated.
+    t = type(obj)
+    if t is float:
+        # Tells 0.0 from -0.0, and matches NaNs.
+        return t, pack('>d', obj)
+    if t is int:
+        return t, obj
+    if t is str or t is bytes:
+        if len(obj) > max_len:
+            return None
+        return t, obj
+    if t is tuple and obj and len(obj) <= max_len:
+        keys = []
+        for x in obj:
+            if type(x) not in _SCALAR_VALUE_TYPES:
+                return None
+            key = _value_key(x, max_len)
+            if key is None:
+                return None
+            keys.append(key)
+        return t, tuple(keys)
+    return None
+
+# Reference count of the items of a list held nowhere else, as seen by
+# _Pickler._record_runs() (the list, the loop variable and the argument of
+# sys.getrefcount()).
+_HAVE_GETREFCOUNT = hasattr(sys, 'getrefcount')
+
+def _unshared_refcount():
+    for x in [{}]:
+        return sys.getrefcount(x)
+
+_UNSHARED_REFCOUNT = _unshared_refcount() if _HAVE_GETREFCOUNT else 0
+
+# Reference count of an object held by nothing but its memo entry, as seen
+# by DeltaPickler._prune_memo().
+_memo_object = itemgetter(1)
+
+def _memo_only_refcount():
+    memo = {0: (0, [])}
+    for n in map(sys.getrefcount, map(_memo_object, memo.values())):
+        return n
+
+_MEMO_ONLY_REFCOUNT = _memo_only_refcount() if _HAVE_GETREFCOUNT else 0
+
+def _extend_records(lst, cls, keys, *columns):
+    # Reconstructor for the compact_records mode: append the records of a
+    # run, given column-wise, to lst.
+    rows = zip(*columns)
+    if cls is dict:
+        lst.extend(map(dict, map(partial(zip, keys), rows)))
+        return
+    new = cls.__new__
+    append = lst.append
+    for row in rows:
+        x = new(cls)
+        x.__dict__.update(zip(keys, row))
+        append(x)
+
+def _delta_patch(obj, *items):
+    # Reconstructor for DeltaPickler: replace the contents of obj, a list,
+    # dict, set or bytearray, with items (the keys and values of a dict
+    # alternate), or the attributes of an instance with the first items[0]
+    # items, for its __dict__, and the (name, value) pairs of its slots.
+    t = type(obj)
+    if t is list:
+        obj[:] = items
+    elif t is dict:
+        obj.clear()
+        obj.update(zip(items[::2], items[1::2]))
+    elif t is set:
+        obj.clear()
+        obj.update(items)
+    elif t is bytearray:
+        obj[:] = items[0]
+    else:
+        n = items[0] + 1
+        d = getattr(obj, '__dict__', None)
+        if d is not None:
+            d.clear()
+            d.update(zip(items[1:n:2], items[2:n:2]))
+        for name in _slotnames(t):
+            try:
+                delattr(obj, name)
+            except AttributeError:
+                pass
+        for name, value in zip(items[n::2], items[n + 1::2]):
+            setattr(obj, name, value)
+
+def _delta_update(obj, *args):
+    # Reconstructor for DeltaPickler: apply the edits made by _list_edits()
+    # or _dict_edits() to obj.
+    if type(obj) is dict:
+        n = args[0] + 1
+        for key in args[1:n]:
+            del obj[key]
+        obj.update(zip(args[n::2], args[n + 1::2]))
+        return
+    edits = []
+    i = 0
+    while i < len(args):
+        start, stop, count = args[i:i + 3]
+        i += 3
+        edits.append((start, stop, args[i:i + count]))
+        i += count
+    for start, stop, items in reversed(edits):
+        obj[start:stop] = items
+
+# How far _list_edits() looks for the items following an edit.
+_LIST_EDIT_WINDOW = 16
+
+def _list_edits(old, new):
+    # Return the arguments of the _delta_update() call turning a list of
+    # the items old into new, the (start, stop, count) slices of old to
+    # replace, each followed by the count new items, or None if they would
+    # be at least as many as the items of new.  The items are compared by
+    # identity; after an edit, the next two items that match within
+    # _LIST_EDIT_WINDOW positions end it.
+    n = len(old)
+    m = len(new)
+    window = _LIST_EDIT_WINDOW
+    edits = []
+    i = j = 0
+    while i < n and j < m:
+        if old[i] is new[j]:
+            i += 1
+            j += 1
+            continue
+        for d in range(1, window):
+            for a in range(d + 1):
+                k = i + a
+                l = j + d - a
+                if (k < n and l < m and old[k] is new[l]
+                        and (k + 1 == n or l + 1 == m
+                             or old[k + 1] is new[l + 1])):
+                    break
+            else:
+                continue
+            break
+        else:
+            break
+        edits += i, k, l - j
+        edits += new[j:l]
+        if len(edits) >= m:
+            return None
+        i = k
+        j = l
+    if i < n or j < m:
+        edits += i, n, m - j
+        edits += new[j:]
+    return edits if len(edits) < m else None
+
+def _dict_edits(old, new):
+    # Return the arguments of the _delta_update() call turning a dict of
+    # the alternating keys and values old into the dict new: the number of
+    # keys to delete, those keys, and the alternating keys and values to
+    # set.  Return None if they would be at least as many as the items of
+    # new, or if setting them would not give the keys in their order.
+    before = dict(zip(old[::2], old[1::2]))
+    removed = [key for key in before if key not in new]
+    kept = len(before) - len(removed)
+    keys = iter(new)
+    if (list(islice(keys, kept)) != [key for key in before if key in new]
+            or any(key in before for key in keys)):
+        return None
+    args = [len(removed), *removed]
+    for key, value in new.items():
+        if before.get(key, _NoValue) is not value:
+            args += key, value
+            if len(args) >= 2 * len(new):
+                return None
+    return args
+
+def _delta_extend(obj, *items):
+    # Reconstructor for DeltaPickler: add items to obj, a list, dict or
+    # set, as for _delta_patch().
+    t = type(obj)
+    if t is list:
+        obj.extend(items)
+    elif t is dict:
+        obj.update(zip(items[::2], items[1::2]))
+    else:
+        obj.update(items)
+
+def _instance_layout(t, rv):
+    # Return the layout of the instances of t, given the reduce value of one
+    # of them for protocol 2 or newer: whether they have a __dict__, and
+    # the names of their slots; or None if t does not pickle its instances
+    # with the default object.__reduce_ex__() and object.__getstate__().
+    # The checks made by object.__reduce_ex__() only depend on the type,
+    # so once it has succeeded for one instance it does for every other.
+    if (t.__reduce_ex__ is not object.__reduce_ex__
+            or t.__reduce__ is not object.__reduce__
+            or t.__getattribute__ is not object.__getattribute__
+            or getattr(t, '__getstate__', None)
+                is not getattr(object, '__getstate__', None)
+            or hasattr(t, '__getnewargs_ex__')
+            or hasattr(t, '__getnewargs__')
+            or issubclass(t, type)):
+        return None
+    if (type(rv) is not tuple or len(rv) != 5 or rv[0] is not _copyreg_newobj
+            or rv[1] != (t,) or rv[3] is not None or rv[4] is not None):
+        return None
+    return bool(t.__dictoffset__), tuple(_slotnames(t))
+
+def _layout_key(t):
+    # The class attributes _instance_layout() checks, to tell when its
+    # answer for t may have changed.  Assigning a hook to t or one of its
+    # bases changes the object found.
+    return (t.__reduce_ex__, t.__reduce__, t.__getattribute__,
+            getattr(t, '__getstate__', None),
+            getattr(t, '__getnewargs_ex__', None),
+            getattr(t, '__getnewargs__', None))
+
+# Stock dispatch entries for types whose handlers never memoize.
+_ATOMIC_DISPATCH = {t: _Pickler.dispatch[t]
+                    for t in (type(None), bool, int, float)}
+
+# Generator versions of the container handlers, for _save_iterative().
+_ITERATIVE_DISPATCH = {
+    tuple: _Pickler._iter_save_tuple,
+    list: _Pickler._iter_save_list,
+    dict: _Pickler._iter_save_dict,
+    set: _Pickler._iter_save_set,
+    frozenset: _Pickler._iter_save_frozenset,
+}
+
+# Attributes that, when set on a pickler instance, must be honoured for every
+# object by the generic save().
+_PER_OBJECT_HOOKS = frozenset(["save", "persistent_id", "reducer_override"])
+_RECORD_HOOKS = _PER_OBJECT_HOOKS - {"save"}
+
 
 # Unpickling machinery
 
@@ -1221,6 +3554,7 @@ class _Unpickler:
         self._buffers = iter(buffers) if buffers is not None else None
         self._file_readline = file.readline
         self._file_read = file.read
+        self._file_readinto = getattr(file, "readinto", None)
         self.memo = {}
         self.encoding = encoding
         self.errors = errors
@@ -1237,7 +3571,8 @@ class _Unpickler:
         if not hasattr(self, "_file_read"):
             raise UnpicklingError("Unpickler.__init__() was not called by "
                                   "%s.__init__()" % (self.__class__.__name__,))
-        self._unframer = _Unframer(self._file_read, self._file_readline)
+        self._unframer = _Unframer(self._file_read, self._file_readline,
+                                   file_readinto=self._file_readinto)
         self.read = self._unframer.read
         self.readinto = self._unframer.readinto
         self.readline = self._unframer.readline
@@ -1245,17 +3580,29 @@ class _Unpickler:
         self.stack = []
         self.append = self.stack.append
         self.proto = 0
+        self._decompressor = None
+        unframer = self._unframer
         read = self.read
         dispatch = self.dispatch
         try:
             while True:
-                key = read(1)
+                # Read the opcode from the file or the frame directly, and
+                # only go through _Unframer.read() at the end of a frame.
+                frame = unframer.current_frame
+                if frame is None:
+                    key = unframer.file_read(1)
+                else:
+                    key = frame.read(1) or read(1)
                 if not key:
                     raise EOFError
                 assert isinstance(key, bytes_types)
                 dispatch[key[0]](self)
         except _Stop as stopinst:
             return stopinst.value
+        finally:
+            if self._decompressor is not None:
+                self._decompressor.close()
+                self._decompressor = None
 
     # Return a list of items pushed in the stack after last MARK instruction.
     def pop_mark(self):
@@ -1276,6 +3623,18 @@ class _Unpickler:
         self.proto = proto
     dispatch[PROTO[0]] = load_proto
 
+    def load_compressed(self):
+        if self._decompressor is not None:
+            raise UnpicklingError("nested compressed container")
+        codec_id = self.read(1)
+        if not codec_id:
+            raise EOFError
+        self._decompressor = _FrameDecompressor(self._file_read, codec_id[0])
+        self._unframer.file_read = self._decompressor.read
+        self._unframer.file_readline = self._decompressor.readline
+        self._unframer.file_readinto = None
+    dispatch[_COMPRESSED[0]] = load_compressed
+
     def load_frame(self):
         frame_size, = unpack('<Q', self.read(8))
         if frame_size > sys.maxsize:
@@ -1283,6 +3642,19 @@ class _Unpickler:
         self._unframer.load_frame(frame_size)
     dispatch[FRAME[0]] = load_frame
 
+    def load_checked_frame(self):
+        last, frame_size, checksum = unpack('<BQI', self.read(13))
+        if frame_size > sys.maxsize:
+            raise ValueError("frame size > sys.maxsize: %d" % frame_size)
+        self._unframer.load_frame(frame_size, checksum)
+    dispatch[_CHECKED_FRAME[0]] = load_checked_frame
+
+    def load_checksum(self):
+        # The trailer of the previous pickle in the file: only verify()
+        # checks it.
+        self.read(12)
+    dispatch[_CHECKSUM[0]] = load_checksum
+
     def load_persid(self):
         try:
             pid = self.readline()[:-1].decode("ascii")
@@ -1311,9 +3683,9 @@ class _Unpickler:
 
     def load_int(self):
         data = self.readline()
-        if data == FALSE[1:]:
+        if data == _FALSE_ARG:
             val = False
-        elif data == TRUE[1:]:
+        elif data == _TRUE_ARG:
             val = True
         else:
             val = int(data, 0)
@@ -1355,7 +3727,8 @@ class _Unpickler:
     dispatch[LONG4[0]] = load_long4
 
     def load_float(self):
-        self.append(float(self.readline()[:-1]))
+        # float() and int() ignore the trailing newline.
+        self.append(float(self.readline()))
     dispatch[FLOAT[0]] = load_float
 
     def load_binfloat(self):
@@ -1399,7 +3772,7 @@ class _Unpickler:
     dispatch[BINBYTES[0]] = load_binbytes
 
     def load_unicode(self):
-        self.append(str(self.readline()[:-1], 'raw-unicode-escape'))
+        self.append(_raw_unicode_escape_decode(self.readline()[:-1])[0])
     dispatch[UNICODE[0]] = load_unicode
 
     def load_binunicode(self):
@@ -1648,7 +4021,7 @@ class _Unpickler:
     dispatch[DUP[0]] = load_dup
 
     def load_get(self):
-        i = int(self.readline()[:-1])
+        i = int(self.readline())
         try:
             self.append(self.memo[i])
         except KeyError:
@@ -1675,7 +4048,7 @@ class _Unpickler:
     dispatch[LONG_BINGET[0]] = load_long_binget
 
     def load_put(self):
-        i = int(self.readline()[:-1])
+        i = int(self.readline())
         if i < 0:
             raise ValueError("negative PUT argument")
         self.memo[i] = self.stack[-1]
@@ -1793,6 +4166,393 @@ def _dump(obj, file, protocol=None, *, fix_imports=True, buffer_callback=None):
     _Pickler(file, protocol, fix_imports=fix_imports,
              buffer_callback=buffer_callback).dump(obj)
 
+def dump_iter(iterable, file, kind="list", protocol=None, *,
+              fix_imports=True, buffer_callback=None):
+    """Write a pickled list, dict or set built from iterable to file.
+
+    See _Pickler.dump_iter().
+    """
+    _Pickler(file, protocol, fix_imports=fix_imports,
+             buffer_callback=buffer_callback).dump_iter(iterable, kind)
+
+def dumps_into(obj, buffer, offset=0, protocol=None, *, fix_imports=True,
+               buffer_callback=None):
+    """Write the pickle of obj into buffer at offset; return its length.
+
+    *buffer* is a writable bytes-like object such as a bytearray, a
+    memoryview, an mmap.mmap or the buf of a shared memory block.  The
+    frames are copied straight into it, without the io.BytesIO and the
+    bytes object of _dumps().  A bytearray is extended when the pickle does
+    not fit; any other buffer raises ValueError, with the part of it after
+    offset partly written.
+    """
+    sink = _BufferSink(buffer, offset)
+    try:
+        _Pickler(sink, protocol, fix_imports=fix_imports,
+                 buffer_callback=buffer_callback).dump(obj)
+    finally:
+        sink.close()
+    return sink.pos - offset
+
+_DUMP_TO_PATH_INITIAL_SIZE = 1 << 20
+
+def dump_to_path(obj, path, protocol=None, *, fix_imports=True,
+                 buffer_callback=None):
+    """Write the pickle of obj to the file path through a memory mapping.
+
+    The file is created or truncated and mapped with a size of 1 MiB,
+    which doubles whenever the pickle does not fit.  The file is then
+    truncated to the length of the pickle, which is returned.
+    """
+    import mmap
+    with open(path, "w+b") as file:
+        file.truncate(_DUMP_TO_PATH_INITIAL_SIZE)
+        mapping = mmap.mmap(file.fileno(), _DUMP_TO_PATH_INITIAL_SIZE)
+        # resize() also grows the file of a file-backed mapping.
+        sink = _BufferSink(mapping, 0, mapping.resize)
+        try:
+            _Pickler(sink, protocol, fix_imports=fix_imports,
+                     buffer_callback=buffer_callback).dump(obj)
+        finally:
+            mapping.close()
+            file.truncate(sink.pos)
+    return sink.pos
+
+def digest(obj, protocol=None, algorithm="sha256", *, fix_imports=True,
+           tree=False, block_size=1 << 20, max_workers=None):
+    """Return a hashlib hash object of the pickle of obj.
+
+    The pickle is fed to the hash while it is written and is never held in
+    memory as a whole, so that the result equals the hash of
+    _dumps(obj, protocol) without building that bytes object.
+
+    If *tree* is true, the pickle is cut into blocks of *block_size* bytes
+    which are hashed by a pool of *max_workers* threads, and the returned
+    object is the hash of the concatenated block digests.  Tree digests are
+    only comparable with tree digests computed with the same block size.
+    """
+    import hashlib
+    if not tree:
+        h = hashlib.new(algorithm)
+        _Pickler(_HashSink(h), protocol, fix_imports=fix_imports).dump(obj)
+        return h
+    if block_size < 1:
+        raise ValueError("block_size must be positive")
+    hashlib.new(algorithm)  # fail early on unknown algorithms
+    from concurrent.futures import ThreadPoolExecutor
+    workers = max_workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(workers) as executor:
+        sink = _TreeHashSink(algorithm, block_size, executor, 2 * workers)
+        _Pickler(sink, protocol, fix_imports=fix_imports).dump(obj)
+        return sink.finish()
+
+def pickled_size(obj, protocol=None, *, fix_imports=True,
+                 buffer_callback=None):
+    """Return len(_dumps(obj, protocol, ...)) without producing the pickle.
+
+    The object is traversed by the same pickling code, but only the sizes
+    of the writes are counted: no frame buffers are kept, and large str
+    and bytes payloads are never copied, nor encoded if they are ASCII.
+    """
+    pickler = _SizingPickler(protocol, fix_imports=fix_imports,
+                             buffer_callback=buffer_callback)
+    pickler.dump(obj)
+    return pickler.framer.size
+
+_VERIFY_CHUNK_SIZE = 1 << 20
+_TRAILER_SIZE = 13
+
+def verify(file):
+    """Check a pickle written with checksum=True without unpickling it.
+
+    The pickle is read from the current position of *file*, a binary file
+    opened for reading, in chunks of 1 MiB, and only its checksums are
+    computed.  With protocols 4 and higher the frames are checked one by
+    one and the file is left after the pickle.  With protocols 0 to 3 the
+    trailer is taken from the end of the file, which must hold nothing
+    else.  Raise UnpicklingError if the pickle has no checksums, is
+    truncated or does not match them.
+    """
+    read = file.read
+    head = read(2)
+    if len(head) == 2 and head[0] == PROTO[0] and head[1] >= 4:
+        while True:
+            header = read(1 + _TRAILER_SIZE)
+            if len(header) < 1 + _TRAILER_SIZE:
+                raise UnpicklingError("pickle data was truncated")
+            if header[0] != _CHECKED_FRAME[0]:
+                raise UnpicklingError("pickle has no frame checksums")
+            last, size, checksum = unpack("<BQI", header[1:])
+            crc = 0
+            while size:
+                chunk = read(min(size, _VERIFY_CHUNK_SIZE))
+                if not chunk:
+                    raise UnpicklingError("pickle data was truncated")
+                crc = crc32(chunk, crc)
+                size -= len(chunk)
+            if crc != checksum:
+                raise UnpicklingError("frame checksum mismatch")
+            if last:
+                return
+    # No frames: everything but the last _TRAILER_SIZE bytes is checked.
+    crc = size = 0
+    pending = head
+    while True:
+        chunk = read(_VERIFY_CHUNK_SIZE)
+        if not chunk:
+            break
+        n = len(pending) + len(chunk) - _TRAILER_SIZE
+        if n <= 0:
+            pending += chunk
+        elif n <= len(pending):
+            crc = crc32(pending[:n], crc)
+            pending = pending[n:] + chunk
+            size += n
+        else:
+            crc = crc32(pending, crc)
+            with memoryview(chunk) as m:
+                crc = crc32(m[:n - len(pending)], crc)
+            pending = chunk[n - len(pending):]
+            size += n
+    if len(pending) < _TRAILER_SIZE or pending[0] != _CHECKSUM[0]:
+        raise UnpicklingError("pickle has no checksum trailer")
+    if unpack("<QI", pending[1:]) != (size, crc):
+        raise UnpicklingError("pickle checksum mismatch")
+
+# Sidecar files of dump_with_sidecar(): the out-of-band buffers, each
+# starting at a multiple of _SIDECAR_ALIGNMENT, then the (offset, size)
+# of every buffer and the number of buffers as little-endian 8-byte
+# integers, then _SIDECAR_MAGIC.
+_SIDECAR_SUFFIX = ".buffers"
+_SIDECAR_ALIGNMENT = 4096
+_SIDECAR_MAGIC = b"MYPKSIDE"
+
+def dump_with_sidecar(obj, path, protocol=None, *, threshold=1 << 20,
+                      fix_imports=True):
+    """Pickle obj to the file path, with large buffers in a sidecar file.
+
+    bytes, bytearray and PickleBuffer payloads of at least *threshold*
+    bytes are written to path + ".buffers" at page-aligned offsets instead
+    of into the pickle, which only refers to them.  *protocol* must be 5
+    or higher; None means HIGHEST_PROTOCOL.  Read the result back with
+    load_with_sidecar().
+    """
+    if protocol is None or protocol < 0:
+        protocol = HIGHEST_PROTOCOL
+    if protocol < 5:
+        raise ValueError("dump_with_sidecar needs protocol >= 5")
+    path = os.fspath(path)
+    with open(path + _SIDECAR_SUFFIX, "wb") as sidecar, \
+         open(path, "wb") as file:
+        writer = _SidecarWriter(sidecar, threshold)
+        _Pickler(file, protocol, fix_imports=fix_imports,
+                 buffer_callback=writer,
+                 out_of_band_threshold=threshold).dump(obj)
+        writer.finish()
+
+def load_with_sidecar(path, *, fix_imports=True, encoding="ASCII",
+                      errors="strict"):
+    """Load a pickle written by dump_with_sidecar().
+
+    The sidecar file is memory-mapped, so loading does not read the
+    out-of-band payloads: they load as memoryviews of the mapping (read-only
+    for bytes), and their pages are read from disk when first touched.  The
+    mapping is copy-on-write; changes through writable views are never
+    written back to the file.
+    """
+    import mmap
+    path = os.fspath(path)
+    with open(path + _SIDECAR_SUFFIX, "rb") as sidecar:
+        mapping = mmap.mmap(sidecar.fileno(), 0, access=mmap.ACCESS_COPY)
+    buffers = _sidecar_buffers(memoryview(mapping))
+    with open(path, "rb") as file:
+        return _load(file, fix_imports=fix_imports, encoding=encoding,
+                     errors=errors, buffers=buffers)
+
+class _SidecarWriter:
+    """buffer_callback of dump_with_sidecar()."""
+
+    def __init__(self, file, threshold):
+        self.file = file
+        self.threshold = threshold
+        self.offset = 0
+        self.index = []
+
+    def __call__(self, buf):
+        with buf.raw() as m:
+            n = m.nbytes
+            if n < self.threshold:
+                return True
+            padding = -self.offset % _SIDECAR_ALIGNMENT
+            if padding:
+                self.file.write(bytes(padding))
+                self.offset += padding
+            self.file.write(m)
+        self.index.append(pack("<QQ", self.offset, n))
+        self.offset += n
+        return False
+
+    def finish(self):
+        self.file.write(b"".join(self.index))
+        self.file.write(pack("<Q", len(self.index)) + _SIDECAR_MAGIC)
+
+def _sidecar_buffers(m):
+    # Return the views of the buffers stored in the sidecar file mapped by m.
+    size = len(m)
+    if size < 16 or m[size - 8:] != _SIDECAR_MAGIC:
+        raise UnpicklingError("not a pickle sidecar file")
+    count, = unpack("<Q", m[size - 16:size - 8])
+    start = size - 16 - 16 * count
+    if start < 0:
+        raise UnpicklingError("pickle sidecar file is truncated")
+    buffers = []
+    for i in range(start, size - 16, 16):
+        offset, n = unpack("<QQ", m[i:i + 16])
+        if offset + n > start:
+            raise UnpicklingError("pickle sidecar file is truncated")
+        buffers.append(m[offset:offset + n])
+    return buffers
+
+def _utf8_length(s):
+    # Length of s.encode('utf-8', 'surrogatepass'), encoding at most a
+    # slice of s at a time.  Lone surrogates are encoded one by one by
+    # 'surrogatepass', so cutting between them does not change the result.
+    if s.isascii():
+        return len(s)
+    step = 1 << 20
+    return sum(len(s[i:i + step].encode('utf-8', 'surrogatepass'))
+               for i in range(0, len(s), step))
+
+class _SizingPickler(_Pickler):
+    """Pickler writing to a _CountingFramer; see pickled_size()."""
+
+    def __init__(self, protocol=None, **kwargs):
+        framer = _CountingFramer()
+        _Pickler.__init__(self, framer, protocol, **kwargs)
+        self.framer = framer
+        self.write = framer.write
+        self._write_large_bytes = framer.write_large_bytes
+
+    dispatch = _Pickler.dispatch.copy()
+
+    def save_str(self, obj):
+        if not self.bin or len(obj) < self.framer._FRAME_SIZE_TARGET:
+            _Pickler.save_str(self, obj)
+            return
+        # The UTF-8 encoding is at least as long as obj, so it is written
+        # by _write_large_bytes(), which only needs the payload length.
+        n = _utf8_length(obj)
+        if n > 0xffffffff and self.proto >= 4:
+            header = BINUNICODE8 + pack("<Q", n)
+        else:
+            header = BINUNICODE + pack("<I", n)
+        self._write_large_bytes(header, range(n))
+        self.memoize(obj)
+    dispatch[str] = save_str
+
+class _HashSink:
+    """File-like object that feeds everything written to a hash."""
+
+    def __init__(self, h):
+        self.write = h.update
+
+class _TreeHashSink:
+    """File-like object that hashes fixed-size blocks in a thread pool.
+
+    hashlib releases the GIL while hashing large buffers, so blocks are
+    hashed concurrently with pickling and with each other.  Whole blocks
+    inside a large write (e.g. a large bytes payload) are hashed in place;
+    only the bytes of smaller writes are copied into a block buffer.  At
+    most max_pending blocks are in flight at a time.
+    """
+
+    def __init__(self, algorithm, block_size, executor, max_pending):
+        self.algorithm = algorithm
+        self.block_size = block_size
+        self.executor = executor
+        self.max_pending = max_pending
+        self.block = bytearray()
+        self.pending = []
+        self.leaves = []
+
+    def write(self, data):
+        block_size = self.block_size
+        block = self.block
+        m = memoryview(data).cast("B")
+        if block:
+            n = block_size - len(block)
+            block += m[:n]
+            m = m[n:]
+            if len(block) < block_size:
+                return
+            self._submit(block)
+            self.block = block = bytearray()
+        while len(m) >= block_size:
+            self._submit(m[:block_size])
+            m = m[block_size:]
+        block += m
+
+    def _submit(self, buf):
+        self.pending.append(self.executor.submit(self._hash_block, buf))
+        if len(self.pending) > self.max_pending:
+            self.leaves.append(self.pending.pop(0).result())
+
+    def _hash_block(self, buf):
+        import hashlib
+        return hashlib.new(self.algorithm, buf).digest()
+
+    def finish(self):
+        import hashlib
+        if self.block:
+            self._submit(self.block)
+            self.block = bytearray()
+        self.leaves.extend([f.result() for f in self.pending])
+        self.pending = []
+        h = hashlib.new(self.algorithm)
+        for leaf in self.leaves:
+            h.update(leaf)
+        return h
+
+class _BufferSink:
+    """File-like object writing into a buffer; see dumps_into()."""
+
+    def __init__(self, buffer, offset, resize=None):
+        # Slice assignment past the end extends a bytearray; any other
+        # buffer is written through a memoryview and has a fixed size,
+        # unless a *resize* function of it is given.
+        self.resize = resize
+        self.view = None
+        if resize is None and not isinstance(buffer, bytearray):
+            buffer = self.view = memoryview(buffer)
+            if buffer.readonly:
+                raise TypeError("dumps_into needs a writable buffer")
+            if buffer.format != 'B' or buffer.ndim != 1:
+                buffer = self.view = buffer.cast('B')
+        if not 0 <= offset <= len(buffer):
+            raise ValueError("offset out of range")
+        self.buffer = buffer
+        self.start = self.pos = offset
+
+    def write(self, data):
+        pos = self.pos
+        end = pos + len(data)
+        buffer = self.buffer
+        if end > len(buffer):
+            if self.resize is not None:
+                self.resize(max(end, 2 * len(buffer)))
+            elif self.view is not None:
+                raise ValueError("pickle does not fit in the %d bytes of "
+                                 "the buffer after offset %d"
+                                 % (len(buffer) - self.start, self.start))
+        buffer[pos:end] = data
+        self.pos = end
+
+    def close(self):
+        # Release the view, so that the caller can resize or close the
+        # buffer even if the pickling failed.
+        if self.view is not None:
+            self.view.release()
+
 def _dumps(obj, protocol=None, *, fix_imports=True, buffer_callback=None):
     f = io.BytesIO()
     _Pickler(f, protocol, fix_imports=fix_imports,
@@ -1814,6 +4574,290 @@ def _loads(s, /, *, fix_imports=True, encoding="ASCII", errors="strict",
     return _Unpickler(file, fix_imports=fix_imports, buffers=buffers,
                       encoding=encoding, errors=errors).load()
 
+def _delta_items(obj, t, layouts):
+    # The contents of obj, a list, dict, set or bytearray or an instance of
+    # t pickled by its __dict__ and slots, as DeltaPickler snapshots them:
+    # the items of a list or set, the alternating keys and values of a
+    # dict, the bytes of a bytearray, or the alternating names and values
+    # of the __dict__ of the instance, then the values of its slots, or
+    # _NoValue for those that are not set.
+    if t is list or t is set:
+        return obj
+    if t is dict:
+        return chain.from_iterable(obj.items())
+    if t is bytearray:
+        return (bytes(obj),)
+    has_dict, slotnames = layouts[t]
+    items = chain.from_iterable(obj.__dict__.items()) if has_dict else ()
+    if slotnames:
+        items = chain(items, map(getattr, repeat(obj), slotnames,
+                                 repeat(_NoValue)))
+    return items
+
+# Types whose objects cannot change, skipped by DeltaPickler._scan().
+_DELTA_WALK = dict.fromkeys([type(None), bool, int, float, complex, str,
+                             bytes], False)
+
+_DELTA_CONTAINERS = frozenset([list, dict, set, bytearray])
+
+class DeltaPickler(_Pickler):
+    """Pickler writing successive states of an object graph as deltas.
+
+    The first dump() writes obj in full.  Each later one writes only the
+    lists, dicts, sets, bytearrays and instances pickled by their __dict__
+    and slots that changed since the previous dump(), and new objects, with
+    references to the objects already written in place of everything else;
+    DeltaUnpickler applies it to the objects it loaded before.  The pickles
+    follow each other in the same file.
+
+    An object has changed if it holds other objects than at the previous
+    dump(), compared by identity.  Only the replaced slices of a list and
+    the removed and set keys of a dict are written, and only the new items
+    of a set that was added to; other sets, bytearrays and instances are
+    written again in full.  dump() still walks the whole graph to find the
+    changes, but writes and memoizes nothing for the unchanged parts.
+    Objects of other types, like the state of objects with a __reduce__()
+    method, are assumed not to change once pickled.
+
+    The memo keeps the pickled objects alive; those that only the memo
+    refers to any more are forgotten, by both sides, at the next dump().
+    clear_memo() makes the next dump() write obj in full again.
+    """
+
+    def __init__(self, file, protocol=None, **kwargs):
+        _Pickler.__init__(self, file, protocol, **kwargs)
+        if self.proto < 2:
+            raise ValueError("DeltaPickler needs protocol >= 2")
+        if self.minimal_memo:
+            raise ValueError("DeltaPickler needs minimal_memo=False")
+        if self.compact_records:
+            raise ValueError("DeltaPickler needs compact_records=False")
+        self.memo = _StreamMemo()
+        # The contents of each list, dict, set, bytearray and instance met
+        # by the previous dump(), keyed by id, with the object itself.
+        self._snapshots = {}
+
+    def clear_memo(self):
+        # The memo indices go on from where they were, as the unpickler
+        # keeps the objects loaded before until the next pickle is loaded.
+        self.memo.forget()
+        if self._value_table is not None:
+            self._value_table.clear()
+        self._state_keys.clear()
+        self._snapshots = {}
+
+    def dump(self, obj):
+        """Write obj, or the changes made to it since the previous dump()."""
+        if not hasattr(self, "_file_write"):
+            raise PicklingError("Pickler.__init__() was not called by "
+                                "%s.__init__()" % (self.__class__.__name__,))
+        if self.fast:
+            raise PicklingError("DeltaPickler cannot be used in fast mode")
+        memo = self.memo
+        # The first memo index of a full pickle.
+        start = len(memo) if not dict.__len__(memo) else None
+        self._check_layouts()
+        changed, self._snapshots = self._scan(obj)
+        try:
+            self._write_pickle(DeltaPickler._save_delta, obj, changed, start)
+        except BaseException:
+            # The unpickler cannot follow a partial pickle.
+            self.clear_memo()
+            raise
+
+    def _scan(self, obj):
+        # Walk the objects reachable from obj and return the memoized ones
+        # that changed, as (object, contents, previous contents or None)
+        # triples, and the new snapshots.  The snapshot of an unchanged
+        # object is kept, so that nothing is allocated for it.
+        memo = self.memo
+        old_snapshots = self._snapshots
+        snapshots = {}
+        changed = []
+        dispatch = self.dispatch
+        layouts = self._layouts
+        track_instances = getattr(self, "reducer_override", None) is None
+        walk = _DELTA_WALK.get
+        seen = {id(_NoValue)}
+        stack = [obj]
+        pop = stack.pop
+        push = stack.extend
+        while stack:
+            x = pop()
+            t = type(x)
+            i = id(x)
+            if i in seen:
+                continue
+            seen.add(i)
+            if t is list or t is set:
+                n = len(x)
+            elif t is dict:
+                n = 2 * len(x)
+            elif t is tuple or t is frozenset:
+                push(compress(x, map(walk, map(type, x), repeat(True))))
+                continue
+            elif t is bytearray:
+                n = 1
+            elif t in dispatch or not track_instances:
+                continue
+            else:
+                layout = layouts.get(t, _NoValue)
+                if layout is _NoValue:
+                    layout = self._delta_layout(x, t)
+                if layout is None:
+                    continue
+                has_dict, slotnames = layout
+                n = len(slotnames)
+                if has_dict:
+                    n += 2 * len(x.__dict__)
+            entry = old_snapshots.get(i)
+            if entry is None:
+                snap = tuple(_delta_items(x, t, layouts))
+                if i in memo:
+                    changed.append((x, snap, None))
+            else:
+                old = entry[1]
+                items = _delta_items(x, t, layouts)
+                if len(old) == n and (old == items if t is bytearray
+                                      else all(map(_is, old, items))):
+                    snapshots[i] = entry
+                    push(compress(old, map(walk, map(type, old),
+                                           repeat(True))))
+                    continue
+                snap = tuple(_delta_items(x, t, layouts))
+                changed.append((x, snap, old))
+            snapshots[i] = x, snap
+            # Only the objects of types that cannot change are skipped.
+            push(compress(snap, map(walk, map(type, snap), repeat(True))))
+        return changed, snapshots
+
+    def _delta_layout(self, obj, t):
+        # The layout of obj (see _instance_layout()) if _reduce_value()
+        # pickles it by its __dict__ and slots, else None.
+        layout = None
+        if not (t in getattr(self, 'dispatch_table', dispatch_table)
+                or _fast_reducer(t) is not None
+                or self.proto >= 5 and _buffer_reducer(t) is not None
+                or issubclass(t, type)):
+            try:
+                layout = _instance_layout(t, obj.__reduce_ex__(self.proto))
+            except Exception:
+                pass
+        self._layouts[t] = layout
+        self._layout_keys[t] = _layout_key(t)
+        return layout
+
+    def _prune_memo(self):
+        # Remove the memo entries of the objects that nothing but the memo
+        # refers to, and return their indices.  Called once the snapshots
+        # of the objects that are no longer reachable have been dropped,
+        # including the previous contents of the changed objects.
+        forget = []
+        if not _HAVE_GETREFCOUNT:
+            return forget
+        memo = self.memo
+        getrefcount = sys.getrefcount
+        get_referents = gc.get_referents
+        # The ids of those objects, then of the objects that only they
+        # referred to, and so on.
+        stack = list(compress(dict.keys(memo), map(
+            _MEMO_ONLY_REFCOUNT.__eq__,
+            map(getrefcount, map(_memo_object, dict.values(memo))))))
+        while stack:
+            entry = memo.get(stack.pop())
+            if (entry is not None
+                    and getrefcount(entry[1]) == _MEMO_ONLY_REFCOUNT):
+                del memo[id(entry[1])]
+                forget.append(entry[0])
+                stack.extend(map(id, get_referents(entry[1])))
+        entry = None
+        memo.forgotten += len(forget)
+        if forget:
+            # Both hold memo indices.
+            self._state_keys.clear()
+            if self._value_table is not None:
+                self._value_table.clear()
+        return forget
+
+    def _save_delta(self, obj, changed, start):
+        # Write the changes, then the tuple (obj, start, forget): start is
+        # the first memo index of a full pickle, else None, and forget the
+        # tuple of the memo indices forgotten after this pickle, among
+        # which transient objects like reduce arguments memoized by it.
+        save = self._save_iterative if self.iterative else self.save
+        write = self.write
+        self._save_changes(save, changed)
+        save(obj)
+        changed.clear()
+        save(start)
+        write(MARK)
+        for i in self._prune_memo():
+            save(i)
+        write(TUPLE + TUPLE3)
+
+    def _save_changes(self, save, changed):
+        # Write a _delta_patch(), _delta_extend() or _delta_update() call
+        # for each changed object, followed by POP.
+        write = self.write
+        layouts = self._layouts
+        for x, snap, old in changed:
+            t = type(x)
+            func = _delta_patch
+            items = snap
+            if t not in _DELTA_CONTAINERS:
+                slotnames = layouts[t][1]
+                n = len(snap) - len(slotnames)
+                items = [n, *snap[:n]]
+                for name, value in zip(slotnames, snap[n:]):
+                    if value is not _NoValue:
+                        items += name, value
+            elif old is not None and t is not bytearray:
+                n = len(old)
+                if n < len(snap) and all(map(_is, old, snap)):
+                    func = _delta_extend
+                    items = snap[n:]
+                elif t is list:
+                    edits = _list_edits(old, snap)
+                    if edits is not None:
+                        func = _delta_update
+                        items = edits
+                elif t is dict:
+                    edits = _dict_edits(old, x)
+                    if edits is not None:
+                        func = _delta_update
+                        items = edits
+            save(func)
+            write(MARK)
+            save(x)
+            for item in items:
+                save(item)
+            write(TUPLE + REDUCE + POP)
+
+class DeltaUnpickler(_Unpickler):
+    """Unpickler of the pickles written by DeltaPickler.
+
+    Each load() reads the next pickle of the file and returns the object
+    graph as of the matching DeltaPickler.dump(): the objects loaded before
+    are updated in place, so that unchanged objects keep their identity.
+    The file must be read from its first pickle on.
+    """
+
+    def __init__(self, file, **kwargs):
+        _Unpickler.__init__(self, file, **kwargs)
+        # MEMOIZE stores at len(memo), which counts forgotten entries.
+        self.memo = _StreamMemo()
+
+    def load(self):
+        obj, start, forget = _Unpickler.load(self)
+        memo = self.memo
+        if start is not None:
+            # A full pickle: drop what is left of the previous ones.
+            forget = [i for i in memo if i < start] + list(forget)
+        for i in forget:
+            del memo[i]
+        memo.forgotten += len(forget)
+        return obj
+
 # Use the faster _pickle if possible
 try:
     from _pickle import (
@@ -0,0 +1,308 @@
+"""Per-type and per-path profiling of my_pickle's pure-Python pickler.
+
+ProfilingPickler and ProfilingUnpickler are drop-in subclasses of
+my_pickle._Pickler and my_pickle._Unpickler that record, for every type,
+the number of objects pickled or loaded, the time spent and the bytes
+written or read.  The pickler also records the same figures per path in
+the object graph, such as root["users"][*].address, where [*] stands for
+any element of a list, tuple or set.  Times and bytes are exclusive: the
+figures of an object do not include those of the objects it contains.
+
+The plain _Pickler and _Unpickler are not instrumented in any way, so
+profiling costs nothing unless these classes are used.
+
+    >>> p = ProfilingPickler(io.BytesIO())
+    >>> p.dump({"users": [{"name": "x"}]})
+    >>> print(p.profile.format_table())         # doctest: +SKIP
+
+The results can also be exported as JSON (PickleProfile.dump_json()) and
+in the collapsed-stack format read by flame graph tools
+(PickleProfile.collapsed()).
+"""
+
+import json
+from time import perf_counter
+
+import my_pickle
+
+__all__ = ["PickleProfile", "ProfilingPickler", "ProfilingUnpickler"]
+
+
+def _type_name(t):
+    if t.__module__ == "builtins":
+        return t.__qualname__
+    return "%s.%s" % (t.__module__, t.__qualname__)
+
+
+class PickleProfile:
+    """Calls, seconds and bytes, per type name and per object path.
+
+    Paths are tuples of segments: "root", then "[*]", '["key"]', "[3]" or
+    ".attr" for each level.
+    """
+
+    def __init__(self):
+        self.types = {}
+        self.paths = {}
+
+    def add(self, type_name, path, seconds, nbytes):
+        entry = self.types.get(type_name)
+        if entry is None:
+            entry = self.types[type_name] = [0, 0.0, 0]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += nbytes
+        if path is not None:
+            entry = self.paths.get(path)
+            if entry is None:
+                entry = self.paths[path] = [0, 0.0, 0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += nbytes
+
+    def _rows(self, table):
+        return sorted(table.items(), key=lambda item: -item[1][1])
+
+    def format_table(self, limit=None):
+        """Return the profile as text tables sorted by decreasing time."""
+        lines = []
+        for title, table, name in (("type", self.types, str),
+                                   ("path", self.paths, "".join)):
+            if not table:
+                continue
+            rows = [(name(key), str(calls), "%.3f" % (seconds * 1e3),
+                     str(nbytes))
+                    for key, (calls, seconds, nbytes)
+                    in self._rows(table)[:limit]]
+            header = (title, "calls", "time (ms)", "bytes")
+            widths = [max(len(row[i]) for row in rows + [header])
+                      for i in range(4)]
+            fmt = "%%-%ds  %%%ds  %%%ds  %%%ds" % tuple(widths)
+            if lines:
+                lines.append("")
+            lines.append(fmt % header)
+            lines.append(fmt % tuple("-" * w for w in widths))
+            lines.extend(fmt % row for row in rows)
+        return "\n".join(lines)
+
+    def to_json(self):
+        """Return the profile as a JSON-serializable dict."""
+        def entries(table, key_name, name):
+            return [{key_name: name(key), "calls": calls,
+                     "seconds": seconds, "bytes": nbytes}
+                    for key, (calls, seconds, nbytes) in self._rows(table)]
+        return {"types": entries(self.types, "type", str),
+                "paths": entries(self.paths, "path", "".join)}
+
+    def dump_json(self, file):
+        """Write to_json() to file, a path or a text file object."""
+        if isinstance(file, str):
+            with open(file, "w") as f:
+                json.dump(self.to_json(), f, indent=2)
+        else:
+            json.dump(self.to_json(), file, indent=2)
+
+    def collapsed(self):
+        """Return the profile in collapsed-stack format.
+
+        There is one line per path (per type if no paths were recorded),
+        with the exclusive time in microseconds, e.g.
+        'root;["users"];[*];.address 1234'.
+        """
+        if self.paths:
+            items = [(";".join(path), seconds)
+                     for path, (_, seconds, _) in self.paths.items()]
+        else:
+            items = [(name, seconds)
+                     for name, (_, seconds, _) in self.types.items()]
+        return "".join("%s %d\n" % (stack, round(seconds * 1e6))
+                       for stack, seconds in items)
+
+
+class _SaveFrame:
+    # State of an object being saved by ProfilingPickler.save().
+    __slots__ = ("obj", "path", "child_seconds", "child_bytes", "keyed",
+                 "key", "expect_value", "children")
+
+    def __init__(self, obj, path, keyed):
+        self.obj = obj
+        self.path = path
+        self.child_seconds = 0.0
+        self.child_bytes = 0
+        # None, "item" for dict items or "attr" for instance state
+        self.keyed = keyed
+        self.key = None
+        self.expect_value = False
+        # Paths of the children, by segment, to share the tuples
+        self.children = {}
+
+
+_SEQUENCE_TYPES = frozenset([list, tuple, set, frozenset])
+
+
+class _ByteCounter:
+    __slots__ = ("n",)
+
+    def __init__(self):
+        self.n = 0
+
+
+def _counting(func, counter):
+    def write(*args):
+        for data in args:
+            counter.n += len(data)
+        return func(*args)
+    return write
+
+
+class ProfilingPickler(my_pickle._Pickler):
+    """_Pickler recording a PickleProfile in self.profile.
+
+    Accepts the same arguments as _Pickler, plus *profile* to accumulate
+    into an existing PickleProfile.
+    """
+
+    def __init__(self, file, protocol=None, *, profile=None, **kwargs):
+        super().__init__(file, protocol, **kwargs)
+        self.profile = profile if profile is not None else PickleProfile()
+        self._written = counter = _ByteCounter()
+        self.write = _counting(self.write, counter)
+        self._write_large_bytes = _counting(self._write_large_bytes, counter)
+        self._frames = []
+
+    def _plan_memo(self, func, obj):
+        # The first pass of the minimal_memo mode writes nothing: keep it
+        # out of the profile.
+        profile = self.profile
+        self.profile = PickleProfile()
+        try:
+            return super()._plan_memo(func, obj)
+        finally:
+            self.profile = profile
+
+    def _child(self, obj, parent):
+        # Return the path of obj and whether its items are keyed.
+        if parent.keyed is not None:
+            if not parent.expect_value:
+                # Keys are accounted to the dict itself.
+                parent.key = obj
+                parent.expect_value = True
+                return parent.path, None
+            parent.expect_value = False
+            key = parent.key
+            if parent.keyed == "attr" and type(key) is str:
+                segment = "." + key
+            elif type(key) is str:
+                segment = "[%s]" % json.dumps(key, ensure_ascii=False)
+            elif type(key) is int:
+                segment = "[%d]" % key
+            else:
+                segment = "[*]"
+        elif type(parent.obj) in _SEQUENCE_TYPES:
+            segment = "[*]"
+        else:
+            # Parts of a __reduce__() value: the state dict of an instance
+            # is transparent, everything else belongs to the instance.
+            if type(obj) is dict and obj is getattr(parent.obj, "__dict__",
+                                                    None):
+                return parent.path, "attr"
+            return parent.path, None
+        path = parent.children.get(segment)
+        if path is None:
+            path = parent.children[segment] = parent.path + (segment,)
+        return path, None
+
+    def save(self, obj, save_persistent_id=True):
+        frames = self._frames
+        if frames:
+            path, keyed = self._child(obj, frames[-1])
+        else:
+            path, keyed = ("root",), None
+        if keyed is None and type(obj) is dict:
+            keyed = "item"
+        frame = _SaveFrame(obj, path, keyed)
+        frames.append(frame)
+        written = self._written
+        start_bytes = written.n
+        start = perf_counter()
+        try:
+            super().save(obj, save_persistent_id)
+        finally:
+            seconds = perf_counter() - start
+            nbytes = written.n - start_bytes
+            frames.pop()
+            if frames:
+                parent = frames[-1]
+                parent.child_seconds += seconds
+                parent.child_bytes += nbytes
+            self.profile.add(_type_name(type(obj)), path,
+                             seconds - frame.child_seconds,
+                             nbytes - frame.child_bytes)
+
+
+_OPCODE_NAMES = {code[0]: name for name, code in vars(my_pickle).items()
+                 if name.lstrip("_").isupper() and type(code) is bytes
+                 and len(code) == 1}
+
+
+def _profiled(func, opname):
+    def op(self):
+        if self._unframer is not self._counted_unframer:
+            self._count_reads()
+        counter = self._read
+        # The opcode byte itself was read by load().
+        counter.n += 1
+        start_bytes = counter.n - 1
+        start = perf_counter()
+        try:
+            func(self)
+        finally:
+            seconds = perf_counter() - start
+            stack = self.stack
+            name = _type_name(type(stack[-1])) if stack else "<%s>" % opname
+            self.profile.add(name, None, seconds, counter.n - start_bytes)
+    op.__name__ = func.__name__
+    return op
+
+
+class ProfilingUnpickler(my_pickle._Unpickler):
+    """_Unpickler recording a PickleProfile in self.profile.
+
+    Every opcode is accounted to the type of the object on top of the
+    stack after it ran (the object built or the container filled), or to
+    <OPCODE> if the stack is empty.  No paths are recorded.
+    """
+
+    dispatch = {code: _profiled(func, _OPCODE_NAMES.get(code, str(code)))
+                for code, func in my_pickle._Unpickler.dispatch.items()}
+
+    def __init__(self, file, *, profile=None, **kwargs):
+        super().__init__(file, **kwargs)
+        self.profile = profile if profile is not None else PickleProfile()
+        self._read = _ByteCounter()
+        self._counted_unframer = None
+
+    def _count_reads(self):
+        # Called at the first opcode of each load(), once load() has set up
+        # a new unframer.
+        unframer = self._counted_unframer = self._unframer
+        counter = self._read
+
+        def read(n):
+            data = unframer.read(n)
+            counter.n += len(data)
+            return data
+
+        def readline():
+            data = unframer.readline()
+            counter.n += len(data)
+            return data
+
+        def readinto(buf):
+            n = unframer.readinto(buf)
+            counter.n += n
+            return n
+
+        self.read = read
+        self.readline = readline
+        self.readinto = readinto
@@ -0,0 +1,1516 @@
+import dataclasses
+import enum
+import io
+import pytest
+import my_pickle
+
+
+# 覆盖多种类型的样例对象（原子类型、容器、共享引用、递归结构、自定义类）
+class Record:
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def __eq__(self, other):
+        return (isinstance(other, Record) and self.name == other.name
+                and self.value == other.value)
+
+
+def make_samples():
+    shared = ["shared"]
+    self_ref = []
+    self_ref.append(self_ref)
+    return [
+        42, -100, 10 ** 18, 3.14, True, None, "hello", "中文测试",
+        b"\x01\x02", bytearray(b"test"), (), (1, 2, 3), (1, 2, 3, 4),
+        [1, "a", 3.14, True], {"a": 1, "b": [2, 3]}, {1, 2, 3},
+        frozenset([1, 2]), [shared, shared], self_ref, complex(1, 2),
+        Record("r", [1, 2]), [Record("x", i) for i in range(3)],
+        list(range(2500)), b"\x00" * (70 * 1024), "s" * 70000,
+    ]
+
+
+def dumps_py(obj, protocol, pickler_class=my_pickle._Pickler, **kwargs):
+    f = io.BytesIO()
+    pickler_class(f, protocol, **kwargs).dump(obj)
+    return f.getvalue()
+
+
+class GenericPickler(my_pickle._Pickler):
+    """始终走通用 save() 的 Pickler，用作字节级对照"""
+    def _hooks_allow_fast_save(self):
+        return False
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_fast_save_is_byte_identical(protocol):
+    for obj in make_samples():
+        data = dumps_py(obj, protocol)
+        assert data == dumps_py(obj, protocol, GenericPickler)
+        # 反序列化后再次序列化应得到相同字节（递归结构也适用）
+        assert dumps_py(my_pickle._loads(data), protocol) == data
+
+
+def test_fast_save_respects_hooks():
+    # 子类定义的 persistent_id 仍需对每个对象生效
+    class PidPickler(my_pickle._Pickler):
+        def persistent_id(self, obj):
+            return "pid" if obj == "secret" else None
+
+    assert not PidPickler(io.BytesIO())._fast_save_ok
+    assert b"pid" in dumps_py(["secret"], 4, PidPickler)
+
+    # 构造之后在实例上设置的钩子同样需要生效
+    f = io.BytesIO()
+    p = my_pickle._Pickler(f, 4)
+    p.reducer_override = lambda obj: (str, ("X",)) if obj == 7 else NotImplemented
+    p.dump([7, 8])
+    assert my_pickle._loads(f.getvalue()) == ["X", 8]
+    assert "save" not in vars(p)
+
+
+@pytest.mark.skipif(not my_pickle._HAVE_PICKLE_BUFFER,
+                    reason="需要 PickleBuffer")
+def test_in_band_picklebuffer_is_zero_copy():
+    import tracemalloc
+    payload = bytearray(b"\x07" * (8 * 1024 * 1024))
+
+    class NullSink:
+        def __init__(self):
+            self.size = 0
+
+        def write(self, data):
+            self.size += len(data)
+
+    # 带内写入不应再生成与载荷等大的临时 bytes 对象
+    sink = NullSink()
+    tracemalloc.start()
+    my_pickle._Pickler(sink, 5).dump(my_pickle.PickleBuffer(payload))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert sink.size > len(payload)
+    assert peak < len(payload) // 8
+
+    # 输出与直接 pickle 同内容的 bytearray / bytes 完全一致
+    assert (dumps_py(my_pickle.PickleBuffer(payload), 5)
+            == dumps_py(payload, 5))
+    assert (dumps_py(my_pickle.PickleBuffer(b"abc"), 5)
+            == dumps_py(b"abc", 5))
+
+
+@pytest.mark.skipif(not my_pickle._HAVE_PICKLE_BUFFER,
+                    reason="需要 PickleBuffer")
+def test_in_band_picklebuffer_is_memoized():
+    pb = my_pickle.PickleBuffer(bytearray(b"xyz"))
+    result = my_pickle._loads(dumps_py([pb, pb], 5))
+    assert result == [bytearray(b"xyz"), bytearray(b"xyz")]
+    assert result[0] is result[1]
+
+
+@pytest.mark.skipif(not my_pickle._HAVE_PICKLE_BUFFER,
+                    reason="需要 PickleBuffer")
+def test_in_band_picklebuffer_view_outlives_write():
+    class KeepingSink:
+        def __init__(self):
+            self.parts = []
+
+        def write(self, data):
+            self.parts.append(data)
+
+    # 保留写入对象的文件在 dump() 之后仍可读取载荷视图
+    for payload in (bytearray(b"\x05" * 200000), b"\x06" * 200000):
+        sink = KeepingSink()
+        my_pickle._Pickler(sink, 5).dump(my_pickle.PickleBuffer(payload))
+        assert b"".join(sink.parts) == dumps_py(payload, 5)
+
+
+def make_multi_frame_object():
+    # 多个帧 + 一个超过帧大小的大对象
+    return [list(range(i, i + 500)) for i in range(0, 100000, 500)] + [
+        b"\x01" * (200 * 1024), "tail"]
+
+
+class FrameRecordingSink:
+    """记录每次写入时 Pickler 使用的帧缓冲区；keep=True 时保留视图不复制"""
+    def __init__(self, keep=False):
+        self.pickler = None
+        self.frames = set()
+        self.chunks = []
+        self.keep = keep
+
+    def write(self, data):
+        frame = self.pickler.framer.current_frame
+        if frame is not None:
+            self.frames.add(id(frame))
+        self.chunks.append(data if self.keep else bytes(data))
+
+    def getvalue(self):
+        return b"".join(self.chunks)
+
+
+@pytest.mark.parametrize("keep", [False, True])
+def test_frame_buffer_is_reused(keep):
+    obj = make_multi_frame_object()
+    sink = FrameRecordingSink(keep)
+    sink.pickler = my_pickle._Pickler(sink, 4)
+    sink.pickler.dump(obj)
+    assert sink.getvalue() == dumps_py(obj, 4)
+    if keep:
+        # 文件对象延迟访问帧数据时，每个帧都必须使用新的缓冲区
+        assert len(sink.frames) > 3
+    else:
+        assert len(sink.frames) == 1
+
+
+@pytest.mark.parametrize("protocol", [3, 4, 5])
+def test_gather_write_to_raw_file(tmp_path, protocol):
+    obj = make_multi_frame_object()
+    path = tmp_path / "raw.pkl"
+    with open(path, "wb", buffering=0) as f:
+        p = my_pickle._Pickler(f, protocol)
+        assert p.framer.file_writev is not None
+        p.dump(obj)
+        p.dump("second")
+    expected = io.BytesIO()
+    p = my_pickle._Pickler(expected, protocol)
+    p.dump(obj)
+    p.dump("second")
+    assert path.read_bytes() == expected.getvalue()
+    # 带缓冲的文件对象仍然使用 write()
+    with open(path, "wb") as f:
+        assert my_pickle._Pickler(f, protocol).framer.file_writev is None
+
+
+def test_gather_write_resumes_partial_writes(monkeypatch, tmp_path):
+    written = []
+
+    def writev(fd, buffers):
+        # 每次最多写入 5 个字节
+        data = b"".join(bytes(b) for b in buffers)[:5]
+        written.append(data)
+        return len(data)
+
+    monkeypatch.setattr(my_pickle.os, "writev", writev, raising=False)
+    with open(tmp_path / "partial", "wb", buffering=0) as f:
+        write_all = my_pickle._gather_writer(f)
+        write_all([b"abc", b"", memoryview(b"defghij"), b"klm"])
+    assert b"".join(written) == b"abcdefghijklm"
+
+
+@pytest.mark.parametrize("protocol", [3, 4, 5])
+def test_packed_sequences_load_with_stock_pickle(protocol):
+    import pickle
+    cases = [
+        [i * 0.25 for i in range(1000)],
+        [float("inf"), float("-inf"), -0.0] * 10,
+        list(range(-100, 100)),
+        tuple(range(30000, 31000)),
+        [-2 ** 63, 2 ** 63 - 1] * 10,
+        [[1.5] * 20, [1.5] * 20],
+    ]
+    for obj in cases:
+        data = dumps_py(obj, protocol, packed_sequences=True)
+        result = pickle.loads(data)
+        assert result == obj
+        assert type(result) is type(obj)
+        assert my_pickle._loads(data) == obj
+    # 打包后体积和 save() 调用次数都应显著减少
+    floats = [i * 0.5 for i in range(5000)]
+    assert (len(dumps_py(floats, protocol, packed_sequences=True))
+            < len(dumps_py(floats, protocol)))
+    small_ints = list(range(100)) * 50
+    assert (len(dumps_py(small_ints, protocol, packed_sequences=True))
+            < len(dumps_py(small_ints, protocol)) * 0.6)
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_packed_sequences_fallback(protocol):
+    # 不满足条件的序列保持原有编码
+    cases = [
+        [1, 2.0] * 10,            # 混合类型
+        [True, False] * 10,       # bool 不是 int
+        [2 ** 64] * 20,           # 超出 64 位
+        [1.0] * 15,               # 太短
+        ["a"] * 20,
+    ]
+    for obj in cases:
+        assert (dumps_py(obj, protocol, packed_sequences=True)
+                == dumps_py(obj, protocol))
+    if protocol < 3:
+        obj = [0.5] * 100
+        assert (dumps_py(obj, protocol, packed_sequences=True)
+                == dumps_py(obj, protocol))
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_dump_iter_loads_as_container(protocol):
+    import pickle
+    n = 2500  # 跨越多个批次
+    rows = lambda: ({"id": i, "name": "row%d" % i} for i in range(n))
+    cases = [
+        ("list", rows(), list(rows())),
+        ("dict", ((i, str(i)) for i in range(n)),
+         {i: str(i) for i in range(n)}),
+        ("dict", {"a": 1, "b": 2}, {"a": 1, "b": 2}),
+        ("set", (i % 1500 for i in range(n)), set(range(1500))),
+        ("list", iter([]), []),
+        ("set", iter([]), set()),
+    ]
+    for kind, iterable, expected in cases:
+        f = io.BytesIO()
+        my_pickle.dump_iter(iterable, f, kind, protocol)
+        result = pickle.loads(f.getvalue())
+        assert result == expected
+        assert type(result) is type(expected)
+
+    # 单个批次内的内容与 dumps 完整列表的结果等价
+    items = [1, "a", (2, 3), None]
+    f = io.BytesIO()
+    my_pickle.dump_iter(iter(items), f, protocol=protocol)
+    assert my_pickle._loads(f.getvalue()) == items
+
+
+def test_dump_iter_memory_is_bounded():
+    import weakref
+    refs = []
+
+    def produce():
+        for i in range(10000):
+            item = Record("item", i)
+            refs.append(weakref.ref(item))
+            yield [item, "shared"]
+
+    sink = io.BytesIO()
+    p = my_pickle._Pickler(sink, 4)
+    p.dump_iter(produce())
+    # 已写出的批次不会被 memo 保留
+    assert sum(r() is not None for r in refs) <= p._BATCHSIZE
+    assert dict.__len__(p.memo) <= 4 * p._BATCHSIZE
+    assert len(my_pickle._loads(sink.getvalue())) == 10000
+
+    with pytest.raises(ValueError):
+        p.dump_iter([], kind="tuple")
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_canonical_sets_are_order_independent(protocol):
+    items = [3, -1, 2.5, float("nan"), "b", "a", b"x", None, True,
+             (1, "a"), (1, 2), frozenset(["z", "y"]), complex(1, 2)]
+    forward, backward = set(), set()
+    for item in items:
+        forward.add(item)
+    for item in reversed(items):
+        backward.add(item)
+    d1 = {"k%d" % i: i for i in range(50)}
+    d2 = dict(reversed(list(d1.items())))
+    for a, b in [(forward, backward), (frozenset(forward), frozenset(backward)),
+                 (d1, d2)]:
+        data = dumps_py(a, protocol, canonical=True, sort_dicts=True)
+        assert data == dumps_py(b, protocol, canonical=True, sort_dicts=True)
+        assert dumps_py(my_pickle._loads(data), protocol, canonical=True,
+                        sort_dicts=True) == data
+    # 未开启 sort_dicts 时字典保持插入顺序
+    assert (dumps_py(d1, protocol, canonical=True)
+            != dumps_py(d2, protocol, canonical=True))
+    with pytest.raises(ValueError):
+        my_pickle._Pickler(io.BytesIO(), protocol, sort_dicts=True)
+
+
+def test_canonical_self_containing_sets():
+    from concurrent.futures import ThreadPoolExecutor
+    # 集合经由对象状态包含自身时不会无限递归
+    items = set()
+    for i in range(20):
+        point = Point(i)
+        point.owner = items
+        items.add(point)
+    data = dumps_py(items, 4, canonical=True, sort_dicts=True)
+    loaded = my_pickle._loads(data)
+    assert all(p.owner is loaded for p in loaded)
+    # 每个 pickler 各自记录正在排序的容器，并发时输出不变
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(
+            lambda _: dumps_py(items, 4, canonical=True, sort_dicts=True),
+            range(16)))
+    assert set(results) == {data}
+
+
+def test_canonical_is_independent_of_hash_seed():
+    import subprocess
+    import sys
+    import os
+    code = ("import io, hashlib, my_pickle\n"
+            "obj = [set(map(str, range(1000))), frozenset(map(str, range(99))),"
+            " {str(i): (str(i), i) for i in range(100)}]\n"
+            "f = io.BytesIO()\n"
+            "my_pickle._Pickler(f, 4, canonical=True, sort_dicts=True).dump(obj)\n"
+            "print(hashlib.sha256(f.getvalue()).hexdigest())\n")
+    digests = set()
+    for seed in ("1", "2"):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        out = subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                             cwd=os.path.dirname(my_pickle.__file__),
+                             capture_output=True, text=True).stdout
+        digests.add(out)
+    assert len(digests) == 1
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_digest_matches_hash_of_dumps(protocol):
+    import hashlib
+    for obj in make_samples() + [make_multi_frame_object()]:
+        data = dumps_py(obj, protocol)
+        for algorithm in ("sha256", "md5"):
+            expected = hashlib.new(algorithm, data).hexdigest()
+            assert my_pickle.digest(obj, protocol, algorithm).hexdigest() == expected
+
+
+@pytest.mark.parametrize("block_size", [1000, 4096, 1 << 20])
+def test_tree_digest_hashes_fixed_blocks(block_size):
+    import hashlib
+    obj = make_multi_frame_object()
+    data = dumps_py(obj, 5)
+    leaves = b"".join(hashlib.sha256(data[i:i + block_size]).digest()
+                      for i in range(0, len(data), block_size))
+    h = my_pickle.digest(obj, 5, tree=True, block_size=block_size,
+                         max_workers=3)
+    assert h.hexdigest() == hashlib.sha256(leaves).hexdigest()
+    with pytest.raises(ValueError):
+        my_pickle.digest(obj, 5, tree=True, block_size=0)
+
+
+def test_global_cache_skips_repeated_lookups(monkeypatch):
+    import builtins
+    import sys
+    import types
+    calls = []
+
+    def counting_import(name, *args, **kwargs):
+        calls.append(name)
+        return builtins.__import__(name, *args, **kwargs)
+
+    monkeypatch.setattr(my_pickle, "__import__", counting_import, raising=False)
+    first = dumps_py(Record, 4)
+    assert dumps_py(Record, 4) == first
+    assert dumps_py(Record, 2) == dumps_py(Record, 2, GenericPickler)
+    assert calls.count(__name__) <= 1
+
+    # 导入新模块后缓存失效，重新检查对象身份
+    cls = Record
+    monkeypatch.setattr(sys.modules[__name__], "Record", make_samples)
+    monkeypatch.setitem(sys.modules, "_global_cache_probe",
+                        types.ModuleType("_global_cache_probe"))
+    with pytest.raises(my_pickle.PicklingError):
+        dumps_py(cls, 4)
+
+
+def test_global_cache_sees_rebound_names(monkeypatch):
+    import sys
+    import types
+    module = types.ModuleType("_global_cache_rebind")
+    monkeypatch.setitem(sys.modules, module.__name__, module)
+    code = "class A:\n    class B:\n        pass\n"
+    exec(code, vars(module))
+    old_a, old_b = module.A, module.A.B
+    assert my_pickle._loads(dumps_py(old_a, 4)) is old_a
+    assert my_pickle._loads(dumps_py(old_b, 4)) is old_b
+    # 模块属性被重新绑定后（sys.modules 大小不变），旧对象不能再按名字写出
+    exec(code, vars(module))
+    for obj in (old_a, old_b):
+        with pytest.raises(my_pickle.PicklingError,
+                           match="not the same object"):
+            dumps_py(obj, 4)
+    assert my_pickle._loads(dumps_py(module.A.B, 4)) is module.A.B
+
+
+def test_global_cache_sees_new_extension_codes():
+    import copyreg
+    data = dumps_py(Record, 2)
+    copyreg.add_extension(__name__, "Record", 0xf00d)
+    try:
+        assert dumps_py(Record, 2) == b"\x80\x02\x83\x0d\xf0."
+    finally:
+        copyreg.remove_extension(__name__, "Record", 0xf00d)
+    assert dumps_py(Record, 2) == data
+
+
+def make_snapshot():
+    # 可压缩性高的快照数据，跨越多个压缩块
+    return {"rows": [{"id": i, "name": "row%d" % (i % 10), "ok": True}
+                     for i in range(20000)],
+            "blob": b"\x00\x01" * (600 * 1024), "tail": "end"}
+
+
+@pytest.mark.parametrize("codec", ["zlib", "bz2", "lzma"])
+def test_compressed_frames_round_trip(codec):
+    import pickle
+    obj = make_snapshot()
+    raw = dumps_py(obj, 5)
+    f = io.BytesIO()
+    p = my_pickle._Pickler(f, 5, compression=codec, compression_workers=2)
+    p.dump(obj)
+    p.dump("second")
+    data = f.getvalue()
+    assert len(data) < len(raw) // 4
+    # 同一文件中连续的两个 pickle 都能读出，读取不越过容器末尾
+    f.seek(0)
+    u = my_pickle._Unpickler(f)
+    assert u.load() == obj
+    assert u.load() == "second"
+    assert f.read() == b""
+    # 只有本模块的 Unpickler 能识别压缩容器
+    with pytest.raises(pickle.UnpicklingError):
+        pickle.loads(data)
+    with pytest.raises(my_pickle.UnpicklingError):
+        my_pickle._loads(data[:len(data) // 2])
+
+
+@pytest.mark.skipif(not my_pickle._HAVE_PICKLE_BUFFER,
+                    reason="需要 PickleBuffer")
+def test_compressed_buffer_payloads():
+    from array import array
+    # 小于压缩块的带内缓冲区载荷
+    for size in (70000, 100000, 250000):
+        obj = [my_pickle.PickleBuffer(bytearray(b"\x01" * size)),
+               array("b", b"\x02" * size), "tail"]
+        data = dumps_py(obj, 5, compression="zlib")
+        loaded = my_pickle._loads(data)
+        assert loaded[0] == bytearray(b"\x01" * size)
+        assert loaded[1] == obj[1] and loaded[2] == "tail"
+
+
+def test_compression_threads_are_shut_down():
+    import threading
+    threads = set(threading.enumerate())
+    obj = make_snapshot()
+    # 压缩中途出错时线程池也被关闭
+    f = io.BytesIO()
+    p = my_pickle._Pickler(f, 5, compression="zlib", compression_workers=2)
+    with pytest.raises(my_pickle.PicklingError):
+        p.dump([obj, lambda: None])
+    assert p._compressor.executor is None
+    assert set(threading.enumerate()) <= threads
+    # 读到一半就关闭解压器，预读的块被丢弃
+    data = dumps_py(obj, 5, compression="zlib")
+    assert data[:1] == my_pickle._COMPRESSED
+    f = io.BytesIO(data[2:])
+    d = my_pickle._FrameDecompressor(f.read, data[1], max_workers=2)
+    assert len(d.read(10)) == 10 and d.pending
+    d.close()
+    assert d.executor is None and not d.pending
+    assert my_pickle._loads(data) == obj
+
+
+def test_compression_option_checks():
+    with pytest.raises(ValueError):
+        my_pickle._Pickler(io.BytesIO(), 3, compression="zlib")
+    with pytest.raises(ValueError):
+        my_pickle._Pickler(io.BytesIO(), 5, compression="zip")
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_pickled_size_matches_dumps(protocol):
+    objs = make_samples() + [
+        make_multi_frame_object(), "a" * 200000, "é中" * 70000,
+        ["\ud800" * 40000, "x" * 65536], [b"z" * 65535, b"w" * 3]]
+    for obj in objs:
+        assert my_pickle.pickled_size(obj, protocol) == len(dumps_py(obj, protocol))
+    if my_pickle._HAVE_PICKLE_BUFFER and protocol >= 5:
+        obj = [my_pickle.PickleBuffer(bytearray(100000)), "tail"]
+        for callback in (None, lambda buf: False):
+            assert (my_pickle.pickled_size(obj, protocol, buffer_callback=callback)
+                    == len(dumps_py(obj, protocol, buffer_callback=callback)))
+
+
+def test_pickled_size_does_not_buffer_output():
+    import tracemalloc
+    obj = ["x" * (16 * 1024 * 1024), b"\x01" * (16 * 1024 * 1024)]
+    tracemalloc.start()
+    try:
+        size = my_pickle.pickled_size(obj, 4)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert size == len(dumps_py(obj, 4))
+    assert peak < 1024 * 1024
+
+
+def test_profiling_pickler_and_unpickler(tmp_path):
+    import json
+    import pickle_profile
+    obj = {"users": [Record("u%d" % i, "addr") for i in range(20)],
+           "blob": b"\x00" * 100000}
+    f = io.BytesIO()
+    p = pickle_profile.ProfilingPickler(f, 4)
+    p.dump(obj)
+    data = f.getvalue()
+    # 剖析不改变输出
+    assert data == dumps_py(obj, 4)
+    profile = p.profile
+    name = Record.__module__ + ".Record"
+    assert profile.types[name][0] == 20
+    assert profile.types["bytes"][2] > 100000
+    paths = {"".join(path): entry for path, entry in profile.paths.items()}
+    assert paths['root["users"][*].value'][0] == 20
+    assert sum(e[2] for e in profile.types.values()) <= len(data)
+    assert 'root;["users"];[*];.name ' in profile.collapsed()
+    assert "time (ms)" in profile.format_table()
+    out = tmp_path / "profile.json"
+    profile.dump_json(str(out))
+    assert json.loads(out.read_text())["types"]
+
+    f.seek(0)
+    u = pickle_profile.ProfilingUnpickler(f)
+    assert u.load() == obj
+    assert sum(e[2] for e in u.profile.types.values()) == len(data)
+    assert u.profile.types[name][0] >= 20
+    # 未使用剖析类时普通 Pickler 不受影响
+    assert my_pickle._Pickler(io.BytesIO())._fast_save_ok
+
+
+def test_profiling_pickler_with_minimal_memo():
+    import pickle_profile
+    obj = {"users": [Record("u%d" % i, "addr") for i in range(20)],
+           "blob": b"\x00" * 100000}
+    f = io.BytesIO()
+    p = pickle_profile.ProfilingPickler(f, 4, minimal_memo=True)
+    p.dump(obj)
+    data = f.getvalue()
+    assert data == dumps_py(obj, 4, minimal_memo=True)
+    # 第一遍不计入剖析，字节数来自真正的写出
+    profile = p.profile
+    assert profile.types[Record.__module__ + ".Record"][0] == 20
+    assert profile.types["bytes"][2] > 100000
+    written = sum(e[2] for e in profile.types.values())
+    assert 0.9 * len(data) < written <= len(data)
+
+
+class Node:
+    def __init__(self, next=None):
+        self.next = next
+
+
+class SelfReducing:
+    def __reduce__(self):
+        return (SelfReducing, (self,))
+
+
+def make_recursive_containers():
+    t = ([],)
+    t[0].append(t)
+    big = ([],) * 5
+    big[0].append(big)
+    fs = frozenset([Node([])])
+    fs_list = next(iter(fs)).next
+    fs_list.append(fs)
+    d = {}
+    d["self"] = (d, [d], {1: d})
+    return [t, big, fs, d, Node(Node(Node()))]
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_iterative_save_is_byte_identical(protocol):
+    objs = make_samples() + make_recursive_containers() + [
+        make_multi_frame_object(), [list(range(3000))] * 3]
+    for obj in objs:
+        for kwargs in ({}, {"canonical": True, "sort_dicts": True},
+                       {"packed_sequences": True}):
+            expected = dumps_py(obj, protocol, **kwargs)
+            assert dumps_py(obj, protocol, iterative=True, **kwargs) == expected
+
+    # 钩子仍然对每个对象生效
+    class PidPickler(my_pickle._Pickler):
+        def persistent_id(self, obj):
+            return "pid" if obj == "secret" else None
+
+    obj = [["secret", Node()]]
+    assert (dumps_py(obj, protocol, PidPickler, iterative=True)
+            == dumps_py(obj, protocol, PidPickler))
+
+    # 无法终止的递归（__reduce__ 的参数包含对象自身）与递归版本一样报错
+    for kwargs in ({}, {"iterative": True}):
+        with pytest.raises(RecursionError):
+            dumps_py(SelfReducing(), protocol, **kwargs)
+
+
+def test_iterative_save_handles_deep_nesting():
+    import sys
+    depth = 5 * sys.getrecursionlimit()
+    nested = []
+    for _ in range(depth):
+        nested = [nested]
+    linked = None
+    for _ in range(depth):
+        linked = Node(linked)
+    for obj in (nested, linked):
+        with pytest.raises(RecursionError):
+            dumps_py(obj, 4)
+        data = dumps_py(obj, 4, iterative=True)
+        loaded = my_pickle._loads(data)
+        for _ in range(depth):
+            loaded = loaded[0] if type(loaded) is list else loaded.next
+        assert loaded in ([], None)
+
+
+@pytest.mark.skipif(not my_pickle._HAVE_PICKLE_BUFFER,
+                    reason="需要 PickleBuffer")
+def test_sidecar_round_trip(tmp_path):
+    import os
+    big = b"\x11" * 300000
+    obj = {"a": big, "b": big, "c": bytearray(b"\x22" * 200000),
+           "d": my_pickle.PickleBuffer(b"\x33" * 150000),
+           "small": b"tiny", "text": "x"}
+    path = tmp_path / "snap.pkl"
+    my_pickle.dump_with_sidecar(obj, path, threshold=100000)
+    # 大负载不在主文件中
+    assert os.path.getsize(path) < 1000
+    sidecar = str(path) + ".buffers"
+    loaded = my_pickle.load_with_sidecar(path)
+    assert loaded["a"] == big and loaded["a"].readonly
+    assert loaded["b"] is loaded["a"]
+    assert loaded["c"] == obj["c"] and not loaded["c"].readonly
+    assert loaded["d"] == b"\x33" * 150000
+    assert loaded["small"] == b"tiny"
+    # 写时复制：修改视图不会写回文件
+    loaded["c"][0] = 0
+    assert my_pickle.load_with_sidecar(path)["c"][0] == 0x22
+    # 每个缓冲区按页对齐
+    with open(sidecar, "rb") as f:
+        data = f.read()
+    for view in (loaded["a"], loaded["d"]):
+        assert data.index(bytes(view)) % 4096 == 0
+
+    with pytest.raises(ValueError):
+        my_pickle.dump_with_sidecar(obj, path, protocol=4)
+    with pytest.raises(ValueError):
+        my_pickle._Pickler(io.BytesIO(), 5, out_of_band_threshold=10)
+
+
+class TaggedBytes(bytearray):
+    pass
+
+
+class ReducingBytes(bytearray):
+    def __reduce__(self):
+        return bytes, (bytes(self),)
+
+
+@pytest.mark.skipif(not my_pickle._HAVE_PICKLE_BUFFER,
+                    reason="需要 PickleBuffer")
+def test_buffer_reducers_round_trip():
+    import pickle
+    from array import array
+    tagged = TaggedBytes(b"payload")
+    tagged.tag = 1
+    samples = [array("d", [1.5, -2.5]), array("u", "héllo"),
+               array("q", range(1000)),
+               memoryview(bytearray(range(24))).cast("i", [2, 3]),
+               memoryview(b"abcdef")[::2], tagged]
+    for obj in samples:
+        data = dumps_py(obj, 5)
+        for loads in (pickle.loads, my_pickle._loads):
+            loaded = loads(data)
+            assert type(loaded) is type(obj)
+            if type(obj) is memoryview:
+                assert loaded.tolist() == obj.tolist()
+                assert loaded.readonly == obj.readonly
+                assert loaded.format == obj.format
+            else:
+                assert loaded == obj
+        # 带外：缓冲区直接引用原对象的内存
+        buffers = []
+        data = dumps_py(obj, 5, buffer_callback=buffers.append)
+        assert len(buffers) == 1
+        if type(obj) is array:
+            obj[0] = obj[1]
+            assert pickle.loads(data, buffers=buffers) == obj
+    assert pickle.loads(dumps_py(tagged, 5)).tag == 1
+    # 状态与 bytearray.__reduce_ex__() 相同（不依赖 3.11 的 __getstate__）
+    for obj in (tagged, TaggedBytes(b"x")):
+        assert (my_pickle._reduce_bytearray_subclass(obj)[2]
+                == obj.__reduce_ex__(5)[2])
+
+    # 低协议与自定义 __reduce__ 不受影响
+    for obj in samples[:3] + [tagged]:
+        assert dumps_py(obj, 4) == pickle.dumps(obj, 4)
+    assert dumps_py(ReducingBytes(b"x"), 5) == pickle.dumps(
+        ReducingBytes(b"x"), 5)
+    with pytest.raises(my_pickle.PicklingError):
+        dumps_py(memoryview(array("u", "x")), 5)
+
+
+@pytest.mark.skipif(not my_pickle._HAVE_PICKLE_BUFFER,
+                    reason="需要 PickleBuffer")
+@pytest.mark.parametrize("iterative", [False, True])
+def test_buffer_reducers_release_buffers(iterative):
+    import pickle
+    from array import array
+    # 同一个 Pickler 连续 dump 时，已写出的对象仍可改变大小
+    a = array("d", [1.5] * 100000)
+    tagged = TaggedBytes(b"x" * 100)
+    f = io.BytesIO()
+    p = my_pickle._Pickler(f, 5, iterative=iterative)
+    p.dump([a, a, tagged])
+    a.append(2.5)
+    tagged.extend(b"y")
+    p.dump(a)
+    f.seek(0)
+    first = pickle.load(f)
+    assert first[0] is first[1] and len(first[0]) == 100000
+    assert first[2] == TaggedBytes(b"x" * 100)
+    # 交给 buffer_callback 的缓冲区不被释放
+    buffers = []
+    data = dumps_py(a, 5, buffer_callback=buffers.append)
+    assert pickle.loads(data, buffers=buffers) == a
+
+
+@pytest.mark.skipif(not my_pickle._HAVE_PICKLE_BUFFER,
+                    reason="需要 PickleBuffer")
+def test_register_buffer_reducer(monkeypatch):
+    monkeypatch.setattr(my_pickle, "_buffer_reducers",
+                        dict(my_pickle._buffer_reducers))
+    my_pickle.register_buffer_reducer(
+        TaggedBytes, lambda obj: (bytearray, (my_pickle.PickleBuffer(obj),)))
+    loaded = my_pickle._loads(dumps_py(TaggedBytes(b"abc"), 5))
+    assert type(loaded) is bytearray and loaded == b"abc"
+    with pytest.raises(TypeError):
+        my_pickle.register_buffer_reducer(TaggedBytes, None)
+
+
+class CountingSink(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def write(self, data):
+        self.calls += 1
+        return super().write(data)
+
+
+@pytest.mark.parametrize("protocol", range(0, 4))
+def test_write_buffer_for_unframed_protocols(protocol):
+    import pickle
+    obj = make_multi_frame_object() + [{"k": i} for i in range(2000)]
+    expected = io.BytesIO()
+    pickle._Pickler(expected, protocol).dump(obj)
+    unbuffered = CountingSink()
+    my_pickle._Pickler(unbuffered, protocol, write_buffer_size=0).dump(obj)
+    buffered = CountingSink()
+    pickler = my_pickle._Pickler(buffered, protocol, write_buffer_size=4096)
+    pickler.dump(obj)
+    # 输出不变，写调用数大幅减少
+    assert buffered.getvalue() == unbuffered.getvalue() == expected.getvalue()
+    assert buffered.calls * 50 < unbuffered.calls
+    assert buffered.calls <= len(expected.getvalue()) // 4096 + 3
+    # 小 pickle 只写一次
+    small = CountingSink()
+    my_pickle._Pickler(small, protocol).dump([1, "a", None])
+    assert small.calls == 1
+    assert my_pickle.pickled_size(obj, protocol) == len(expected.getvalue())
+    with pytest.raises(ValueError):
+        my_pickle._Pickler(io.BytesIO(), protocol, write_buffer_size=-1)
+
+
+class Point:
+    def __init__(self, i):
+        self.x = i
+        self.y = "p%d" % i
+
+
+class Marker:
+    pass
+
+
+class SlottedPoint:
+    __slots__ = ("x",)
+
+    def __init__(self, i):
+        self.x = i
+
+
+class StatefulPoint(Point):
+    def __getstate__(self):
+        return dict(vars(self), extra=1)
+
+
+def count_saves(monkeypatch, obj, protocol, **kwargs):
+    calls = [0]
+    fast = my_pickle._Pickler._save_fast
+
+    def counting(self, obj, save_persistent_id=True):
+        calls[0] += 1
+        fast(self, obj, save_persistent_id)
+    monkeypatch.setattr(my_pickle._Pickler, "_save_fast", counting)
+    data = dumps_py(obj, protocol, **kwargs)
+    monkeypatch.setattr(my_pickle._Pickler, "_save_fast", fast)
+    return data, calls[0]
+
+
+@pytest.mark.parametrize("protocol", range(2, 6))
+def test_compact_records(monkeypatch, protocol):
+    import pickle
+    records = [{"id": i, "name": "n%d" % i, "score": i / 4}
+               for i in range(2000)]
+    points = [Point(i) for i in range(100)]
+    obj = {"records": records, "points": points,
+           "mixed": [1, "x"] + [{"a": i} for i in range(20)] + [None]}
+    plain, plain_calls = count_saves(monkeypatch, obj, protocol)
+    compact, compact_calls = count_saves(monkeypatch, obj, protocol,
+                                         compact_records=True)
+    # 体积和 save() 调用次数都显著下降
+    assert len(compact) * 1.4 < len(plain)
+    # 协议 3 起数值列被打包
+    assert compact_calls * (3 if protocol >= 3 else 2) < plain_calls
+    for loaded in (pickle.loads(compact), my_pickle._loads(compact)):
+        assert loaded["records"] == records
+        assert loaded["mixed"] == obj["mixed"]
+        assert [type(p) for p in loaded["points"]] == [Point] * 100
+        assert [vars(p) for p in loaded["points"]] == [vars(p)
+                                                       for p in points]
+    assert dumps_py(obj, protocol, compact_records=True,
+                    iterative=True) == compact
+
+
+def test_compact_records_keeps_identity_and_hooks():
+    import pickle
+    records = [{"a": i, "b": i} for i in range(50)]
+    # 被其他位置引用的记录按原样写出
+    obj = [records, records[10:40]]
+    loaded = pickle.loads(dumps_py(obj, 4, compact_records=True))
+    assert loaded[1][0] is loaded[0][10]
+    shared = [{"a": i, "b": i} for i in range(50)]
+    index = {"first": shared[0]}
+    loaded = pickle.loads(dumps_py([shared, index], 4, compact_records=True))
+    assert loaded[1]["first"] is loaded[0][0]
+    # 不符合条件的类和钩子不受影响
+    for items in ([SlottedPoint(i) for i in range(30)],
+                  [StatefulPoint(i) for i in range(30)]):
+        assert (dumps_py(items, 4, compact_records=True)
+                == dumps_py(items, 4))
+
+    class Overriding(my_pickle._Pickler):
+        def reducer_override(self, obj):
+            return NotImplemented
+    points = [Point(i) for i in range(30)]
+    assert (dumps_py(points, 4, Overriding, compact_records=True)
+            == dumps_py(points, 4))
+
+
+@pytest.mark.parametrize("protocol", [2, 4])
+def test_compact_records_without_keys(protocol):
+    import pickle
+    # 没有键的记录没有列可写，按普通列表项写出
+    for items in ([{} for _ in range(20)], [Marker() for _ in range(20)],
+                  [{}] * 3 + [{"a": i} for i in range(20)] + [{}] * 20):
+        data = dumps_py(items, protocol, compact_records=True)
+        loaded = pickle.loads(data)
+        assert len(loaded) == len(items)
+        assert [type(x) for x in loaded] == [type(x) for x in items]
+        assert [vars(x) if isinstance(x, Marker) else x
+                for x in loaded] == [vars(x) if isinstance(x, Marker) else x
+                                     for x in items]
+
+
+def make_log_records(n):
+    import json
+    lines = [json.dumps({"level": "WARN" if i % 7 == 0 else "INFO",
+                         "service": "api-gateway",
+                         "path": "/api/v1/items/%d" % (i % 50),
+                         "latency": [0.25, 0.5, 1.5][i % 3],
+                         "pair": ["GET", "/api/v1"]})
+             for i in range(n)]
+    # 反序列化得到的相等字符串是不同的对象
+    return [json.loads(line) for line in lines]
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_dedupe_values(protocol):
+    import pickle
+    records = make_log_records(2000)
+    plain = dumps_py(records, protocol)
+    deduped = dumps_py(records, protocol, dedupe_values=True)
+    assert len(deduped) * 2.5 < len(plain)
+    assert pickle.loads(deduped) == my_pickle._loads(deduped) == records
+    assert dumps_py(records, protocol, dedupe_values=True,
+                    iterative=True) == deduped
+
+    # 只合并字节相同的值
+    big = 2 ** 70
+    n = 300
+    values = [0.0, -0.0, float("nan"), float("nan"), 1.5, 1.5, big, big + 0,
+              (1, "a"), (1, "a"), (True,), (1,), 1, True, "x" * n, "x" * n]
+    loaded = pickle.loads(dumps_py(values, protocol, dedupe_values=True))
+    assert [repr(x) for x in loaded] == [repr(x) for x in values]
+    assert [type(x) for x in loaded[10] + loaded[11]] == [bool, int]
+    assert loaded[5] is loaded[4] and loaded[9] is loaded[8]
+    assert loaded[15] is not loaded[14]
+
+
+class SmallTablePickler(my_pickle._Pickler):
+    _DEDUPE_MAX_ENTRIES = 4
+
+
+def test_dedupe_values_table_is_bounded():
+    import pickle
+    # 每个字符串都是不同的对象
+    values = ["value-%d" % (i % 10) for i in range(1000)]
+    f = io.BytesIO()
+    pickler = SmallTablePickler(f, 4, dedupe_values=True)
+    pickler.dump(values)
+    assert len(pickler._value_table) == 4
+    assert pickle.loads(f.getvalue()) == values
+    # 最近使用的值留在表中
+    f = io.BytesIO()
+    pickler = SmallTablePickler(f, 4, dedupe_values=True)
+    pickler.dump(["value-%d" % (0 if i % 2 else i) for i in range(20)])
+    assert (str, "value-0") in pickler._value_table
+    pickler.clear_memo()
+    assert not pickler._value_table
+    # dump_iter 忘记备忘录后，引用依然有效
+    f = io.BytesIO()
+    my_pickle._Pickler(f, 4, dedupe_values=True).dump_iter(iter(values))
+    assert pickle.loads(f.getvalue()) == values
+
+
+class Color(enum.Enum):
+    RED = 1
+    GREEN = (2, "g")
+
+
+def make_stdlib_values():
+    import datetime
+    import decimal
+    import pathlib
+    import uuid
+    tz = datetime.timezone(datetime.timedelta(hours=2))
+    start = datetime.datetime(2024, 1, 1)
+    return ([start + datetime.timedelta(seconds=7 * i) for i in range(3000)]
+            + [datetime.datetime(2024, 1, 1, tzinfo=tz),
+               datetime.datetime(2024, 1, 1, fold=1),
+               datetime.date(2024, 2, 29), datetime.time(1, 2, tzinfo=tz),
+               datetime.timedelta(1, 2, 3)]
+            + [decimal.Decimal(i) / 8 for i in range(3000)]
+            + [decimal.Decimal(1), decimal.Decimal(1), "1",
+               decimal.Decimal("-Infinity")]
+            + [uuid.UUID(int=i * 7919) for i in range(2000)]
+            + [uuid.UUID(int=1, is_safe=uuid.SafeUUID.safe), Color.RED,
+               Color.GREEN, pathlib.PurePosixPath("/a", "b"),
+               pathlib.PureWindowsPath("c:/x")])
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_stdlib_fast_paths_are_byte_identical(protocol):
+    import pickle
+    values = make_stdlib_values()
+    expected = io.BytesIO()
+    pickle._Pickler(expected, protocol).dump(values)
+    expected = expected.getvalue()
+    # 跨越多个帧，帧边界也必须一致
+    assert dumps_py(values, protocol) == expected
+    assert dumps_py(values, protocol, GenericPickler) == expected
+    assert dumps_py(values, protocol, iterative=True) == expected
+    assert my_pickle.pickled_size(values, protocol) == len(expected)
+    assert pickle.loads(expected) == values
+
+
+def test_stdlib_fast_paths_respect_dispatch_table():
+    import datetime
+    import pickle
+
+    class TablePickler(my_pickle._Pickler):
+        dispatch_table = {datetime.date: lambda d: (str, ("date",))}
+    value = [datetime.date(2024, 1, 1)]
+    assert pickle.loads(dumps_py(value, 4, TablePickler)) == ["date"]
+
+
+@dataclasses.dataclass
+class Row:
+    id: int
+    name: str
+    score: float
+    tags: list
+
+
+class SlottedRow:
+    __slots__ = ("id", "__secret", "tags")
+
+    def __init__(self, i):
+        self.id = i
+        self.__secret = "s%d" % i
+        if i % 3:
+            self.tags = [i]
+
+
+class MixedRow(SlottedRow):
+    def __init__(self, i):
+        super().__init__(i)
+        if i % 2:
+            self.extra = i
+
+
+def make_instance_rows(n):
+    shared = ["shared"]
+    rows = []
+    for i in range(n):
+        row = Point(i)
+        # 键相等但不是同一个对象
+        row.__dict__["k%d" % (i % 7)] = 2 ** 70 + i
+        rows += [Row(i, "r%d" % i, i / 3, shared if i % 5 else []),
+                 SlottedRow(i), MixedRow(i), row, Record("e", None)]
+    rows += [rows[0], vars(rows[0]), Point(0), SlottedPoint(1)]
+    del rows[-2].x
+    return rows
+
+
+@pytest.mark.parametrize("protocol", range(2, 6))
+def test_instance_layouts_are_byte_identical(protocol):
+    import pickle
+    rows = make_instance_rows(3000)
+    expected = io.BytesIO()
+    pickle._Pickler(expected, protocol).dump(rows)
+    expected = expected.getvalue()
+    # 跨越多个帧，帧边界也必须一致
+    assert dumps_py(rows, protocol) == expected
+    assert dumps_py(rows, protocol, GenericPickler) == expected
+    assert dumps_py(rows, protocol, iterative=True) == expected
+    assert dumps_py(rows, protocol, write_buffer_size=0) == expected
+    loaded = my_pickle._loads(expected)
+    assert loaded[0] == rows[0] and loaded[-4] is loaded[0]
+    assert loaded[2]._SlottedRow__secret == "s0"
+    # 复用 Pickler：清空 memo 后缓存的键引用必须失效
+    f = io.BytesIO()
+    pickler = my_pickle._Pickler(f, protocol)
+    pickler.dump(rows)
+    pickler.clear_memo()
+    f.seek(0)
+    f.truncate()
+    pickler.dump(rows)
+    assert f.getvalue() == expected
+
+
+def test_instance_layouts_respect_hooks():
+    import copyreg
+    import pickle
+    rows = [Row(i, "r", 0.5, None) for i in range(20)]
+
+    class TablePickler(my_pickle._Pickler):
+        dispatch_table = dict(copyreg.dispatch_table)
+        dispatch_table[Row] = lambda row: (str, (row.id,))
+    assert pickle.loads(dumps_py(rows, 4, TablePickler)) == [
+        str(i) for i in range(20)]
+    # 布局缓存之后注册的 dispatch_table 与 copyreg 条目同样生效
+    for use_copyreg in (False, True):
+        f = io.BytesIO()
+        p = my_pickle._Pickler(f, 4)
+        p.dump(rows)
+        assert Row in p._layouts
+        if use_copyreg:
+            copyreg.pickle(Row, lambda row: (str, (row.id,)))
+        else:
+            p.dispatch_table = {Row: lambda row: (str, (row.id,))}
+        try:
+            f.seek(0)
+            f.truncate()
+            p.clear_memo()
+            p.dump(rows)
+        finally:
+            copyreg.dispatch_table.pop(Row, None)
+        assert pickle.loads(f.getvalue()) == [str(i) for i in range(20)]
+    # sort_dicts 与 dedupe 模式下与通用路径逐字节一致
+    for kwargs in ({"canonical": True, "sort_dicts": True},
+                   {"dedupe_values": True}):
+        data = dumps_py(rows, 4, **kwargs)
+        assert pickle.loads(data) == rows
+        assert data == dumps_py(rows, 4, GenericPickler, **kwargs)
+
+
+class Hooked:
+    def __init__(self, x):
+        self.x = x
+
+
+@pytest.mark.parametrize("iterative", [False, True])
+@pytest.mark.parametrize("hook", ["__getstate__", "__reduce_ex__"])
+def test_instance_layouts_see_new_hooks(hook, iterative):
+    import pickle
+    objs = [Hooked(i) for i in range(5)]
+    f = io.BytesIO()
+    p = my_pickle._Pickler(f, 4, iterative=iterative)
+    p.dump(objs)
+    assert p._layouts[Hooked] is not None
+    # 两次 dump() 之间给类加上的钩子在下一次 dump() 生效
+    if hook == "__getstate__":
+        Hooked.__getstate__ = lambda self: {"x": -self.x}
+    else:
+        Hooked.__reduce_ex__ = lambda self, proto: (str, (self.x,))
+    try:
+        f.seek(0)
+        f.truncate()
+        p.clear_memo()
+        p.dump(objs)
+    finally:
+        delattr(Hooked, hook)
+    loaded = pickle.loads(f.getvalue())
+    if hook == "__getstate__":
+        assert [o.x for o in loaded] == [-i for i in range(5)]
+    else:
+        assert loaded == [str(i) for i in range(5)]
+    # 删除钩子后恢复按 __dict__ 保存
+    f.seek(0)
+    f.truncate()
+    p.clear_memo()
+    p.dump(objs)
+    assert [o.x for o in pickle.loads(f.getvalue())] == list(range(5))
+    assert f.getvalue() == dumps_py(objs, 4)
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_minimal_memo_matches_optimize(protocol):
+    import pickletools
+    samples = [x for x in make_samples() if len(dumps_py(x, protocol)) < 60000]
+    samples.append(make_log_records(50))
+    if protocol >= 2:
+        samples.append(make_instance_rows(20))
+    for obj in samples:
+        expected = pickletools.optimize(dumps_py(obj, protocol))
+        assert dumps_py(obj, protocol, minimal_memo=True) == expected
+        assert dumps_py(obj, protocol, GenericPickler,
+                        minimal_memo=True) == expected
+
+
+@pytest.mark.parametrize("protocol", [2, 4])
+def test_minimal_memo_keeps_sharing(protocol):
+    import pickle
+    shared = ["shared"]
+    obj = {"rows": make_instance_rows(1000), "logs": make_log_records(2000),
+           "shared": [shared, (shared,), shared]}
+    obj["self"] = obj
+    plain = dumps_py(obj, protocol)
+    minimal = dumps_py(obj, protocol, minimal_memo=True)
+    assert len(minimal) < len(plain) * 0.9
+    assert dumps_py(obj, protocol, minimal_memo=True, iterative=True) == minimal
+    for loaded in (pickle.loads(minimal), my_pickle._loads(minimal)):
+        assert loaded["self"] is loaded
+        assert loaded["shared"][0] is loaded["shared"][1][0]
+        assert loaded["logs"] == obj["logs"]
+        assert loaded["rows"][0] is loaded["rows"][-4]
+    # 只有被再次引用的对象进入 Unpickler 的 memo
+    memo_sizes = []
+    for data in (plain, minimal):
+        unpickler = my_pickle._Unpickler(io.BytesIO(data))
+        unpickler.load()
+        memo_sizes.append(len(unpickler.memo))
+    assert memo_sizes[1] * 4 < memo_sizes[0]
+    with pytest.raises(ValueError):
+        my_pickle._Pickler(io.BytesIO(), 4, minimal_memo=True,
+                           dedupe_values=True)
+    with pytest.raises(ValueError):
+        my_pickle._Pickler(io.BytesIO(), 5, minimal_memo=True,
+                           buffer_callback=list.append)
+
+
+def make_legacy_values():
+    # 需要与无需转义的 str、INT 与 LONG 的边界、浮点数，以及超过 256 项的 memo
+    strs = ["plain", "", " ", "a\\b", "nul\0", "nl\n", "cr\r", "eof\x1a",
+            "tab\t", "é", "日本", " ", "\ud800"]
+    ints = [0, -1, 255, 256, 65535, 65536, 2 ** 31 - 1, 2 ** 31, -2 ** 31,
+            -2 ** 31 - 1, 10 ** 30, -10 ** 30]
+    floats = [0.0, -0.0, 1.5, 1 / 3, 1e300, 1e-300, float("inf")]
+    shared = [["k%d" % i, i] for i in range(300)]
+    return [strs, ints, floats, shared, shared]
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_legacy_fast_paths_are_byte_identical(protocol):
+    import pickle
+    values = make_legacy_values()
+    expected = io.BytesIO()
+    pickle._Pickler(expected, protocol).dump(values)
+    expected = expected.getvalue()
+    assert dumps_py(values, protocol) == expected
+    assert dumps_py(values, protocol, GenericPickler) == expected
+    loaded = my_pickle._loads(expected)
+    assert loaded == values
+    assert loaded[3] is loaded[4]
+
+
+def test_legacy_opcodes_load_like_pickle():
+    import pickle
+    # 手写的协议 0 数据：INT 的布尔与进制写法、不带 L 的 LONG、PUT 与 GET
+    data = (b"(I01\nI00\nI0x10\nI-7\nL5\nL-12L\nF2.5\nF-inf\n"
+            b"Va\\u000ab\\\\c\np3\ng3\n(lp10\ng10\nt.")
+    assert my_pickle._loads(data) == pickle._loads(data)
+    for bad in (b"g4\n.", b"I010\n.", b"Va\\u12\n."):
+        with pytest.raises(Exception) as expected:
+            pickle._loads(bad)
+        with pytest.raises(type(expected.value)):
+            my_pickle._loads(bad)
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_checksum_round_trip(protocol):
+    import pickle
+    obj = make_multi_frame_object() + [make_log_records(200), "é" * 100000]
+    data = dumps_py(obj, protocol, checksum=True)
+    assert my_pickle._loads(data) == obj
+    my_pickle.verify(io.BytesIO(data))
+    assert dumps_py(obj, protocol, checksum=True, iterative=True) == data
+    f = io.BytesIO()
+    my_pickle._Pickler(f, protocol, checksum=True).dump_iter(iter(obj))
+    my_pickle.verify(io.BytesIO(f.getvalue()))
+    if protocol < 4:
+        # 无帧协议：原样输出加尾部校验和，标准 unpickler 仍可读取
+        assert data[:-13] == dumps_py(obj, protocol)
+        assert pickle.loads(data) == obj
+    else:
+        # 多个 pickle 连续写入同一文件时逐个校验、逐个读取
+        f = io.BytesIO(data + data)
+        my_pickle.verify(f)
+        my_pickle.verify(f)
+        assert f.read() == b""
+        f.seek(0)
+        unpickler = my_pickle._Unpickler(f)
+        assert unpickler.load() == obj and unpickler.load() == obj
+
+
+@pytest.mark.parametrize("protocol", [2, 4, 5])
+def test_checksum_rejects_corruption(protocol):
+    obj = [list(range(i, i + 1000)) for i in range(300)]
+    data = dumps_py(obj, protocol, checksum=True)
+    for pos in (len(data) // 3, len(data) - 20):
+        bad = bytearray(data)
+        bad[pos] ^= 0x40
+        with pytest.raises(my_pickle.UnpicklingError):
+            my_pickle.verify(io.BytesIO(bytes(bad)))
+        if protocol >= 4:
+            # 在执行被损坏帧中的任何操作码之前就报错
+            with pytest.raises(my_pickle.UnpicklingError,
+                               match="checksum"):
+                my_pickle._loads(bytes(bad))
+    with pytest.raises(my_pickle.UnpicklingError):
+        my_pickle.verify(io.BytesIO(data[:-100]))
+    with pytest.raises(my_pickle.UnpicklingError, match="checksum"):
+        my_pickle.verify(io.BytesIO(dumps_py(obj, protocol)))
+    with pytest.raises(ValueError):
+        my_pickle._Pickler(io.BytesIO(), 4, checksum=True, compression="zlib")
+
+
+def delta_states(obj):
+    # 复制一份状态，比较时记录实例的属性与槽
+    if isinstance(obj, list):
+        return [delta_states(x) for x in obj]
+    if isinstance(obj, dict):
+        return {k: delta_states(v) for k, v in obj.items()}
+    if isinstance(obj, (Record, MixedRow)):
+        state = dict(getattr(obj, "__dict__", {}))
+        for name in ("id", "_SlottedRow__secret", "tags"):
+            if hasattr(obj, name):
+                state[name] = getattr(obj, name)
+        return type(obj).__name__, delta_states(state)
+    if isinstance(obj, tuple):
+        return tuple(map(delta_states, obj))
+    if isinstance(obj, (set, bytearray)):
+        return type(obj)(obj)
+    return obj
+
+
+@pytest.mark.parametrize("protocol", [2, 3, 4, 5])
+@pytest.mark.parametrize("iterative", [False, True])
+def test_delta_pickler_round_trip(protocol, iterative):
+    f = io.BytesIO()
+    pickler = my_pickle.DeltaPickler(f, protocol, iterative=iterative)
+    shared = ["shared"]
+    graph = {"rows": [Record("r%d" % i, i) for i in range(2000)],
+             "mixed": [MixedRow(i) for i in range(6)],
+             "tags": {"a", "b"}, "pair": (shared, shared),
+             "blob": bytearray(b"abc")}
+    graph["index"] = {x.name: x for x in graph["rows"]}
+    graph["self"] = graph
+    expected = []
+    sizes = []
+
+    def checkpoint():
+        start = f.tell()
+        pickler.dump(graph)
+        sizes.append(f.tell() - start)
+        expected.append(delta_states(
+            {k: v for k, v in graph.items() if k != "self"}))
+
+    checkpoint()
+    checkpoint()
+    graph["rows"][7].value = "changed"
+    checkpoint()
+    graph["rows"].append(Record("new", graph["rows"][0]))
+    graph["tags"].add("c")
+    checkpoint()
+    # 中间删除、插入和替换只写入改动的片段
+    del graph["rows"][500]
+    graph["rows"].insert(10, graph["rows"][1500])
+    graph["rows"][1200] = Record("replaced", None)
+    checkpoint()
+    del graph["index"]["r3"]
+    graph["index"]["r4"] = graph["rows"][0]
+    checkpoint()
+    del graph["mixed"][1].tags
+    graph["mixed"][0]._SlottedRow__secret = "new secret"
+    graph["mixed"][2].extra = shared
+    shared.append(1)
+    graph["blob"][0] = ord("x")
+    checkpoint()
+    graph["rows"] = graph["rows"][1000:]
+    del graph["tags"]
+    checkpoint()
+    pickler.clear_memo()
+    graph["rows"][0].value = -1
+    checkpoint()
+    # 增量的大小只取决于改动的部分
+    assert sizes[1] < 100 and max(sizes[2:7]) < 300 and sizes[-1] > 10000
+
+    f.seek(0)
+    unpickler = my_pickle.DeltaUnpickler(f)
+    loaded = []
+    for state in expected:
+        loaded.append(unpickler.load())
+        assert delta_states({k: v for k, v in loaded[-1].items()
+                             if k != "self"}) == state
+    assert f.read() == b""
+    # 增量原地更新已加载的对象，clear_memo() 之后重新完整写入
+    assert all(obj is loaded[0] for obj in loaded[:-1])
+    root = loaded[-1]
+    assert root is not loaded[0] and root["self"] is root
+    assert root["pair"][0] is root["pair"][1]
+    assert root["rows"][-1].value.name == "r0"
+    # 两端的 memo 保持一致
+    assert (dict.__len__(unpickler.memo) == dict.__len__(pickler.memo)
+            and len(unpickler.memo) == len(pickler.memo))
+
+
+@pytest.mark.parametrize("protocol", [2, 4])
+def test_delta_pickler_states_and_forgetting(protocol):
+    f = io.BytesIO()
+    pickler = my_pickle.DeltaPickler(f, protocol)
+    graph = {"rows": [], "index": {}}
+    expected = []
+    for step in range(20):
+        rows = graph["rows"]
+        rows.append([step, "v%d" % step])
+        graph["index"]["k%d" % step] = rows[-1]
+        if step % 4 == 3:
+            # 丢弃的旧对象只剩 memo 引用时，下一次 dump() 会遗忘它们
+            graph["rows"] = rows[-2:]
+            graph["index"] = {"k%d" % step: rows[-1]}
+        pickler.dump(graph)
+        expected.append(delta_states(graph))
+        del rows
+    # expected 中的副本仍引用那些 str
+    live = [x for i, x in dict.values(pickler.memo) if type(x) is not str]
+    assert len(live) < 15 and len(pickler.memo) > 60
+    f.seek(0)
+    unpickler = my_pickle.DeltaUnpickler(f)
+    for state in expected:
+        obj = unpickler.load()
+        assert delta_states(obj) == state
+    assert obj["index"]["k19"] is obj["rows"][-1]
+    assert dict.__len__(unpickler.memo) == dict.__len__(pickler.memo)
+
+
+def test_delta_pickler_arguments():
+    with pytest.raises(ValueError):
+        my_pickle.DeltaPickler(io.BytesIO(), 1)
+    with pytest.raises(ValueError):
+        my_pickle.DeltaPickler(io.BytesIO(), 4, minimal_memo=True)
+    with pytest.raises(ValueError):
+        my_pickle.DeltaPickler(io.BytesIO(), 4, compact_records=True)
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_background_io_is_byte_identical(protocol):
+    from array import array
+    obj = make_multi_frame_object() + [b"x" * 300000, "é" * 100000]
+    plain = len(obj)
+    if protocol >= 5 and my_pickle._HAVE_PICKLE_BUFFER:
+        # 写线程稍后才写出的带内缓冲区载荷
+        obj += [my_pickle.PickleBuffer(bytearray(1 << 20)),
+                my_pickle.PickleBuffer(bytes(1 << 20)),
+                array("d", range(200000)), memoryview(bytes(1 << 20))]
+    options = [{}, {"checksum": True}]
+    if protocol >= 4:
+        options.append({"compression": "zlib"})
+    for kwargs in options:
+        data = dumps_py(obj, protocol, **kwargs)
+        f = io.BytesIO()
+        p = my_pickle._Pickler(f, protocol, background_io=True, **kwargs)
+        p.dump(obj)
+        p.clear_memo()
+        p.dump(obj)
+        assert f.getvalue() == data + data
+        # 帧缓冲区池不超过队列深度加一
+        pool = p.framer._frame_pool
+        assert len(pool) <= my_pickle._BACKGROUND_QUEUE_DEPTH + 1
+    assert my_pickle._loads(f.getvalue())[:plain] == obj[:plain]
+
+
+def test_background_io_propagates_write_errors():
+    import threading
+
+    class FailingFile(io.BytesIO):
+        writes = 0
+
+        def write(self, data):
+            self.writes += 1
+            if self.writes == 3:
+                raise OSError("disk full")
+            return super().write(data)
+
+    obj = [list(range(i, i + 1000)) for i in range(300)]
+    threads = set(threading.enumerate())
+    p = my_pickle._Pickler(FailingFile(), 4, background_io=True)
+    with pytest.raises(OSError, match="disk full"):
+        p.dump(obj)
+    # 出错后写线程已退出，下一次 dump 正常进行
+    assert set(threading.enumerate()) <= threads
+    f = io.BytesIO()
+    p = my_pickle._Pickler(f, 4, background_io=True)
+    p.dump(obj)
+    assert my_pickle._loads(f.getvalue()) == obj
+    with pytest.raises(ValueError):
+        my_pickle._Pickler(io.BytesIO(), 4, background_io=True,
+                           write_buffer_size=0)
+
+
+@pytest.mark.parametrize("protocol", range(0, 6))
+def test_dumps_into_and_dump_to_path(tmp_path, protocol):
+    import mmap
+    obj = make_multi_frame_object() + ["é" * 100000]
+    data = dumps_py(obj, protocol)
+    # bytearray 不够大时自动扩展
+    buf = bytearray(b"head")
+    assert my_pickle.dumps_into(obj, buf, 4, protocol) == len(data)
+    assert buf == b"head" + data
+    buf = bytearray(len(data) + 10)
+    assert my_pickle.dumps_into(obj, buf, 3, protocol) == len(data)
+    assert buf[3:3 + len(data)] == data and buf[-7:] == bytes(7)
+    m = mmap.mmap(-1, len(data) + 1)
+    assert my_pickle.dumps_into(obj, m, 1, protocol) == len(data)
+    assert m[1:] == data
+    m.close()
+    path = tmp_path / "obj.pickle"
+    assert my_pickle.dump_to_path(obj, path, protocol) == len(data)
+    assert path.read_bytes() == data
+
+
+def test_dumps_into_fixed_size_buffers():
+    obj = [list(range(i, i + 100)) for i in range(1000)]
+    n = len(dumps_py(obj, 5))
+    buf = bytearray(n + 10)
+    with pytest.raises(ValueError, match="does not fit"):
+        my_pickle.dumps_into(obj, memoryview(buf), 11, 5)
+    # 出错后不再持有缓冲区的视图
+    buf.append(0)
+    view = memoryview(bytearray(8 * n)).cast("d")
+    assert my_pickle.dumps_into(obj, view, n, 5) == n
+    assert my_pickle._loads(view.cast("B")[n:2 * n]) == obj
+    with pytest.raises(TypeError):
+        my_pickle.dumps_into(obj, bytes(2 * n))
+    with pytest.raises(ValueError):
+        my_pickle.dumps_into(obj, bytearray(10), 11)